@@ -0,0 +1,28 @@
+"""Add composite index on tweets (timestamp, id) for keyset pagination
+
+Revision ID: 7c1e4a2b9d30
+Revises: 56698c0a138d
+Create Date: 2026-10-16 10:12:31.418207
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "7c1e4a2b9d30"
+down_revision: Union[str, None] = "56698c0a138d"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Индекс обслуживает ORDER BY timestamp DESC, id DESC и условие (timestamp, id) < (:ts, :id)
+    op.create_index("ix_tweets_timestamp_id", "tweets", ["timestamp", "id"])
+
+
+def downgrade() -> None:
+    op.drop_index("ix_tweets_timestamp_id", table_name="tweets")
@@ -0,0 +1,55 @@
+"""Add timelines table for fan-out-on-write home feeds
+
+Revision ID: a3f5d8e1c247
+Revises: 7c1e4a2b9d30
+Create Date: 2026-10-16 11:04:52.730114
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "a3f5d8e1c247"
+down_revision: Union[str, None] = "7c1e4a2b9d30"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "timelines",
+        sa.Column("user_id", sa.Integer(), nullable=False),
+        sa.Column("tweet_id", sa.Integer(), nullable=False),
+        sa.Column("author_id", sa.Integer(), nullable=False),
+        sa.Column("timestamp", sa.DateTime(timezone=True), nullable=False),
+        sa.ForeignKeyConstraint(["user_id"], ["users.id"], ondelete="CASCADE"),
+        sa.ForeignKeyConstraint(["tweet_id"], ["tweets.id"], ondelete="CASCADE"),
+        sa.ForeignKeyConstraint(["author_id"], ["users.id"], ondelete="CASCADE"),
+        sa.PrimaryKeyConstraint("user_id", "tweet_id"),
+    )
+    op.create_index(
+        "ix_timelines_user_timestamp_tweet",
+        "timelines",
+        ["user_id", "timestamp", "tweet_id"],
+    )
+
+    # Заполняем ленты существующими твитами: автору и всем его подписчикам
+    op.execute(
+        """
+        INSERT INTO timelines (user_id, tweet_id, author_id, timestamp)
+        SELECT f.follower_id, t.id, t.author_id, t.timestamp
+        FROM tweets t JOIN followers f ON f.account_id = t.author_id
+        UNION
+        SELECT t.author_id, t.id, t.author_id, t.timestamp
+        FROM tweets t
+        """
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_timelines_user_timestamp_tweet", table_name="timelines")
+    op.drop_table("timelines")
@@ -0,0 +1,35 @@
+"""Add image metadata columns to media
+
+Revision ID: a6c3e8f1b925
+Revises: f3a91c5e7d24
+Create Date: 2026-10-16 18:12:44.105327
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "a6c3e8f1b925"
+down_revision: Union[str, None] = "f3a91c5e7d24"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column("media", sa.Column("mime_type", sa.String(length=32), nullable=True))
+    op.add_column("media", sa.Column("width", sa.Integer(), nullable=True))
+    op.add_column("media", sa.Column("height", sa.Integer(), nullable=True))
+    op.add_column("media", sa.Column("size", sa.Integer(), nullable=True))
+    # Метаданные существующих записей заполняет отдельный шаг
+    # (python -m application.media_migration); до этого тип определяется по началу файла
+
+
+def downgrade() -> None:
+    op.drop_column("media", "size")
+    op.drop_column("media", "height")
+    op.drop_column("media", "width")
+    op.drop_column("media", "mime_type")
@@ -0,0 +1,42 @@
+"""Add tweets.fanned_out and indexes for hybrid fan-out timelines
+
+Revision ID: b81c0e6f4a92
+Revises: a3f5d8e1c247
+Create Date: 2026-10-16 12:21:09.284461
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "b81c0e6f4a92"
+down_revision: Union[str, None] = "a3f5d8e1c247"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Все существующие твиты уже разосланы в ленты миграцией a3f5d8e1c247
+    op.add_column(
+        "tweets",
+        sa.Column(
+            "fanned_out", sa.Boolean(), nullable=False, server_default=sa.text("true")
+        ),
+    )
+    op.create_index(
+        "ix_tweets_author_pull",
+        "tweets",
+        ["author_id", "timestamp", "id"],
+        postgresql_where=sa.text("NOT fanned_out"),
+    )
+    op.create_index("ix_followers_follower_id", "followers", ["follower_id"])
+
+
+def downgrade() -> None:
+    op.drop_index("ix_followers_follower_id", table_name="followers")
+    op.drop_index("ix_tweets_author_pull", table_name="tweets")
+    op.drop_column("tweets", "fanned_out")
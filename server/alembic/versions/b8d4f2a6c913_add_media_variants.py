@@ -0,0 +1,41 @@
+"""Add media_variants table for resized image variants
+
+Revision ID: b8d4f2a6c913
+Revises: a6c3e8f1b925
+Create Date: 2026-10-16 19:02:17.553081
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "b8d4f2a6c913"
+down_revision: Union[str, None] = "a6c3e8f1b925"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "media_variants",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("media_id", sa.Integer(), nullable=False),
+        sa.Column("width", sa.Integer(), nullable=False),
+        sa.Column("height", sa.Integer(), nullable=False),
+        sa.Column("blob_key", sa.String(length=64), nullable=False),
+        sa.Column("mime_type", sa.String(length=32), nullable=False),
+        sa.Column("size", sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(["media_id"], ["media.id"], ondelete="CASCADE"),
+        sa.PrimaryKeyConstraint("id"),
+        sa.UniqueConstraint(
+            "media_id", "width", name="uq_media_variants_media_id_width"
+        ),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("media_variants")
@@ -0,0 +1,41 @@
+"""Add denormalized tweets.like_count and likes (tweet_id, id) index
+
+Revision ID: c4d27b9e8f15
+Revises: b81c0e6f4a92
+Create Date: 2026-10-16 13:37:44.905318
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "c4d27b9e8f15"
+down_revision: Union[str, None] = "b81c0e6f4a92"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column(
+        "tweets",
+        sa.Column("like_count", sa.Integer(), nullable=False, server_default="0"),
+    )
+    # Заполняем счетчик по существующим лайкам
+    op.execute(
+        """
+        UPDATE tweets
+        SET like_count = counts.total
+        FROM (SELECT tweet_id, count(*) AS total FROM likes GROUP BY tweet_id) AS counts
+        WHERE tweets.id = counts.tweet_id
+        """
+    )
+    op.create_index("ix_likes_tweet_id_id", "likes", ["tweet_id", "id"])
+
+
+def downgrade() -> None:
+    op.drop_index("ix_likes_tweet_id_id", table_name="likes")
+    op.drop_column("tweets", "like_count")
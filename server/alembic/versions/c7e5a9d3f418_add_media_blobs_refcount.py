@@ -0,0 +1,106 @@
+"""Add media_blobs with reference counting of media content
+
+Revision ID: c7e5a9d3f418
+Revises: b8d4f2a6c913
+Create Date: 2026-10-16 20:14:52.640918
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "c7e5a9d3f418"
+down_revision: Union[str, None] = "b8d4f2a6c913"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+REFERENCING_TABLES = ("media", "media_variants")
+
+# SQL триггеров на момент этой ревизии (копия, а не импорт из application.models,
+# чтобы последующие изменения моделей не меняли уже примененную миграцию)
+MEDIA_BLOB_REF_FUNCTION = """
+CREATE OR REPLACE FUNCTION media_blob_ref() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        INSERT INTO media_blobs (blob_key, ref_count) VALUES (NEW.blob_key, 1)
+        ON CONFLICT (blob_key) DO UPDATE SET ref_count = media_blobs.ref_count + 1;
+    END IF;
+    IF TG_OP IN ('DELETE', 'UPDATE') THEN
+        UPDATE media_blobs SET ref_count = ref_count - 1 WHERE blob_key = OLD.blob_key;
+    END IF;
+    IF TG_OP = 'DELETE' THEN
+        RETURN OLD;
+    END IF;
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql
+"""
+
+MEDIA_BLOB_REF_TRIGGERS = (
+    """
+    CREATE TRIGGER {table}_blob_ref_insert
+        BEFORE INSERT ON {table}
+        FOR EACH ROW EXECUTE FUNCTION media_blob_ref()
+    """,
+    """
+    CREATE TRIGGER {table}_blob_ref_update
+        BEFORE UPDATE OF blob_key ON {table}
+        FOR EACH ROW WHEN (OLD.blob_key IS DISTINCT FROM NEW.blob_key)
+        EXECUTE FUNCTION media_blob_ref()
+    """,
+    """
+    CREATE TRIGGER {table}_blob_ref_delete
+        AFTER DELETE ON {table}
+        FOR EACH ROW EXECUTE FUNCTION media_blob_ref()
+    """,
+)
+
+
+def upgrade() -> None:
+    op.create_table(
+        "media_blobs",
+        sa.Column("blob_key", sa.String(length=64), nullable=False),
+        sa.Column("ref_count", sa.Integer(), server_default=sa.text("0"), nullable=False),
+        sa.PrimaryKeyConstraint("blob_key"),
+    )
+    op.create_index(
+        "ix_media_blobs_unreferenced",
+        "media_blobs",
+        ["blob_key"],
+        postgresql_where=sa.text("ref_count = 0"),
+    )
+    # Счетчики существующих блобов
+    op.execute(
+        """
+        INSERT INTO media_blobs (blob_key, ref_count)
+        SELECT blob_key, count(*)
+        FROM (
+            SELECT blob_key FROM media
+            UNION ALL
+            SELECT blob_key FROM media_variants
+        ) AS refs
+        GROUP BY blob_key
+        """
+    )
+    for table in REFERENCING_TABLES:
+        op.create_foreign_key(
+            f"{table}_blob_key_fkey", table, "media_blobs", ["blob_key"], ["blob_key"]
+        )
+    op.execute(MEDIA_BLOB_REF_FUNCTION)
+    for table in REFERENCING_TABLES:
+        for statement in MEDIA_BLOB_REF_TRIGGERS:
+            op.execute(statement.format(table=table))
+
+
+def downgrade() -> None:
+    for table in REFERENCING_TABLES:
+        for suffix in ("insert", "update", "delete"):
+            op.execute(f"DROP TRIGGER {table}_blob_ref_{suffix} ON {table}")
+        op.drop_constraint(f"{table}_blob_key_fkey", table, type_="foreignkey")
+    op.execute("DROP FUNCTION media_blob_ref()")
+    op.drop_index("ix_media_blobs_unreferenced", table_name="media_blobs")
+    op.drop_table("media_blobs")
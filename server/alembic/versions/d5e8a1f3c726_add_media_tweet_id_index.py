@@ -0,0 +1,27 @@
+"""Add media (tweet_id, id) index
+
+Revision ID: d5e8a1f3c726
+Revises: c4d27b9e8f15
+Create Date: 2026-10-16 15:12:08.417529
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = "d5e8a1f3c726"
+down_revision: Union[str, None] = "c4d27b9e8f15"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Вложения собираются коррелированным подзапросом по каждому твиту страницы
+    op.create_index("ix_media_tweet_id_id", "media", ["tweet_id", "id"])
+
+
+def downgrade() -> None:
+    op.drop_index("ix_media_tweet_id_id", table_name="media")
@@ -0,0 +1,43 @@
+"""Add media.created_at for garbage collection of unattached uploads
+
+Revision ID: d9a2b6e4c157
+Revises: c7e5a9d3f418
+Create Date: 2026-10-16 21:03:28.774512
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "d9a2b6e4c157"
+down_revision: Union[str, None] = "c7e5a9d3f418"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Существующие записи получают время миграции: их возраст отсчитывается с обновления
+    op.add_column(
+        "media",
+        sa.Column(
+            "created_at",
+            sa.DateTime(timezone=True),
+            server_default=sa.text("now()"),
+            nullable=False,
+        ),
+    )
+    op.create_index(
+        "ix_media_orphans_created_at",
+        "media",
+        ["created_at"],
+        postgresql_where=sa.text("tweet_id IS NULL"),
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_media_orphans_created_at", table_name="media")
+    op.drop_column("media", "created_at")
@@ -0,0 +1,32 @@
+"""Add media.uploader_id so only the uploader can attach media
+
+Revision ID: e4f8c1a7b390
+Revises: d9a2b6e4c157
+Create Date: 2026-10-16 21:41:09.318264
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "e4f8c1a7b390"
+down_revision: Union[str, None] = "d9a2b6e4c157"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Загрузчик существующих записей неизвестен; неприкрепленные из них удалит сборщик мусора
+    op.add_column("media", sa.Column("uploader_id", sa.Integer(), nullable=True))
+    op.create_foreign_key(
+        "media_uploader_id_fkey", "media", "users", ["uploader_id"], ["id"], ondelete="CASCADE"
+    )
+
+
+def downgrade() -> None:
+    op.drop_constraint("media_uploader_id_fkey", "media", type_="foreignkey")
+    op.drop_column("media", "uploader_id")
@@ -0,0 +1,29 @@
+"""Add media.blob_key for the media blob store
+
+Revision ID: e7b2c9d4a618
+Revises: d5e8a1f3c726
+Create Date: 2026-10-16 16:04:51.220734
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "e7b2c9d4a618"
+down_revision: Union[str, None] = "d5e8a1f3c726"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Пока содержимое не перенесено (application.media_migration), ключ может быть пустым
+    op.add_column("media", sa.Column("blob_key", sa.String(length=64), nullable=True))
+    op.alter_column("media", "file_body", existing_type=sa.LargeBinary(), nullable=True)
+
+
+def downgrade() -> None:
+    op.drop_column("media", "blob_key")
@@ -0,0 +1,40 @@
+"""Move remaining media.file_body to the blob store and drop the column
+
+Revision ID: f3a91c5e7d24
+Revises: e7b2c9d4a618
+Create Date: 2026-10-16 16:05:37.918402
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "f3a91c5e7d24"
+down_revision: Union[str, None] = "e7b2c9d4a618"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Содержимое переносит отдельный шаг (python -m application.media_migration),
+    # а не эта ревизия: ее поведение не должно зависеть от кода приложения и хранилища
+    not_moved = op.get_bind().scalar(
+        sa.text("SELECT count(*) FROM media WHERE blob_key IS NULL")
+    )
+    if not_moved:
+        raise RuntimeError(
+            f"Содержимое {not_moved} медиафайлов еще не перенесено в хранилище блобов: "
+            "выполните python -m application.media_migration и повторите alembic upgrade"
+        )
+    op.alter_column("media", "blob_key", existing_type=sa.String(length=64), nullable=False)
+    op.drop_column("media", "file_body")
+
+
+def downgrade() -> None:
+    # Содержимое возвращает python -m application.media_migration --restore
+    op.add_column("media", sa.Column("file_body", sa.LargeBinary(), nullable=True))
+    op.alter_column("media", "blob_key", existing_type=sa.String(length=64), nullable=True)
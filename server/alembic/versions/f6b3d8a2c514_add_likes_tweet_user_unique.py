@@ -0,0 +1,45 @@
+"""Add unique (tweet_id, user_id) constraint to likes
+
+Revision ID: f6b3d8a2c514
+Revises: e4f8c1a7b390
+Create Date: 2026-10-16 18:12:05.417730
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = "f6b3d8a2c514"
+down_revision: Union[str, None] = "e4f8c1a7b390"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Удаляем повторные лайки, оставляя самый ранний
+    op.execute(
+        """
+        DELETE FROM likes
+        USING likes AS earlier
+        WHERE likes.tweet_id = earlier.tweet_id
+          AND likes.user_id = earlier.user_id
+          AND likes.id > earlier.id
+        """
+    )
+    # Пересчитываем счетчик: повторные лайки в нем тоже учитывались
+    op.execute(
+        """
+        UPDATE tweets
+        SET like_count = (SELECT count(*) FROM likes WHERE likes.tweet_id = tweets.id)
+        """
+    )
+    op.create_unique_constraint(
+        "uq_likes_tweet_id_user_id", "likes", ["tweet_id", "user_id"]
+    )
+
+
+def downgrade() -> None:
+    op.drop_constraint("uq_likes_tweet_id_user_id", "likes", type_="unique")
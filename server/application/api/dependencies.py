@@ -1,18 +1,38 @@
 import logging
-from typing import Union
+from datetime import datetime
+from typing import List, Dict, Any, Optional, Tuple
 
 from fastapi import Header, HTTPException, Depends
 
+from application.cache import api_key_cache, UserIdentity
 from application.crud import BaseDAO
-from application.database import AsyncSessionApp
-from application.models import Users, Tweets, Media, Like, Followers
-from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.orm import selectinload
-from starlette.responses import JSONResponse
+from application.database import AsyncSessionApp, REPLICA_READ, mark_write, track_user
+from application.models import Users, Tweets, Media, MediaBlob, Like, Followers
+from application.storage import MediaStorage, StagedBlob
+from application.timeline import TimelineDAO
+from application.unit_of_work import UnitOfWork
+from sqlalchemy import (
+    Integer,
+    any_,
+    bindparam,
+    delete,
+    exists,
+    func,
+    literal,
+    select,
+    true,
+    union_all,
+    update,
+)
+from sqlalchemy.dialects.postgresql import ARRAY, insert
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
 
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# SQLSTATE нарушения внешнего ключа в PostgreSQL
+FOREIGN_KEY_VIOLATION = "23503"
+
 
 # Назначение текущей сессии
 async def get_current_session() -> AsyncSession:
@@ -24,81 +44,623 @@ async def get_current_session() -> AsyncSession:
 
     :return: Асинхронная сессия базы данных (AsyncSession).
     """
-    logger.info("Создание новой сессии Dependencies")
+    logger.debug("Создание новой сессии Dependencies")
     async with AsyncSessionApp() as current_session:
         try:
-            logger.info("Передача сессии session: %s", current_session)
+            logger.debug("Передача сессии session: %s", current_session)
             yield current_session
         finally:
-            logger.info("Закрывается сессия session: %s", current_session)
+            logger.debug("Закрывается сессия session: %s", current_session)
             await current_session.close()
-            logger.info("Закрытие сессии Dependencies")
+            logger.debug("Закрытие сессии Dependencies")
 
 
-async def get_client_token(
-    session: AsyncSession = Depends(get_current_session), api_key: str = Header(...)
-):
+# Фабрика сессий фоновых задач
+def get_session_factory() -> async_sessionmaker:
     """
-    Извлекает API ключ из заголовка и проверяет его на валидность.
+    Возвращает фабрику сессий для фоновых задач маршрутов.
 
-    :param session:
-    :param api_key: API ключ пользователя
-    :return: API ключ, если он валиден
+    Фоновые задачи выполняются после ответа, когда сессия запроса уже закрыта,
+    поэтому задача открывает собственную сессию из этой фабрики.
+
+    :return: Фабрика асинхронных сессий (async_sessionmaker).
     """
-    user = await UserDAO.find_one_or_none(api_key=api_key, session=session)
-    logger.info("Пользователь найден: %s", user)
-    if user is None:
-        raise HTTPException(
-            status_code=403, detail="Доступ запрещен: неверный API ключ"
-        )
-    logger.info("Возвращен ключ api_key: %s", api_key)
-    return api_key
+    return AsyncSessionApp
+
+
+# Единица работы запроса
+async def get_unit_of_work(
+    session: AsyncSession = Depends(get_current_session),
+) -> UnitOfWork:
+    """
+    Открывает единицу работы запроса: одну транзакцию на сессии запроса.
+
+    Маршрут передает uow.session в методы DAO, которые не фиксируют транзакцию
+    сами. Транзакция фиксируется один раз после успешного выполнения маршрута
+    (до отправки ответа) и откатывается, если маршрут выбросил исключение,
+    в том числе HTTPException. Сброс кэшей маршрут регистрирует через
+    uow.after_commit, чтобы он выполнялся только после фиксации.
+
+    :param session: Асинхронная сессия базы данных (AsyncSession).
+    :return: Единица работы (UnitOfWork).
+    """
+    async with UnitOfWork(session) as uow:
+        yield uow
 
 
 # Зависимость для получения текущего пользователя
 async def get_current_user(
-    session: AsyncSession = Depends(get_current_session),
-    api_key: str = Depends(get_client_token),
-) -> Union[Users, JSONResponse]:
+    session: AsyncSession = Depends(get_current_session), api_key: str = Header(...)
+) -> UserIdentity:
     """
-    Извлекает текущего пользователя на основе API ключа.
+    Аутентифицирует запрос по API ключу из заголовка и возвращает текущего пользователя.
 
-    Эта функция использует переданную сессию и API ключ для поиска
-    пользователя в базе данных. Если пользователь не найден, возвращается
-    JSONResponse с кодом 404.
+    Соответствие ключа пользователю хранится в кэше api_key_cache, поэтому
+    в большинстве запросов аутентификация не обращается к базе данных.
+    При промахе выполняется один запрос за идентификатором и именем пользователя;
+    подписки и подписчики не загружаются — маршруты, которым они нужны, читают их сами.
+    Ключ проверяется на основном сервере, а не на реплике, чтобы ключ только что
+    добавленного пользователя не был запомнен как неверный. Сессия запроса
+    связывается с пользователем для окна read-your-writes (см. database.track_user).
 
-    :param session: Асинхронная сессия базы данных (AsyncSession),
-                    используемая для выполнения запросов.
+    :param session: Асинхронная сессия базы данных (AsyncSession).
     :param api_key: API ключ пользователя, получаемый из заголовка.
-    :return: Объект пользователя (Users), если он найден, или
-             JSONResponse с ошибкой 404, если пользователь не найден.
+    :return: UserIdentity с идентификатором и именем пользователя.
+    :raises HTTPException: 403, если API ключ неверный.
     """
-    current_user = await UserDAO.find_one_or_none(
-        session=session,
-        options=[selectinload(Users.authors), selectinload(Users.followers)],
-        api_key=api_key,
-    )
-    if not current_user:
+    found, user = api_key_cache.get(api_key)
+    if not found:
+        user = await UserDAO.find_identity_by_api_key(session=session, api_key=api_key)
+        api_key_cache.set(api_key, user)
+    if user is None:
         logger.warning("Пользователь с API ключом %s не найден.", api_key)
-        return JSONResponse(status_code=404, content={"error": "User not found"})
-    return current_user
+        raise HTTPException(
+            status_code=403, detail="Доступ запрещен: неверный API ключ"
+        )
+    track_user(session, user.id)
+    return user
 
 
 class UserDAO(BaseDAO):
     model = Users
 
+    # Запрос аутентификации выполняется на каждый промах api_key_cache,
+    # поэтому строится один раз; ключ передается параметром при выполнении
+    identity_by_api_key = select(Users.id, Users.name).where(
+        Users.api_key == bindparam("api_key")
+    )
+
+    @classmethod
+    async def find_identity_by_api_key(
+        cls, session: AsyncSession, api_key: str
+    ) -> Optional[UserIdentity]:
+        """
+        Асинхронно находит идентификатор и имя пользователя по API ключу, без загрузки связей.
+
+        :param session: Асинхронная сессия SQLAlchemy.
+        :param api_key: API ключ пользователя.
+        :return: UserIdentity или None, если ключ не найден.
+        """
+        result = await session.execute(cls.identity_by_api_key, {"api_key": api_key})
+        row = result.one_or_none()
+        return UserIdentity(id=row.id, name=row.name) if row is not None else None
+
+    @classmethod
+    async def find_profile_rows(
+        cls, session: AsyncSession, user_id: int
+    ) -> List[Tuple[str, int, str]]:
+        """
+        Асинхронно выбирает профиль пользователя одним Core-запросом без создания объектов ORM.
+
+        Возвращает строки (kind, id, name): одну строку "user" с самим пользователем,
+        строки "follower" с его подписчиками и строки "following" с его подписками.
+        Если пользователь не найден, список пуст.
+
+        :param session: Асинхронная сессия SQLAlchemy.
+        :param user_id: Идентификатор пользователя.
+        :return: Список строк профиля (см. serializers.user_profile_rows_to_bytes).
+        """
+        user_query = select(literal("user"), Users.id, Users.name).where(
+            Users.id == user_id
+        )
+        followers_query = (
+            select(literal("follower"), Users.id, Users.name)
+            .join(Followers, Followers.follower_id == Users.id)
+            .where(Followers.account_id == user_id)
+        )
+        following_query = (
+            select(literal("following"), Users.id, Users.name)
+            .join(Followers, Followers.account_id == Users.id)
+            .where(Followers.follower_id == user_id)
+        )
+
+        result = await session.execute(
+            union_all(user_query, followers_query, following_query),
+            bind_arguments=REPLICA_READ,
+        )
+        return [tuple(row) for row in result]
+
+
+class MediaUnavailableError(ValueError):
+    """Медиафайлы нельзя прикрепить к твиту: их нет, они уже прикреплены или загружены другим пользователем."""
+
+    def __init__(self, media_ids: List[int]):
+        super().__init__(f"Медиафайлы недоступны: {media_ids}")
+        self.media_ids = media_ids
+
+
+class TweetNotFoundError(LookupError):
+    """Твита с таким идентификатором нет."""
+
+    def __init__(self, tweet_id: int):
+        super().__init__(f"Твит {tweet_id} не найден")
+        self.tweet_id = tweet_id
+
+
+class UserNotFoundError(LookupError):
+    """Пользователя с таким идентификатором нет."""
+
+    def __init__(self, user_id: int):
+        super().__init__(f"Пользователь {user_id} не найден")
+        self.user_id = user_id
+
 
 class TweetDAO(BaseDAO):
     model = Tweets
 
+    @classmethod
+    async def add_with_media(
+        cls, session: AsyncSession, media_ids: List[int], **values
+    ) -> Tweets:
+        """
+        Асинхронно создает твит и прикрепляет к нему медиафайлы.
+
+        Медиафайлы прикрепляются одним запросом
+        `UPDATE media ... WHERE id = ANY(:ids) AND tweet_id IS NULL AND uploader_id = :author_id`,
+        который возвращает id прикрепленных. Если прикрепить удалось не все
+        медиафайлы, выбрасывается исключение, и единица работы откатывает
+        транзакцию вместе с твитом.
+
+        :param session: Асинхронная сессия SQLAlchemy.
+        :param media_ids: Идентификаторы медиафайлов, загруженных автором твита.
+        :param values: Значения полей твита (author_id обязателен).
+        :return: Созданный твит.
+        :raises MediaUnavailableError: Если часть медиафайлов не найдена, уже прикреплена
+            к другому твиту или загружена другим пользователем.
+        """
+        media_ids = list(dict.fromkeys(media_ids))
+        new_tweet = Tweets(**values)
+        try:
+            session.add(new_tweet)
+            await session.flush()
+            if media_ids:
+                attached = await session.scalars(
+                    update(Media)
+                    .where(
+                        Media.id == any_(bindparam("media_ids", media_ids, type_=ARRAY(Integer))),
+                        Media.tweet_id.is_(None),
+                        Media.uploader_id == new_tweet.author_id,
+                    )
+                    .values(tweet_id=new_tweet.id)
+                    .returning(Media.id)
+                    .execution_options(synchronize_session=False)
+                )
+                unavailable = set(media_ids) - set(attached)
+                if unavailable:
+                    raise MediaUnavailableError(sorted(unavailable))
+        except (SQLAlchemyError, MediaUnavailableError) as e:
+            logger.error("Ошибка при добавлении твита: %s", e)
+            raise e
+        return new_tweet
+
 
 class MediaDAO(BaseDAO):
     model = Media
 
+    @classmethod
+    async def add_with_blob(
+        cls, session: AsyncSession, staged: StagedBlob, storage: MediaStorage, **values
+    ) -> Media:
+        """
+        Асинхронно создает запись media и сохраняет ее блоб в транзакции единицы работы.
+
+        Вставка строки учитывает ссылку в media_blobs (триггер) и блокирует строку
+        блоба до фиксации, а блоб переносится на место сразу после flush, внутри
+        транзакции. Поэтому одновременное освобождение того же блоба
+        (MediaBlobDAO.release_unreferenced) либо дожидается фиксации и видит ссылку,
+        либо завершается раньше, и тогда файл блоба записывается заново.
+
+        :param session: Асинхронная сессия SQLAlchemy.
+        :param staged: Записанное во временное место содержимое.
+        :param storage: Хранилище медиафайлов.
+        :param values: Остальные значения полей Media.
+        :return: Созданная запись.
+        """
+        media = Media(blob_key=staged.key, **values)
+        try:
+            session.add(media)
+            await session.flush()
+            await storage.commit_staged(staged)
+        except BaseException as e:
+            await storage.discard_staged(staged)
+            logger.error("Ошибка при сохранении медиафайла: %s", e)
+            raise e
+        return media
+
+    @classmethod
+    async def delete_orphans(
+        cls, session: AsyncSession, uploaded_before: datetime, batch_size: int
+    ) -> List[Tuple[int, Optional[int]]]:
+        """
+        Асинхронно удаляет пачку медиафайлов, так и не прикрепленных к твиту.
+
+        Строки, которые в этот момент прикрепляет к твиту другая транзакция,
+        пропускаются (SKIP LOCKED), а условие tweet_id IS NULL проверяется
+        повторно при удалении. Варианты удаляются каскадно, ссылки на блобы
+        уменьшаются триггерами; сами блобы освобождает MediaBlobDAO.release_unreferenced.
+
+        :param session: Асинхронная сессия SQLAlchemy.
+        :param uploaded_before: Удаляются медиафайлы, загруженные раньше этого времени.
+        :param batch_size: Максимальное количество удаляемых медиафайлов.
+        :return: Пары (id, size) удаленных медиафайлов.
+        """
+        orphans = (
+            select(Media.id)
+            .where(Media.tweet_id.is_(None), Media.created_at < uploaded_before)
+            .order_by(Media.created_at)
+            .limit(batch_size)
+            .with_for_update(skip_locked=True)
+        )
+        try:
+            result = await session.execute(
+                delete(Media)
+                .where(Media.id.in_(orphans), Media.tweet_id.is_(None))
+                .returning(Media.id, Media.size)
+            )
+            deleted = [tuple(row) for row in result]
+        except SQLAlchemyError as e:
+            logger.error("Ошибка при удалении неприкрепленных медиафайлов: %s", e)
+            raise e
+        return deleted
+
+
+class MediaBlobDAO(BaseDAO):
+    model = MediaBlob
+
+    @classmethod
+    async def release_unreferenced(
+        cls, session: AsyncSession, storage: MediaStorage, batch_size: int = 100
+    ) -> int:
+        """
+        Асинхронно удаляет блобы, на которые не осталось ссылок, вместе с их файлами.
+
+        Блобы удаляются пачками, каждая в своей единице работы, поэтому метод
+        вызывается вне единицы работы запроса (из фоновой задачи или сборщика мусора).
+        Строки блокируются (SKIP LOCKED) до удаления файлов, поэтому параллельная
+        загрузка того же содержимого ждет завершения пачки и затем записывает файл заново.
+
+        :param session: Асинхронная сессия SQLAlchemy.
+        :param storage: Хранилище медиафайлов.
+        :param batch_size: Количество блобов в пачке.
+        :return: Количество удаленных блобов.
+        """
+        unreferenced = (
+            select(MediaBlob.blob_key)
+            .where(MediaBlob.ref_count <= 0)
+            .limit(batch_size)
+            .with_for_update(skip_locked=True)
+        )
+        stmt = (
+            delete(MediaBlob)
+            .where(MediaBlob.blob_key.in_(unreferenced), MediaBlob.ref_count <= 0)
+            .returning(MediaBlob.blob_key)
+        )
+        released = 0
+        while True:
+            try:
+                async with UnitOfWork(session):
+                    keys = (await session.scalars(stmt)).all()
+                    for key in keys:
+                        await storage.delete(key)
+            except SQLAlchemyError as e:
+                logger.error("Ошибка при освобождении блобов: %s", e)
+                raise e
+            released += len(keys)
+            if len(keys) < batch_size:
+                if released:
+                    logger.info("Освобождено блобов медиафайлов: %s", released)
+                return released
+
+
+def _like_count_update(changed, delta: int):
+    """Возвращает UPDATE счетчика like_count твитов, чьи лайки вернул CTE changed."""
+    return (
+        update(Tweets)
+        .where(Tweets.id.in_(select(changed.c.tweet_id)))
+        .values(like_count=Tweets.like_count + delta)
+        .returning(Tweets.id)
+        .execution_options(synchronize_session=False)
+    )
+
 
 class LikeDAO(BaseDAO):
     model = Like
 
+    # Запросы лайка и его отмены строятся один раз; tweet_id и user_id
+    # передаются параметрами при выполнении (см. add_like, remove_like)
+    add_like_stmt = _like_count_update(
+        insert(Like)
+        .values(tweet_id=bindparam("tweet_id"), user_id=bindparam("user_id"))
+        .on_conflict_do_nothing(constraint="uq_likes_tweet_id_user_id")
+        .returning(Like.tweet_id)
+        .cte("inserted"),
+        1,
+    )
+    remove_like_stmt = _like_count_update(
+        delete(Like)
+        .where(Like.tweet_id == bindparam("tweet_id"), Like.user_id == bindparam("user_id"))
+        .returning(Like.tweet_id)
+        .cte("deleted"),
+        -1,
+    )
+
+    @classmethod
+    async def add_like(cls, session: AsyncSession, tweet_id: int, user_id: int) -> bool:
+        """
+        Асинхронно добавляет лайк и увеличивает счетчик like_count твита одним запросом.
+
+        Лайк вставляется с ON CONFLICT DO NOTHING в CTE, а счетчик увеличивается
+        только если строка действительно вставлена, поэтому повторный запрос
+        ничего не меняет:
+
+            WITH inserted AS (
+                INSERT INTO likes (tweet_id, user_id) VALUES (:tweet_id, :user_id)
+                ON CONFLICT ON CONSTRAINT uq_likes_tweet_id_user_id DO NOTHING
+                RETURNING tweet_id
+            )
+            UPDATE tweets SET like_count = like_count + 1
+            WHERE id IN (SELECT tweet_id FROM inserted) RETURNING id
+
+        :param session: Асинхронная сессия SQLAlchemy.
+        :param tweet_id: Идентификатор твита.
+        :param user_id: Идентификатор пользователя, который ставит лайк.
+        :return: True, если лайк добавлен, False, если он уже был.
+        :raises TweetNotFoundError: Если твита нет (нарушен внешний ключ).
+        """
+        try:
+            added = await session.scalar(
+                cls.add_like_stmt, {"tweet_id": tweet_id, "user_id": user_id}
+            )
+        except IntegrityError as e:
+            if getattr(e.orig, "sqlstate", None) == FOREIGN_KEY_VIOLATION:
+                raise TweetNotFoundError(tweet_id) from e
+            logger.error("Ошибка при добавлении лайка: %s", e)
+            raise e
+        except SQLAlchemyError as e:
+            logger.error("Ошибка при добавлении лайка: %s", e)
+            raise e
+        return added is not None
+
+    @classmethod
+    async def remove_like(cls, session: AsyncSession, tweet_id: int, user_id: int) -> bool:
+        """
+        Асинхронно удаляет лайк и уменьшает счетчик like_count твита одним запросом.
+
+            WITH deleted AS (
+                DELETE FROM likes WHERE tweet_id = :tweet_id AND user_id = :user_id
+                RETURNING tweet_id
+            )
+            UPDATE tweets SET like_count = like_count - 1
+            WHERE id IN (SELECT tweet_id FROM deleted) RETURNING id
+
+        :param session: Асинхронная сессия SQLAlchemy.
+        :param tweet_id: Идентификатор твита.
+        :param user_id: Идентификатор пользователя, который убирает лайк.
+        :return: True, если лайк удален, False, если его не было.
+        """
+        try:
+            removed = await session.scalar(
+                cls.remove_like_stmt, {"tweet_id": tweet_id, "user_id": user_id}
+            )
+        except SQLAlchemyError as e:
+            logger.error("Ошибка при удалении лайка: %s", e)
+            raise e
+        return removed is not None
+
+    @classmethod
+    async def find_likers_sample(
+        cls,
+        session: AsyncSession,
+        tweet_ids: List[int],
+        viewer_id: int,
+        sample_size: int,
+    ) -> Dict[int, List[Dict[str, Any]]]:
+        """
+        Асинхронно возвращает для каждого твита выборку последних лайкнувших пользователей.
+
+        Для каждого твита читается не больше sample_size строк по индексу (tweet_id, id)
+        через LATERAL-подзапрос. Лайк просматривающего пользователя всегда попадает
+        в выборку, чтобы клиент мог показать, что твит им уже лайкнут.
+
+        :param session: Асинхронная сессия SQLAlchemy.
+        :param tweet_ids: Идентификаторы твитов страницы.
+        :param viewer_id: Идентификатор пользователя, который просматривает ленту.
+        :param sample_size: Максимальное количество последних лайков на твит.
+        :return: Словарь {tweet_id: [{"user_id": ..., "name": ...}, ...]}.
+        """
+        samples: Dict[int, List[Dict[str, Any]]] = {}
+        if not tweet_ids:
+            return samples
+
+        page_tweets = (
+            select(Tweets.id.label("tweet_id")).where(Tweets.id.in_(tweet_ids)).subquery()
+        )
+        recent_likes = (
+            select(Like.user_id, Users.name)
+            .join(Users, Users.id == Like.user_id)
+            .where(Like.tweet_id == page_tweets.c.tweet_id)
+            .order_by(Like.id.desc())
+            .limit(sample_size)
+            .lateral()
+        )
+        sample_query = (
+            select(page_tweets.c.tweet_id, recent_likes.c.user_id, recent_likes.c.name)
+            .select_from(page_tweets)
+            .join(recent_likes, true())
+        )
+        viewer_likes_query = (
+            select(Like.tweet_id, Like.user_id, Users.name)
+            .join(Users, Users.id == Like.user_id)
+            .where(Like.user_id == viewer_id, Like.tweet_id.in_(tweet_ids))
+        )
+
+        result = await session.execute(
+            union_all(sample_query, viewer_likes_query), bind_arguments=REPLICA_READ
+        )
+
+        for tweet_id, user_id, name in result:
+            likers = samples.setdefault(tweet_id, [])
+            if all(liker["user_id"] != user_id for liker in likers):
+                likers.append({"user_id": user_id, "name": name})
+        return samples
+
+
+def _follow_stmt():
+    """Возвращает запрос FollowersDAO.follow со связанными параметрами."""
+    account_id = bindparam("account_id", type_=Integer)
+    follower_id = bindparam("follower_id", type_=Integer)
+    followed = (
+        insert(Followers)
+        .values(account_id=account_id, follower_id=follower_id)
+        .on_conflict_do_nothing()
+        .returning(Followers.follower_id)
+        .cte("followed")
+    )
+    backfilled = TimelineDAO.backfill_stmt(
+        follower_id,
+        account_id,
+        bindparam("backfill_limit", type_=Integer),
+        exists(select(followed.c.follower_id)),
+    ).cte("backfilled")
+    return mark_write(select(func.count()).select_from(followed).add_cte(backfilled))
+
+
+def _unfollow_stmt():
+    """Возвращает запрос FollowersDAO.unfollow со связанными параметрами."""
+    account_id = bindparam("account_id", type_=Integer)
+    follower_id = bindparam("follower_id", type_=Integer)
+    unfollowed = (
+        delete(Followers)
+        .where(Followers.account_id == account_id, Followers.follower_id == follower_id)
+        .returning(Followers.follower_id)
+        .cte("unfollowed")
+    )
+    pruned = TimelineDAO.prune_stmt(
+        follower_id, account_id, exists(select(unfollowed.c.follower_id))
+    ).cte("pruned")
+    return mark_write(
+        select(
+            select(func.count()).select_from(unfollowed).scalar_subquery(),
+            exists(select(Users.id).where(Users.id == account_id)),
+        ).add_cte(pruned)
+    )
+
 
 class FollowersDAO(BaseDAO):
     model = Followers
+
+    # Запросы подписки и отписки строятся один раз; идентификаторы
+    # передаются параметрами при выполнении (см. follow, unfollow)
+    follow_stmt = _follow_stmt()
+    unfollow_stmt = _unfollow_stmt()
+
+    @classmethod
+    async def follow(
+        cls,
+        session: AsyncSession,
+        account_id: int,
+        follower_id: int,
+        backfill_limit: int,
+    ) -> bool:
+        """
+        Асинхронно подписывает пользователя на автора и заполняет его ленту одним запросом.
+
+        Подписка вставляется с ON CONFLICT DO NOTHING, а последние твиты автора
+        копируются в ленту подписчика (см. TimelineDAO.backfill_stmt) только если
+        подписка действительно добавлена:
+
+            WITH followed AS (
+                INSERT INTO followers (account_id, follower_id) VALUES (...)
+                ON CONFLICT DO NOTHING RETURNING follower_id
+            ), backfilled AS (
+                INSERT INTO timelines (...) SELECT ... FROM tweets
+                WHERE author_id = :account_id AND ... AND EXISTS (SELECT 1 FROM followed)
+                ORDER BY timestamp DESC, id DESC LIMIT :backfill_limit
+                ON CONFLICT DO NOTHING
+            )
+            SELECT count(*) FROM followed
+
+        :param session: Асинхронная сессия SQLAlchemy.
+        :param account_id: Идентификатор автора.
+        :param follower_id: Идентификатор подписчика.
+        :param backfill_limit: Максимальное количество твитов, добавляемых в ленту.
+        :return: True, если подписка добавлена, False, если она уже была.
+        :raises UserNotFoundError: Если автора нет (нарушен внешний ключ).
+        """
+        try:
+            added = await session.scalar(
+                cls.follow_stmt,
+                {
+                    "account_id": account_id,
+                    "follower_id": follower_id,
+                    "backfill_limit": backfill_limit,
+                },
+            )
+        except IntegrityError as e:
+            if getattr(e.orig, "sqlstate", None) == FOREIGN_KEY_VIOLATION:
+                raise UserNotFoundError(account_id) from e
+            logger.error("Ошибка при добавлении подписки: %s", e)
+            raise e
+        except SQLAlchemyError as e:
+            logger.error("Ошибка при добавлении подписки: %s", e)
+            raise e
+        return added > 0
+
+    @classmethod
+    async def unfollow(
+        cls, session: AsyncSession, account_id: int, follower_id: int
+    ) -> bool:
+        """
+        Асинхронно отменяет подписку и убирает твиты автора из ленты подписчика одним запросом.
+
+            WITH unfollowed AS (
+                DELETE FROM followers
+                WHERE account_id = :account_id AND follower_id = :follower_id
+                RETURNING follower_id
+            ), pruned AS (
+                DELETE FROM timelines
+                WHERE user_id = :follower_id AND author_id = :account_id
+                  AND EXISTS (SELECT 1 FROM unfollowed)
+            )
+            SELECT (SELECT count(*) FROM unfollowed),
+                   EXISTS (SELECT 1 FROM users WHERE id = :account_id)
+
+        :param session: Асинхронная сессия SQLAlchemy.
+        :param account_id: Идентификатор автора.
+        :param follower_id: Идентификатор подписчика.
+        :return: True, если подписка удалена, False, если ее не было.
+        :raises UserNotFoundError: Если автора нет.
+        """
+        try:
+            removed, author_exists = (
+                await session.execute(
+                    cls.unfollow_stmt,
+                    {"account_id": account_id, "follower_id": follower_id},
+                )
+            ).one()
+        except SQLAlchemyError as e:
+            logger.error("Ошибка при удалении подписки: %s", e)
+            raise e
+        if not author_exists:
+            raise UserNotFoundError(account_id)
+        return removed > 0
@@ -1,67 +1,202 @@
+import asyncio
 import logging
-from io import BytesIO
+import os
+from typing import Optional
 
-from PIL import Image
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File
-from sqlalchemy.ext.asyncio import AsyncSession
-from starlette.responses import StreamingResponse
+from fastapi import (
+    APIRouter,
+    BackgroundTasks,
+    Depends,
+    File,
+    Header,
+    HTTPException,
+    Query,
+    UploadFile,
+)
+from sqlalchemy.ext.asyncio import async_sessionmaker
+from starlette.responses import FileResponse, Response
 
-from application.api.dependencies import get_current_session, MediaDAO, get_client_token
+from application.api.dependencies import (
+    get_unit_of_work,
+    get_session_factory,
+    MediaDAO,
+    get_current_user,
+)
+from application.cache import UserIdentity
+from application.config import settings
+from application.storage import BlobTooLargeError, media_storage
+from application.unit_of_work import UnitOfWork
+from application.uploads import (
+    IMAGE_HEAD_SIZE,
+    iter_upload_chunks,
+    probe_image,
+    sniff_image_type,
+)
+from application.variants import (
+    VariantQueueFullError,
+    choose_variant_width,
+    create_variants,
+    ensure_variant,
+)
 
-logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
 
 
 medias_router = APIRouter(prefix="/api", tags=["Media"])
 
 
+# Содержимое медиафайла по его id никогда не меняется, поэтому ответы кэшируются навсегда
+MEDIA_CACHE_CONTROL = "public, max-age=31536000, immutable"
+# Оригинал вместо еще не созданного варианта кэшируется ненадолго, чтобы затем получить вариант
+VARIANT_FALLBACK_CACHE_CONTROL = "public, max-age=60"
+
+
+def accel_redirect_prefix() -> Optional[str]:
+    """
+    Возвращает префикс внутреннего location nginx, если файл должен отдать nginx.
+
+    Режим задается только настройкой MEDIA_ACCEL_REDIRECT, а не заголовками
+    запроса: их может прислать и клиент, обратившийся к приложению напрямую.
+    """
+    if settings.MEDIA_ACCEL_REDIRECT == "on":
+        return settings.MEDIA_ACCEL_PREFIX
+    return None
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """
+    Проверяет заголовок If-None-Match против ETag ответа (слабое сравнение, RFC 9110).
+
+    Аргументы:
+        if_none_match (str, optional): Значение заголовка If-None-Match.
+        etag (str): ETag ответа в кавычках.
+    """
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    candidates = (tag.strip() for tag in if_none_match.split(","))
+    return etag in (tag[2:] if tag.startswith("W/") else tag for tag in candidates)
+
+
 @medias_router.get("/media/{media_id}")
+@medias_router.head("/media/{media_id}")
 async def get_media(
-    media_id: int, session: AsyncSession = Depends(get_current_session)
-):
+    media_id: int,
+    w: Optional[int] = Query(None, gt=0, description="Нужная ширина изображения"),
+    if_none_match: Optional[str] = Header(None),
+    session_factory: async_sessionmaker = Depends(get_session_factory),
+) -> Response:
     """
     Получение медиа привязанного к твиту в виде изображения.
 
+    Тип содержимого берется из метаданных, сохраненных при загрузке, поэтому
+    файл не открывается для его определения. Содержимое медиафайла неизменно,
+    поэтому ответ содержит строгий ETag
+    (SHA-256 содержимого) и Cache-Control: immutable. На запрос с совпадающим
+    If-None-Match возвращается 304 без чтения файла. Поддерживаются запросы
+    части файла (Range, If-Range) и HEAD.
+
+    С параметром w отдается уменьшенный вариант изображения: наименьший из
+    MEDIA_VARIANT_WIDTHS, не уже запрошенной ширины. Вариант создается при первом
+    запросе, если не был создан после загрузки; если пул создания вариантов
+    занят, отдается оригинал с коротким временем кэширования. Если оригинал
+    не шире варианта, отдается оригинал.
+
+    За nginx (см. MEDIA_ACCEL_REDIRECT) приложение только находит блоб и
+    возвращает заголовок X-Accel-Redirect, а сам файл, включая Range и HEAD,
+    отдает nginx через sendfile; без nginx файл отдается через FileResponse.
+
     Аргументы:
         media_id (int): Идентификатор медиа.
-        session (AsyncSession): Асинхронная сессия SQLAlchemy.
+        w (int, optional): Нужная ширина изображения в пикселях.
+        if_none_match (str, optional): ETag, уже имеющийся у клиента.
+        session_factory (async_sessionmaker): Фабрика сессий; маршрут открывает
+            короткие сессии, чтобы не удерживать соединение, пока создается вариант.
 
     Возвращает:
         Изображение в формате, определяемом по содержимому.
 
     Пример запроса:
         curl -i -X GET "http://localhost:5000/api/media/1"
+
+    Повторный запрос:
+        curl -i -H 'If-None-Match: "<etag>"' "http://localhost:5000/api/media/1"
+
+    Вариант шириной 480 пикселей:
+        curl -i "http://localhost:5000/api/media/1?w=480"
     """
 
-    media = await MediaDAO.find_one_or_none_by_id(media_id, session=session)
+    async with session_factory() as session:
+        media = await MediaDAO.find_one_or_none_by_id(media_id, session=session)
 
     if media is None:
         raise HTTPException(status_code=404, detail="Media not found")
 
-    # Создаем поток для передачи данных
-    image_stream = BytesIO(media.file_body)
+    blob_key, content_type = media.blob_key, media.mime_type
+    cache_control = MEDIA_CACHE_CONTROL
+    width = (
+        choose_variant_width(w, media.width, media.mime_type) if w is not None else None
+    )
+    if width is not None:
+        try:
+            variant = await ensure_variant(session_factory, media.id, media.blob_key, width)
+            blob_key, content_type = variant.blob_key, variant.mime_type
+        except VariantQueueFullError:
+            cache_control = VARIANT_FALLBACK_CACHE_CONTROL
+        except FileNotFoundError:
+            logger.error("Блоб %s медиафайла %s не найден в хранилище", blob_key, media_id)
+            raise HTTPException(status_code=404, detail="Media not found")
 
-    try:
-        # Открываем изображение с помощью Pillow для определения формата
-        image = Image.open(image_stream)
-        content_type = (
-            f"image/{image.format.lower()}"  # Получаем тип контента в нижнем регистре
-        )
+    etag = f'"{blob_key}"'
+    headers = {"ETag": etag, "Cache-Control": cache_control}
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
 
-        # Сбрасываем указатель потока на начало
-        image_stream.seek(0)
+    if content_type is None:
+        # Запись создана до сохранения метаданных: тип определяется по началу файла
+        try:
+            head = await media_storage.read_head(blob_key, IMAGE_HEAD_SIZE)
+        except FileNotFoundError:
+            logger.error("Блоб %s медиафайла %s не найден в хранилище", blob_key, media_id)
+            raise HTTPException(status_code=404, detail="Media not found")
+        content_type = sniff_image_type(head)
+        if content_type is None:
+            raise HTTPException(status_code=400, detail="Invalid image data")
 
-        return StreamingResponse(image_stream, media_type=content_type)
+    accel_prefix = accel_redirect_prefix()
+    relative_path = media_storage.relative_path(blob_key)
+    if accel_prefix is not None and relative_path is not None:
+        # Файл отдает nginx из внутреннего location, приложение диск не читает
+        headers["X-Accel-Redirect"] = accel_prefix + relative_path
+        return Response(media_type=content_type, headers=headers)
 
-    except Exception as e:
-        raise HTTPException(status_code=400, detail="Invalid image data")
+    try:
+        path = media_storage.local_path(blob_key)
+        stat_result = await asyncio.to_thread(os.stat, path) if path else None
+    except FileNotFoundError:
+        logger.error("Блоб %s медиафайла %s не найден в хранилище", blob_key, media_id)
+        raise HTTPException(status_code=404, detail="Media not found")
+
+    if path is not None:
+        # FileResponse сам обрабатывает Range, If-Range и HEAD, файл не читается в память
+        return FileResponse(
+            path, stat_result=stat_result, media_type=content_type, headers=headers
+        )
+    return Response(
+        content=await media_storage.read(blob_key),
+        media_type=content_type,
+        headers=headers,
+    )
 
 
 @medias_router.post("/medias")
 async def add_media(
-    api_key: str = Depends(get_client_token),
+    background_tasks: BackgroundTasks,
+    current_user: UserIdentity = Depends(get_current_user),
     file: UploadFile = File(...),
-    session: AsyncSession = Depends(get_current_session),
+    uow: UnitOfWork = Depends(get_unit_of_work),
+    session_factory: async_sessionmaker = Depends(get_session_factory),
 ) -> dict:
     """
     Эндпоинт для загрузки медиафайлов.
@@ -70,9 +205,11 @@ async def add_media(
     связывать их с определенным твитом по его идентификатору.
 
     Аргументы:
-        api_key (str): API ключ пользователя, необходимый для аутентификации.
+        background_tasks (BackgroundTasks): Фоновые задачи, выполняемые после ответа.
+        current_user (UserIdentity): Текущий пользователь, полученный из зависимостей.
         file (UploadFile): Загружаемый файл (изображение или другой медиафайл).
-        session (AsyncSession): Асинхронная сессия SQLAlchemy.
+        uow (UnitOfWork): Единица работы запроса.
+        session_factory (async_sessionmaker): Фабрика сессий для фоновой задачи.
 
     Возвращает:
         JSON-ответ с результатом операции и ID загруженного медиафайла.
@@ -82,16 +219,72 @@ async def add_media(
     curl -i -X POST -H "api-key: 1wc65vc4v1fv" -F "file=@/path/to/your/image.jpg" "http://localhost:5000/api/medias"
     ```
 
+    Файл не читается в память целиком: он записывается в хранилище частями
+    по MEDIA_UPLOAD_CHUNK_SIZE байт, а размер ограничен настройкой MEDIA_MAX_UPLOAD_SIZE.
+    MIME-тип, ширина, высота и размер изображения определяются в пуле потоков
+    и сохраняются в записи Media, чтобы не определять их при каждом запросе.
+    Уменьшенные варианты изображения создаются после ответа в пуле процессов
+    (см. application.variants). Повторно загруженное содержимое не сохраняется
+    второй раз: новая запись ссылается на уже сохраненный блоб.
+
     :raises HTTPException:
-        - 400, если произошла ошибка при загрузке файла или создании записи в базе данных.
+        - 413, если файл больше MEDIA_MAX_UPLOAD_SIZE.
+        - 415, если файл не является изображением поддерживаемого формата
+          (по первым байтам или по заголовку изображения).
+        - 500, если произошла ошибка при создании записи в базе данных.
     """
 
+    # Тип файла проверяется по первой части, до чтения остального содержимого
+    first_chunk = await file.read(settings.MEDIA_UPLOAD_CHUNK_SIZE)
+    if sniff_image_type(first_chunk) is None:
+        raise HTTPException(
+            status_code=415, detail="Поддерживаются только изображения JPEG, PNG, GIF и WebP"
+        )
+
+    try:
+        # Содержимое записывается во временный файл частями, с подсчетом хэша и размера
+        staged = await media_storage.stage_stream(
+            iter_upload_chunks(file, first_chunk, settings.MEDIA_UPLOAD_CHUNK_SIZE),
+            max_size=settings.MEDIA_MAX_UPLOAD_SIZE,
+        )
+    except BlobTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    logger.info("Загружен медиафайл %s (%s байт)", staged.key, staged.size)
+
     try:
-        file_body = await file.read()
+        # Pillow разбирает только заголовок изображения, в пуле потоков
+        metadata = await probe_image(staged)
+    except ValueError as e:
+        logger.warning("Медиафайл %s отклонен: %s", staged.key, e)
+        await media_storage.discard_staged(staged)
+        raise HTTPException(
+            status_code=415, detail="Поддерживаются только изображения JPEG, PNG, GIF и WebP"
+        )
+
+    try:
+        # Запись в базе данных и блоб сохраняются вместе; одинаковое содержимое
+        # хранится один раз, а ссылки на него учитываются в media_blobs
+        new_media = await MediaDAO.add_with_blob(
+            uow.session,
+            staged,
+            media_storage,
+            uploader_id=current_user.id,
+            file_name=file.filename,
+            mime_type=metadata.mime_type,
+            width=metadata.width,
+            height=metadata.height,
+            size=staged.size,
+        )
 
-        # Создание записи в базе данных
-        new_media = await MediaDAO.add(
-            session=session, file_body=file_body, file_name=file.filename
+        # Фоновая задача выполняется после закрытия сессии запроса, открывает свою
+        # и сохраняет каждый вариант в своей единице работы
+        background_tasks.add_task(
+            create_variants,
+            session_factory,
+            new_media.id,
+            new_media.blob_key,
+            new_media.width,
+            new_media.mime_type,
         )
 
         return {"result": True, "media_id": new_media.id}
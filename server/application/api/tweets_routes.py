@@ -1,54 +1,123 @@
 import logging
 from datetime import datetime
-from typing import Dict, Union, List, Any
+from typing import Any, Optional
 
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Query
 from sqlalchemy.exc import SQLAlchemyError
-from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
 from sqlalchemy.orm import selectinload
-from starlette.responses import JSONResponse
+from fastapi.responses import ORJSONResponse
 
 from application.api.dependencies import (
-    get_current_session,
+    get_unit_of_work,
     TweetDAO,
     get_current_user,
-    MediaDAO,
+    get_session_factory,
+    MediaUnavailableError,
+    TweetNotFoundError,
     LikeDAO,
+    FollowersDAO,
 )
-from application.models import Tweets, Like, Users
-from application.schemas import TweetOut, ErrorResponse, TweetIn
+from application.cache import feed_cache, UserIdentity
+from application.config import settings
+from application.feed import render_feed_page
+from application.media_gc import release_unreferenced_blobs
+from application.models import Like
+from application.pagination import (
+    decode_cursor,
+    decode_id_cursor,
+    encode_id_cursor,
+)
+from application.schemas import ErrorResponse, TweetIn, TweetsFeedOut, TweetLikesOut
+from application.serializers import RawJSONResponse
+from application.storage import media_storage
+from application.timeline import TimelineDAO
+from application.unit_of_work import UnitOfWork
 
-logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
 
 
-tweets_router = APIRouter(prefix="/api", tags=["Tweets"])
+# Ответы-словари сериализуются через orjson; лента отдается готовыми байтами
+tweets_router = APIRouter(
+    prefix="/api", tags=["Tweets"], default_response_class=ORJSONResponse
+)
+
+
+async def invalidate_new_tweet_feeds(session: AsyncSession, author_id: int):
+    """
+    Сбрасывает в кэше первые страницы лент, в которых должен появиться новый твит автора.
+
+    Из базы запрашиваются только те подписчики автора, чьи ленты сейчас есть в кэше,
+    поэтому объем запроса ограничен размером кэша, а не числом подписчиков.
+    Выполняется после фиксации транзакции с твитом (см. UnitOfWork.after_commit),
+    чтобы страницы, закэшированные до фиксации, тоже были сброшены.
+
+    :param session: Асинхронная сессия SQLAlchemy.
+    :param author_id: Идентификатор автора нового твита.
+    """
+    user_ids = {author_id}
+    cached_user_ids = feed_cache.cached_user_ids() - user_ids
+    if cached_user_ids:
+        followers = await FollowersDAO.find_all(
+            session=session,
+            filters={"account_id": author_id, "follower_id": list(cached_user_ids)},
+        )
+        user_ids.update(follower.follower_id for follower in followers)
+    feed_cache.invalidate_users(user_ids, first_page_only=True)
 
 
 @tweets_router.get(
     "/tweets",
-    response_model=Dict[str, Union[bool, List[TweetOut]]],
-    responses={403: {"model": ErrorResponse}, 500: {"model": ErrorResponse}},
+    response_model=TweetsFeedOut,
+    responses={
+        400: {"model": ErrorResponse},
+        403: {"model": ErrorResponse},
+        500: {"model": ErrorResponse},
+    },
 )
 async def get_users_tweets(
-    session: AsyncSession = Depends(get_current_session),
-) -> JSONResponse | dict[str, bool | list[Any]] | Any:
+    limit: int = Query(
+        settings.FEED_PAGE_SIZE, ge=1, description="Количество твитов на странице"
+    ),
+    cursor: Optional[str] = Query(
+        None, description="Курсор следующей страницы из предыдущего ответа"
+    ),
+    uow: UnitOfWork = Depends(get_unit_of_work),
+    current_user: UserIdentity = Depends(get_current_user),
+) -> RawJSONResponse:
     """
     Получение ленты твитов для пользователя.
 
-    Этот эндпоинт позволяет пользователю получить список твитов на основе переданного API ключа.
-    Если API ключ неверный, возвращается ошибка 403. В случае других ошибок возвращается ошибка 500.
+    Этот эндпоинт возвращает домашнюю ленту пользователя: его собственные твиты
+    и твиты авторов, на которых он подписан, постранично, от новых к старым.
+    Лента материализуется при публикации твитов (таблица timelines),
+    поэтому чтение страницы — один диапазонный запрос по индексу.
+    Страницы выбираются по курсору (keyset-пагинация по паре timestamp, id),
+    поэтому время ответа не зависит от общего количества твитов и глубины листания.
+    Размер страницы ограничен настройкой FEED_MAX_PAGE_SIZE.
+
+    Готовые страницы хранятся в кэше процесса (feed_cache) в сериализованном виде
+    и сбрасываются при публикации и удалении твитов, лайках и изменении подписок.
+    Заголовок ответа X-Cache показывает, была ли страница взята из кэша (HIT) или нет (MISS).
 
     Пример запроса:
-        curl -i -H "api-key: 1wc65vc4v1fv" "http://localhost:5000/api/tweets"
+        curl -i -H "api-key: 1wc65vc4v1fv" "http://localhost:5000/api/tweets?limit=20"
+
+    Следующая страница:
+        curl -i -H "api-key: 1wc65vc4v1fv" "http://localhost:5000/api/tweets?limit=20&cursor=<next_cursor>"
 
     Аргументы:
-        session (AsyncSession): Асинхронная сессия SQLAlchemy.
+        limit (int): Количество твитов на странице.
+        cursor (str, optional): Непрозрачный курсор, полученный в поле `next_cursor` предыдущего ответа.
+        uow (UnitOfWork): Единица работы запроса.
+        current_user (UserIdentity): Текущий пользователь, полученный из зависимостей.
 
     Возвращает:
-        JSON-ответ с результатом запроса. Если запрос успешен, возвращает список твитов.
+        JSON-ответ с результатом запроса. Если запрос успешен, возвращает страницу твитов
+        и курсор следующей страницы (`null`, если страниц больше нет).
         В случае ошибки возвращает соответствующее сообщение об ошибке.
 
+        - Код 400: `detail`: "Некорректный курсор".
         - Код 403: `detail`: "User not authenticated".
         - Код 500: `detail`: Сообщение об ошибке с описанием проблемы.
 
@@ -64,53 +133,62 @@ async def get_users_tweets(
                     "name": "Пользователь1"
                 },
                 "attachments": [],
+                "like_count": 0,
                 "likes": []
             },
             ...
-        ]
+        ],
+        "next_cursor": "MjAyNS0wMS0xNFQxMjowMjo0Ny4yMjEyMTIrMDA6MDB8MQ"
     }
 
     Примечание: Убедитесь, что переданный API ключ действителен и соответствует зарегистрированному пользователю.
     """
-    logger.info(f"Сессия получена из зависимости session: {session}")
+    limit = min(limit, settings.FEED_MAX_PAGE_SIZE)
     try:
-        # Получаем все твиты пользователя с подгрузкой связанных данных (автор, медиа и лайки)
-        logger.info(f"Сессия передается в метод запроса session: {session}")
-        all_tweets = await TweetDAO.find_all(
-            session=session,
-            options=[
-                selectinload(Tweets.author),  # Подгружаем автора твита
-                selectinload(Tweets.attachments),  # Подгружаем медиафайлы твита
-                selectinload(Tweets.likes).selectinload(
-                    Like.user
-                ),  # Подгружаем лайки и пользователей, которые их поставили
-            ],
-        )
+        after = decode_cursor(cursor) if cursor else None
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
-        # Преобразуем каждый твит в формат JSON
-        tweets_json = [tweet.to_json() for tweet in all_tweets]
+    cached_body = feed_cache.get(current_user.id, cursor, limit)
+    if cached_body is not None:
+        return RawJSONResponse(content=cached_body, headers={"X-Cache": "HIT"})
+    cache_epoch = feed_cache.epoch
+
+    logger.debug("Запрос страницы ленты: limit=%s, cursor=%s", limit, cursor)
+    try:
+        page = await render_feed_page(
+            session=uow.session, user_id=current_user.id, limit=limit, after=after
+        )
     except Exception as e:
         # Обработка любых других ошибок (например, ошибки базы данных)
         raise HTTPException(status_code=500, detail=str(e))
 
-    # Возвращаем успешный ответ с результатами
-    return {"result": True, "tweets": tweets_json}  # Список твитов в формате JSON
+    # Тело ответа уже сериализовано, сохраняем готовые байты в кэш
+    feed_cache.set(
+        current_user.id,
+        cursor,
+        limit,
+        body=page.body,
+        tweet_ids=page.tweet_ids,
+        epoch=cache_epoch,
+    )
+    return RawJSONResponse(content=page.body, headers={"X-Cache": "MISS"})
 
 
 @tweets_router.post("/tweets", status_code=201)
 async def add_tweet(
     tweet: TweetIn,
-    session: AsyncSession = Depends(get_current_session),
-    current_user: Users = Depends(get_current_user),
+    uow: UnitOfWork = Depends(get_unit_of_work),
+    current_user: UserIdentity = Depends(get_current_user),
 ) -> dict[str, bool | Any]:
     """
     Добавляет новый твит от пользователя.
 
     Аргументы:
         tweet (TweetIn): Объект типа TweetIn, содержащий данные о твите.
-        current_user (Users): Текущий пользователь, который добавляет твит.
+        current_user (UserIdentity): Текущий пользователь, который добавляет твит.
                               Получается из зависимости get_current_user.
-        session (AsyncSession): Асинхронная сессия SQLAlchemy.
+        uow (UnitOfWork): Единица работы запроса.
 
     Возвращает:
         Словарь с результатом операции и идентификатором нового твита.
@@ -121,7 +199,13 @@ async def add_tweet(
             "tweet_id": 123
         }
 
-    :raises HTTPException: Если произошла ошибка при добавлении твита, возвращает статус 400 и сообщение об ошибке.
+    Твит создается, медиафайлы прикрепляются и твит рассылается в ленты
+    в одной транзакции единицы работы; кэш лент сбрасывается после ее фиксации.
+    Прикрепить можно только свои, еще не прикрепленные медиафайлы; если хотя бы
+    один из них недоступен, твит не создается.
+
+    :raises HTTPException: Если произошла ошибка при добавлении твита или часть медиафайлов
+        недоступна, возвращает статус 400 и сообщение об ошибке.
 
     Пример запроса:
     ```
@@ -139,39 +223,41 @@ async def add_tweet(
     }
 
     try:
-        new_tweet = await TweetDAO.add(session=session, **new_tweet_data)
-
-        # Привязка медиафайлов к новому твиту
-        for media_id in tweet.tweet_media_ids:
-            media = await MediaDAO.find_one_or_none_by_id(
-                media_id, session=session
-            )  # Получаем медиа по ID
-            if media:
-                media.tweet_id = new_tweet.id  # Привязываем медиа к новому твиту
-                await MediaDAO.update(
-                    session=session, instance=media, tweet_id=new_tweet.id
-                )  # Обновляем запись в базе данных
-
-        return {"result": True, "tweet_id": new_tweet.id}
+        # Твит и прикрепление всех медиафайлов одним запросом
+        new_tweet = await TweetDAO.add_with_media(
+            session=uow.session, media_ids=tweet.tweet_media_ids or [], **new_tweet_data
+        )
 
+        # Добавляем твит в ленты: подписчикам популярных авторов он подмешивается при чтении
+        await TimelineDAO.fan_out(
+            session=uow.session, tweet_id=new_tweet.id, author_id=current_user.id
+        )
+    except MediaUnavailableError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except SQLAlchemyError as e:
         raise HTTPException(status_code=400, detail=str(e))
 
+    uow.after_commit(
+        invalidate_new_tweet_feeds, session=uow.session, author_id=current_user.id
+    )
+    return {"result": True, "tweet_id": new_tweet.id}
+
 
 @tweets_router.post("/tweets/{tweet_id}/likes")
 async def add_like(
     tweet_id: int,
-    session: AsyncSession = Depends(get_current_session),
-    current_user: Users = Depends(get_current_user),
+    uow: UnitOfWork = Depends(get_unit_of_work),
+    current_user: UserIdentity = Depends(get_current_user),
 ) -> dict:
     """
     Пользователь может поставить отметку «Нравится» на твит по его идентификатору.
-    Лайк можно поставить только на существующий твит.
+    Лайк можно поставить только на существующий твит. Повторный лайк ничего
+    не меняет и тоже возвращает успешный ответ, поэтому запрос можно повторять.
 
     Аргументы:
         tweet_id (int): Идентификатор твита, к которому пользователь хочет добавить лайк.
-        current_user (Users): Текущий пользователь, полученный из зависимостей.
-        session (AsyncSession): Асинхронная сессия SQLAlchemy.
+        current_user (UserIdentity): Текущий пользователь, полученный из зависимостей.
+        uow (UnitOfWork): Единица работы запроса.
 
     Возвращает:
         Статус операции в формате JSON.
@@ -186,30 +272,118 @@ async def add_like(
         - 404, если твит не найден.
     """
 
-    tweet = await TweetDAO.find_one_or_none_by_id(tweet_id, session=session)
+    try:
+        added = await LikeDAO.add_like(
+            session=uow.session, tweet_id=tweet_id, user_id=current_user.id
+        )
+    except TweetNotFoundError:
+        raise HTTPException(status_code=404, detail="Твит не найден")
+    if added:
+        # Повторный лайк ничего не меняет, и закэшированные страницы остаются верными
+        uow.after_commit(feed_cache.invalidate_tweet, tweet_id)
+
+    return {"result": True}
+
+
+@tweets_router.get(
+    "/tweets/{tweet_id}/likes",
+    response_model=TweetLikesOut,
+    responses={
+        400: {"model": ErrorResponse},
+        403: {"model": ErrorResponse},
+        404: {"model": ErrorResponse},
+    },
+)
+async def get_tweet_likes(
+    tweet_id: int,
+    limit: int = Query(
+        settings.FEED_PAGE_SIZE, ge=1, description="Количество лайков на странице"
+    ),
+    cursor: Optional[str] = Query(
+        None, description="Курсор следующей страницы из предыдущего ответа"
+    ),
+    uow: UnitOfWork = Depends(get_unit_of_work),
+    current_user: UserIdentity = Depends(get_current_user),
+) -> dict:
+    """
+    Полный список пользователей, лайкнувших твит, постранично от новых лайков к старым.
+
+    В ленте вместе с твитом возвращается только счетчик и несколько последних лайков,
+    остальные можно получить через этот эндпоинт.
+
+    Аргументы:
+        tweet_id (int): Идентификатор твита.
+        limit (int): Количество лайков на странице (не больше FEED_MAX_PAGE_SIZE).
+        cursor (str, optional): Курсор из поля `next_cursor` предыдущего ответа.
+        uow (UnitOfWork): Единица работы запроса.
+        current_user (UserIdentity): Текущий пользователь, полученный из зависимостей.
+
+    Возвращает:
+        Счетчик лайков, страницу лайков и курсор следующей страницы.
+
+    Пример запроса с использованием curl:
+    ```
+    curl -i -H "Api-Key: 1wc65vc4v1fv" "http://localhost:5000/api/tweets/<tweet_id>/likes?limit=50"
+    ```
 
+    :raises HTTPException:
+        - 400, если курсор поврежден.
+        - 403, если пользователь не аутентифицирован.
+        - 404, если твит не найден.
+    """
+    limit = min(limit, settings.FEED_MAX_PAGE_SIZE)
+    try:
+        after = (decode_id_cursor(cursor),) if cursor else None
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    tweet = await TweetDAO.find_one_or_none_by_id(tweet_id, session=uow.session)
     if not tweet:
         raise HTTPException(status_code=404, detail="Твит не найден")
 
-    await LikeDAO.add(session=session, tweet_id=tweet_id, user_id=current_user.id)
+    likes = await LikeDAO.find_keyset_page(
+        session=uow.session,
+        keyset=("id",),
+        limit=limit + 1,
+        after=after,
+        options=[selectinload(Like.user)],
+        filters={"tweet_id": tweet_id},
+    )
 
-    return {"result": True}
+    next_cursor = None
+    if len(likes) > limit:
+        likes = likes[:limit]
+        next_cursor = encode_id_cursor(likes[-1].id)
+
+    return {
+        "result": True,
+        "like_count": tweet.like_count,
+        "likes": [{"user_id": like.user_id, "name": like.user.name} for like in likes],
+        "next_cursor": next_cursor,
+    }
 
 
 @tweets_router.delete("/tweets/{tweet_id}")
 async def delete_tweet(
     tweet_id: int,
-    session: AsyncSession = Depends(get_current_session),
-    current_user: Users = Depends(get_current_user),
+    background_tasks: BackgroundTasks,
+    uow: UnitOfWork = Depends(get_unit_of_work),
+    current_user: UserIdentity = Depends(get_current_user),
+    session_factory: async_sessionmaker = Depends(get_session_factory),
 ) -> dict:
     """
     Этот эндпоинт позволяет пользователю удалить твит по его идентификатору.
     Удаление возможно только для твитов, принадлежащих текущему пользователю.
 
+    Медиафайлы твита удаляются каскадно; блобы, на которые после этого не
+    осталось ссылок, удаляются из хранилища после ответа.
+
     Аргументы:
         tweet_id (int): Идентификатор твита для удаления.
-        current_user (Users): Текущий пользователь, полученный из зависимостей.
-        session (AsyncSession): Асинхронная сессия SQLAlchemy.
+        background_tasks (BackgroundTasks): Фоновые задачи, выполняемые после ответа.
+        current_user (UserIdentity): Текущий пользователь, полученный из зависимостей.
+        uow (UnitOfWork): Единица работы запроса.
+        session_factory (async_sessionmaker): Фабрика сессий для фоновой задачи.
 
     Возвращает:
         Статус операции в формате JSON.
@@ -224,7 +398,7 @@ async def delete_tweet(
         - 404, если твит не найден или пользователь не имеет прав на его удаление.
     """
     # Находим твит по идентификатору
-    current_tweet = await TweetDAO.find_one_or_none_by_id(tweet_id, session=session)
+    current_tweet = await TweetDAO.find_one_or_none_by_id(tweet_id, session=uow.session)
 
     # Проверяем, существует ли твит и принадлежит ли он текущему пользователю
     if not current_tweet or current_tweet.author_id != current_user.id:
@@ -233,8 +407,11 @@ async def delete_tweet(
             detail="Твит не найден или вы не имеете прав на его удаление",
         )
 
-    # Удаляем твит
-    await TweetDAO.delete(session=session, instance=current_tweet)
+    # Удаляем твит, записи лент удаляются каскадно (timelines.tweet_id ON DELETE CASCADE)
+    await TweetDAO.delete(session=uow.session, instance=current_tweet)
+    uow.after_commit(feed_cache.invalidate_tweet, tweet_id)
+    # Фоновая задача выполняется после закрытия сессии запроса и открывает свою
+    background_tasks.add_task(release_unreferenced_blobs, session_factory, media_storage)
 
     return {"result": True}
 
@@ -242,16 +419,16 @@ async def delete_tweet(
 @tweets_router.delete("/tweets/{tweet_id}/likes")
 async def delete_like(
     tweet_id: int,
-    session: AsyncSession = Depends(get_current_session),
-    current_user: Users = Depends(get_current_user),
+    uow: UnitOfWork = Depends(get_unit_of_work),
+    current_user: UserIdentity = Depends(get_current_user),
 ) -> dict:
     """
     Пользователь может убрать отметку «Нравится» с твита.
 
     Аргументы:
         tweet_id (int): Идентификатор твита, с которого пользователь хочет убрать лайк.
-        current_user (Users): Текущий пользователь, полученный из зависимостей.
-        session (AsyncSession): Асинхронная сессия SQLAlchemy.
+        current_user (UserIdentity): Текущий пользователь, полученный из зависимостей.
+        uow (UnitOfWork): Единица работы запроса.
 
     Возвращает:
         Статус операции в формате JSON.
@@ -265,18 +442,16 @@ async def delete_like(
         - 403, если пользователь не аутентифицирован.
         - 404, если лайк не найден или пользователь не имеет прав на его удаление.
     """
-    # Ищем лайк по идентификатору твита и пользователю
-    like = await LikeDAO.find_one_or_none(
-        tweet_id=tweet_id, user_id=current_user.id, session=session
+    removed = await LikeDAO.remove_like(
+        session=uow.session, tweet_id=tweet_id, user_id=current_user.id
     )
 
-    if not like:
+    if not removed:
         raise HTTPException(
             status_code=404,
             detail="Лайк не найден или вы не имеете прав на его удаление",
         )
 
-    # Удаляем лайк
-    await LikeDAO.delete(session=session, instance=like)
+    uow.after_commit(feed_cache.invalidate_tweet, tweet_id)
 
     return {"result": True}
@@ -1,18 +1,18 @@
 import logging
 
-from typing import List, Dict, Union, Any
+from typing import List, Dict, Union
 
 from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.orm import selectinload
 
 from application.api.dependencies import (
-    get_current_session,
+    get_unit_of_work,
     UserDAO,
     FollowersDAO,
-    get_client_token,
+    UserNotFoundError,
     get_current_user,
 )
+from application.cache import api_key_cache, feed_cache, UserIdentity
+from application.config import settings
 from application.models import Users, Tweets, Like
 from application.schemas import (
     UserOut,
@@ -20,18 +20,26 @@ from application.schemas import (
     SimpleUserOut,
     UserIn,
 )
-from starlette.responses import JSONResponse
+from application.serializers import (
+    RawJSONResponse,
+    user_profile_rows_to_bytes,
+)
+from application.unit_of_work import UnitOfWork
+from fastapi.responses import ORJSONResponse
+from starlette.responses import Response
 
-logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
 
 
-users_router = APIRouter(prefix="/api", tags=["Users"])
+# Ответы-словари сериализуются через orjson; горячие маршруты возвращают готовые байты
+users_router = APIRouter(
+    prefix="/api", tags=["Users"], default_response_class=ORJSONResponse
+)
 
 
 @users_router.get("/all_users", response_model=List[SimpleUserOut])
 async def get_all_users(
-    session: AsyncSession = Depends(get_current_session),
+    uow: UnitOfWork = Depends(get_unit_of_work),
 ) -> List[Users]:
     """
     Выводит всех пользователей.
@@ -45,32 +53,39 @@ async def get_all_users(
         curl -i GET "http://localhost:5000/api/all_users"
 
     Аргументы:
-        session (AsyncSession): Асинхронная сессия SQLAlchemy.
+        uow (UnitOfWork): Единица работы запроса.
 
     Возвращает:
         Список пользователей.
     """
-    result = await UserDAO.find_all(session=session)
+    result = await UserDAO.find_all(session=uow.session)
     return result
 
 
 @users_router.get(
     "/users/me",
     response_model=Dict[str, Union[bool, UserOut]],
-    responses={403: {"model": ErrorResponse}, 500: {"model": ErrorResponse}},
+    responses={
+        403: {"model": ErrorResponse},
+        404: {"model": ErrorResponse},
+        500: {"model": ErrorResponse},
+    },
 )
 async def get_user_info(
-    current_user: Users = Depends(get_current_user),
-) -> JSONResponse | dict[str, bool | list[Any]] | Any:
+    uow: UnitOfWork = Depends(get_unit_of_work),
+    current_user: UserIdentity = Depends(get_current_user),
+) -> Response:
     """
     Получение информации о профиле текущего пользователя.
 
     Этот эндпоинт позволяет пользователю получить информацию о своем профиле,
     включая данные о подписках и подписчиках.
 
-    :param current_user: Пользователь, полученный из зависимости `get_current_user`,
-                         который извлекает текущего пользователя из состояния запроса.
+    :param uow: Единица работы запроса.
+    :param current_user: Пользователь, полученный из зависимости `get_current_user`
+                         (только идентификатор и имя, подписки загружаются здесь).
                          Если пользователь не аутентифицирован, возвращается ошибка 403.
+                         Если пользователь удален, возвращается ошибка 404.
     :return:
         - result (bool): Указывает на успешность операции.
         - user (UserOut): Объект с информацией о пользователе.
@@ -103,7 +118,17 @@ async def get_user_info(
         curl -i -X GET -H "Api-Key: 1wc65vc4v1fv" "http://localhost:5000/api/users/me"
     """
 
-    return {"result": True, "user": current_user.to_json()}
+    # Подписки и подписчики нужны только этому маршруту, аутентификация их не загружает
+    profile_rows = await UserDAO.find_profile_rows(
+        session=uow.session, user_id=current_user.id
+    )
+    body = user_profile_rows_to_bytes(profile_rows)
+
+    # Пользователь мог быть удален, пока его ключ еще хранится в кэше аутентификации
+    if body is None:
+        raise HTTPException(status_code=404, detail="Пользователь не найден")
+
+    return RawJSONResponse(content=body)
 
 
 @users_router.get(
@@ -112,14 +137,14 @@ async def get_user_info(
     responses={403: {"model": ErrorResponse}, 500: {"model": ErrorResponse}},
 )
 async def get_user_info_by_id(
-    user_id: int, session: AsyncSession = Depends(get_current_session)
-) -> JSONResponse | dict[str, bool | list[Any]] | Any:
+    user_id: int, uow: UnitOfWork = Depends(get_unit_of_work)
+) -> Response:
     """
     Пользователь может получить информацию о произвольном профиле по его id.
 
     Аргументы:
         user_id (int): Идентификатор пользователя, информацию о котором необходимо получить.
-        session (AsyncSession): Асинхронная сессия SQLAlchemy.
+        uow (UnitOfWork): Единица работы запроса.
 
     Возвращает:
         Статус операции и информация о пользователе в формате JSON.
@@ -134,28 +159,26 @@ async def get_user_info_by_id(
         - 404, если пользователь с указанным id не найден.
         - 500, если произошла внутренняя ошибка сервера.
     """
-    user_info_by_id = await UserDAO.find_one_or_none_by_id(
-        user_id,
-        session=session,
-        options=[selectinload(Users.authors), selectinload(Users.followers)],
-    )
+    # Профиль читается Core-запросом и сериализуется сразу в байты, без объектов ORM
+    profile_rows = await UserDAO.find_profile_rows(session=uow.session, user_id=user_id)
+    body = user_profile_rows_to_bytes(profile_rows)
 
-    if user_info_by_id is None:
+    if body is None:
         raise HTTPException(status_code=404, detail="Пользователь не найден")
 
-    return {"result": True, "user": user_info_by_id.to_json()}
+    return RawJSONResponse(content=body)
 
 
 @users_router.post("/add_user", status_code=201)
 async def add_one_user(
-    user: UserIn, session: AsyncSession = Depends(get_current_session)
+    user: UserIn, uow: UnitOfWork = Depends(get_unit_of_work)
 ) -> str:
     """
     Добавляет пользователя, возвращает его.
 
     Аргументы:
         user (UserIn): Данные нового пользователя.
-        session (AsyncSession): Асинхронная сессия SQLAlchemy.
+        uow (UnitOfWork): Единица работы запроса.
 
     Пример запроса:
     ```
@@ -167,7 +190,9 @@ async def add_one_user(
     curl -X POST "http://localhost:5000/api/add_user" -H "Content-Type: application/json" -d '{"name": "Dan", "api_key": "test"}'
     """
 
-    new_user = await UserDAO.add(session=session, **user.model_dump())
+    new_user = await UserDAO.add(session=uow.session, **user.model_dump())
+    # Ключ мог быть запомнен в кэше аутентификации как неверный
+    uow.after_commit(api_key_cache.invalidate_key, user.api_key)
 
     return f"User added: {new_user}\n"
 
@@ -175,16 +200,16 @@ async def add_one_user(
 @users_router.post("/users/{user_id}/follow")
 async def follow_user(
     user_id: int,
-    session: AsyncSession = Depends(get_current_session),
-    current_user: Users = Depends(get_current_user),
+    uow: UnitOfWork = Depends(get_unit_of_work),
+    current_user: UserIdentity = Depends(get_current_user),
 ) -> dict:
     """
     Пользователь может зафоловить другого пользователя.
 
     Аргументы:
         user_id (int): Пользователь, которого фолловят.
-        current_user (Users): Пользователь, который фолловит.
-        session (AsyncSession): Асинхронная сессия SQLAlchemy.
+        current_user (UserIdentity): Пользователь, который фолловит.
+        uow (UnitOfWork): Единица работы запроса.
 
     Возвращает:
         Статус операции в формате JSON.
@@ -198,26 +223,23 @@ async def follow_user(
         - 404, если указанный пользователь не найден.
         - 409, если пользователь уже подписан на данного пользователя.
     """
-    # Проверяем, существует ли пользователь, на которого подписываются
-    followed_user = await UserDAO.find_one_or_none_by_id(user_id, session=session)
-
-    if not followed_user:
+    # Подписка и заполнение ленты подписчика выполняются одним запросом
+    try:
+        added = await FollowersDAO.follow(
+            session=uow.session,
+            account_id=user_id,
+            follower_id=current_user.id,
+            backfill_limit=settings.TIMELINE_BACKFILL_SIZE,
+        )
+    except UserNotFoundError:
         raise HTTPException(status_code=404, detail="Пользователь не найден")
 
-    # Проверяем, не подписан ли текущий пользователь уже на данного пользователя
-    existing_follow = await FollowersDAO.find_one_or_none(
-        account_id=user_id, follower_id=current_user.id, session=session
-    )
-
-    if existing_follow:
+    if not added:
         raise HTTPException(
             status_code=409, detail="Вы уже подписаны на этого пользователя"
         )
 
-    # Добавляем запись о подписке в таблицу followers
-    await FollowersDAO.add_followers(
-        session=session, account_id=user_id, follower_id=current_user.id
-    )
+    uow.after_commit(feed_cache.invalidate_users, [current_user.id])
 
     return {"result": True}
 
@@ -225,16 +247,16 @@ async def follow_user(
 @users_router.delete("/users/{user_id}/follow")
 async def delete_following(
     user_id: int,
-    session: AsyncSession = Depends(get_current_session),
-    current_user: Users = Depends(get_current_user),
+    uow: UnitOfWork = Depends(get_unit_of_work),
+    current_user: UserIdentity = Depends(get_current_user),
 ) -> dict:
     """
     Пользователь может убрать подписку на другого пользователя.
 
     Аргументы:
         user_id (int): Идентификатор пользователя, от которого пользователь хочет отписаться.
-        current_user (Users): Текущий пользователь, который отписывается.
-        session (AsyncSession): Асинхронная сессия SQLAlchemy.
+        current_user (UserIdentity): Текущий пользователь, который отписывается.
+        uow (UnitOfWork): Единица работы запроса.
 
     Возвращает:
         Статус операции в формате JSON.
@@ -249,25 +271,19 @@ async def delete_following(
         - 404, если пользователь, от которого отписываются, не найден.
         - 409, если текущий пользователь не подписан на данного пользователя.
     """
-    # Проверяем, существует ли пользователь, от которого отписываются
-    current_author = await UserDAO.find_one_or_none_by_id(user_id, session=session)
-
-    if not current_author:
+    # Отписка и очистка ленты бывшего подписчика выполняются одним запросом
+    try:
+        removed = await FollowersDAO.unfollow(
+            session=uow.session, account_id=user_id, follower_id=current_user.id
+        )
+    except UserNotFoundError:
         raise HTTPException(status_code=404, detail="Пользователь не найден")
 
-    # Проверяем, есть ли запись о подписке
-    existing_follow = await FollowersDAO.find_one_or_none(
-        account_id=user_id, follower_id=current_user.id, session=session
-    )
-
-    if not existing_follow:
+    if not removed:
         raise HTTPException(
             status_code=409, detail="Вы не подписаны на этого пользователя"
         )
 
-    # Удаляем запись о подписке из таблицы followers
-    await FollowersDAO.delete_followers(
-        session=session, account_id=user_id, follower_id=current_user.id
-    )
+    uow.after_commit(feed_cache.invalidate_users, [current_user.id])
 
     return {"result": True}
@@ -0,0 +1,302 @@
+import logging
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, Iterable, Optional, Set, Tuple
+
+from application.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+FeedKey = Tuple[int, str, int]  # (user_id, cursor, limit)
+
+# Примерные накладные расходы на одну запись: ключ, узел OrderedDict, записи в индексах
+ENTRY_OVERHEAD_BYTES = 256
+
+
+@dataclass
+class _FeedPage:
+    body: bytes
+    tweet_ids: Tuple[int, ...]
+    expires_at: float
+
+
+class FeedPageCache:
+    """
+    Кэш уже сериализованных страниц ленты в памяти процесса.
+
+    Страницы хранятся в виде байтов, готовых к отправке клиенту, с ключом
+    (user_id, cursor, limit). Вытеснение — LRU с ограничением по числу записей
+    и по суммарному объему, устаревание — по TTL.
+
+    Инвалидация точечная:
+        - invalidate_users: страницы указанных пользователей (новый твит, подписка);
+        - invalidate_tweet: все страницы, в которых есть указанный твит (лайк, удаление).
+
+    Чтобы страница, прочитанная из базы до завершения конкурентной записи,
+    не попала в кэш после инвалидации, set принимает номер эпохи, полученный
+    до чтения (см. epoch), и отбрасывает страницу, если с тех пор была инвалидация.
+    """
+
+    def __init__(self, max_entries: int, max_bytes: int, ttl: float):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._pages: "OrderedDict[FeedKey, _FeedPage]" = OrderedDict()
+        self._by_user: Dict[int, Set[FeedKey]] = {}
+        self._by_tweet: Dict[int, Set[FeedKey]] = {}
+        self._size = 0
+        self._epoch = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0 and self.max_bytes > 0 and self.ttl > 0
+
+    @property
+    def epoch(self) -> int:
+        """Номер текущей эпохи: увеличивается при каждой инвалидации."""
+        return self._epoch
+
+    def get(self, user_id: int, cursor: Optional[str], limit: int) -> Optional[bytes]:
+        """
+        Возвращает сериализованную страницу ленты или None, если ее нет в кэше или она устарела.
+        """
+        key = (user_id, cursor or "", limit)
+        page = self._pages.get(key)
+        if page is None:
+            self.misses += 1
+            return None
+        if page.expires_at <= time.monotonic():
+            self._remove(key)
+            self.misses += 1
+            return None
+        self._pages.move_to_end(key)
+        self.hits += 1
+        return page.body
+
+    def set(
+        self,
+        user_id: int,
+        cursor: Optional[str],
+        limit: int,
+        body: bytes,
+        tweet_ids: Iterable[int],
+        epoch: int,
+    ):
+        """
+        Сохраняет сериализованную страницу ленты.
+
+        Аргументы:
+            user_id (int): Владелец ленты.
+            cursor (str, optional): Курсор, по которому запрошена страница.
+            limit (int): Размер страницы.
+            body (bytes): Готовое тело ответа.
+            tweet_ids (Iterable[int]): Идентификаторы твитов на странице, для инвалидации по твиту.
+            epoch (int): Значение epoch, прочитанное до запроса страницы из базы данных.
+        """
+        if not self.enabled or epoch != self._epoch:
+            return
+        key = (user_id, cursor or "", limit)
+        if key in self._pages:
+            self._remove(key)
+
+        page = _FeedPage(
+            body=body,
+            tweet_ids=tuple(tweet_ids),
+            expires_at=time.monotonic() + self.ttl,
+        )
+        self._pages[key] = page
+        self._size += len(body) + ENTRY_OVERHEAD_BYTES
+        self._by_user.setdefault(user_id, set()).add(key)
+        for tweet_id in page.tweet_ids:
+            self._by_tweet.setdefault(tweet_id, set()).add(key)
+
+        while self._pages and (
+            len(self._pages) > self.max_entries or self._size > self.max_bytes
+        ):
+            oldest_key = next(iter(self._pages))
+            self._remove(oldest_key)
+            self.evictions += 1
+
+    def cached_user_ids(self) -> Set[int]:
+        """Возвращает идентификаторы пользователей, для которых в кэше есть страницы."""
+        return set(self._by_user)
+
+    def invalidate_users(self, user_ids: Iterable[int], first_page_only: bool = False):
+        """
+        Удаляет страницы лент указанных пользователей.
+
+        Аргументы:
+            user_ids (Iterable[int]): Владельцы лент.
+            first_page_only (bool): Удалять только первые страницы (без курсора).
+                Достаточно при появлении нового твита: страницы после курсора
+                от новых твитов не меняются.
+        """
+        self._epoch += 1
+        for user_id in user_ids:
+            for key in list(self._by_user.get(user_id, ())):
+                if not first_page_only or key[1] == "":
+                    self._remove(key)
+                    self.invalidations += 1
+
+    def invalidate_tweet(self, tweet_id: int):
+        """Удаляет все страницы, на которых присутствует указанный твит."""
+        self._epoch += 1
+        for key in list(self._by_tweet.get(tweet_id, ())):
+            self._remove(key)
+            self.invalidations += 1
+
+    def clear(self):
+        self._epoch += 1
+        self._pages.clear()
+        self._by_user.clear()
+        self._by_tweet.clear()
+        self._size = 0
+
+    def stats(self) -> Dict[str, int]:
+        """Счетчики для подбора размера кэша."""
+        return {
+            "entries": len(self._pages),
+            "bytes": self._size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+        }
+
+    def _remove(self, key: FeedKey):
+        page = self._pages.pop(key, None)
+        if page is None:
+            return
+        self._size -= len(page.body) + ENTRY_OVERHEAD_BYTES
+        self._discard(self._by_user, key[0], key)
+        for tweet_id in page.tweet_ids:
+            self._discard(self._by_tweet, tweet_id, key)
+
+    @staticmethod
+    def _discard(index: Dict[int, Set[FeedKey]], index_key: int, key: FeedKey):
+        keys = index.get(index_key)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del index[index_key]
+
+
+@dataclass(frozen=True)
+class UserIdentity:
+    """
+    Облегченное представление аутентифицированного пользователя.
+
+    Атрибуты:
+        id (int): Идентификатор пользователя.
+        name (str): Имя пользователя.
+    """
+
+    id: int
+    name: str
+
+
+@dataclass
+class _AuthEntry:
+    user: Optional[UserIdentity]
+    expires_at: float
+
+
+class ApiKeyCache:
+    """
+    Кэш соответствия API ключа пользователю (LRU с TTL).
+
+    Хранит только идентификатор и имя пользователя, без связей ORM.
+    Неверные ключи тоже запоминаются (user = None), но на более короткое время,
+    чтобы перебор ключей не превращался в поток запросов к базе данных.
+
+    Инвалидация:
+        - invalidate_key: при добавлении пользователя или назначении ключа;
+        - invalidate_user: при смене или отзыве ключей пользователя.
+    """
+
+    def __init__(self, max_entries: int, ttl: float, negative_ttl: float):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self._entries: "OrderedDict[str, _AuthEntry]" = OrderedDict()
+        self._keys_by_user: Dict[int, Set[str]] = {}
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0 and self.ttl > 0
+
+    def get(self, api_key: str) -> Tuple[bool, Optional[UserIdentity]]:
+        """
+        Ищет API ключ в кэше.
+
+        Возвращает:
+            Пару (найден ли ключ в кэше, пользователь или None для неверного ключа).
+        """
+        entry = self._entries.get(api_key)
+        if entry is None or entry.expires_at <= time.monotonic():
+            if entry is not None:
+                self._remove(api_key)
+            self.misses += 1
+            return False, None
+        self._entries.move_to_end(api_key)
+        self.hits += 1
+        return True, entry.user
+
+    def set(self, api_key: str, user: Optional[UserIdentity]):
+        """Запоминает пользователя (или None для неверного ключа) для API ключа."""
+        ttl = self.ttl if user is not None else self.negative_ttl
+        if not self.enabled or ttl <= 0:
+            return
+        self._remove(api_key)
+        self._entries[api_key] = _AuthEntry(user=user, expires_at=time.monotonic() + ttl)
+        if user is not None:
+            self._keys_by_user.setdefault(user.id, set()).add(api_key)
+        while len(self._entries) > self.max_entries:
+            self._remove(next(iter(self._entries)))
+
+    def invalidate_key(self, api_key: str):
+        """Удаляет API ключ из кэша."""
+        self._remove(api_key)
+
+    def invalidate_user(self, user_id: int):
+        """Удаляет из кэша все API ключи пользователя."""
+        for api_key in list(self._keys_by_user.get(user_id, ())):
+            self._remove(api_key)
+
+    def clear(self):
+        self._entries.clear()
+        self._keys_by_user.clear()
+
+    def stats(self) -> Dict[str, int]:
+        return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+    def _remove(self, api_key: str):
+        entry = self._entries.pop(api_key, None)
+        if entry is None or entry.user is None:
+            return
+        keys = self._keys_by_user.get(entry.user.id)
+        if keys is not None:
+            keys.discard(api_key)
+            if not keys:
+                del self._keys_by_user[entry.user.id]
+
+
+feed_cache = FeedPageCache(
+    max_entries=settings.FEED_CACHE_MAX_ENTRIES,
+    max_bytes=settings.FEED_CACHE_MAX_BYTES,
+    ttl=settings.FEED_CACHE_TTL,
+)
+
+api_key_cache = ApiKeyCache(
+    max_entries=settings.AUTH_CACHE_MAX_ENTRIES,
+    ttl=settings.AUTH_CACHE_TTL,
+    negative_ttl=settings.AUTH_CACHE_NEGATIVE_TTL,
+)
@@ -1,17 +1,112 @@
 import logging
+from functools import lru_cache
 from typing import TypeVar, Generic, Any
 
-from sqlalchemy import select, update, delete, and_, Result
+from sqlalchemy import (
+    Select,
+    select,
+    update,
+    delete,
+    Result,
+    tuple_,
+    literal,
+    any_,
+    bindparam,
+)
+from sqlalchemy.dialects.postgresql import ARRAY
 from sqlalchemy.exc import SQLAlchemyError
 
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from application.database import REPLICA_READ
+
 logger = logging.getLogger(__name__)
 
 T = TypeVar("T")
 
+# Виды условий _cached_select: поле = :значение, поле = ANY(:список), поле IS NULL
+EQUALS, ANY, IS_NULL = "=", "any", "null"
+
+
+def _filter_shape(filters: dict) -> tuple:
+    """Возвращает форму фильтров: пары (поле, вид условия), не зависящие от значений."""
+    return tuple(
+        (key, IS_NULL if value is None else ANY if isinstance(value, list) else EQUALS)
+        for key, value in filters.items()
+    )
+
+
+def _filter_params(filters: dict) -> dict:
+    """Возвращает значения связанных параметров для запроса _cached_select."""
+    return {key: value for key, value in filters.items() if value is not None}
+
+
+def _build_select(model, shape: tuple = (), order_by: tuple = ()) -> Select:
+    """
+    Строит запрос select(model) с условиями на связанные параметры.
+
+    Запросы без опций загрузки строятся один раз (см. _cached_select).
+    Списки сравниваются через = ANY(:массив), а не IN (...), чтобы SQL
+    не зависел от длины списка.
+
+    Аргументы:
+        model: Модель, экземпляры которой выбирает запрос.
+        shape (tuple): Форма фильтров (см. _filter_shape).
+        order_by (tuple): Имена полей для сортировки.
+    """
+    query = select(model)
+    for key, kind in shape:
+        column = getattr(model, key)
+        if kind == IS_NULL:
+            query = query.where(column.is_(None))
+        elif kind == ANY:
+            query = query.where(column == any_(bindparam(key, type_=ARRAY(column.type))))
+        else:
+            query = query.where(column == bindparam(key))
+    for field in order_by:
+        query = query.order_by(getattr(model, field))
+    return query
+
+
+# Значения фильтров передаются при выполнении (см. _filter_params), поэтому
+# один и тот же объект запроса используется во всех вызовах: SQLAlchemy
+# не строит дерево запроса заново и не пересчитывает его ключ кэша
+# компиляции, а SQL-строка не меняется, и asyncpg выполняет подготовленный
+# на сервере запрос повторно.
+_cached_select = lru_cache(maxsize=256)(_build_select)
+
+
+def _select(model, shape: tuple = (), order_by: tuple = (), options=None) -> Select:
+    """
+    Возвращает запрос для методов find_*: из кэша, если опций загрузки нет.
+
+    Опции (selectinload и т. п.) создаются при каждом вызове и не сравниваются
+    по значению, поэтому не могут входить в ключ кэша: запрос с опциями
+    строится заново, а кэшированный запрос не меняется.
+
+    Аргументы:
+        model: Модель, экземпляры которой выбирает запрос.
+        shape (tuple): Форма фильтров (см. _filter_shape).
+        order_by (tuple): Имена полей для сортировки.
+        options (list, optional): Опции загрузки связанных данных.
+    """
+    if options:
+        return _build_select(model, shape, order_by).options(*options)
+    return _cached_select(model, shape, order_by)
+
 
 class BaseDAO(Generic[T]):
+    """
+    Базовый DAO с общими запросами к модели.
+
+    Методы выполняют запросы в переданной сессии и не фиксируют транзакцию:
+    изменения отправляются в базу данных через flush, а фиксирует их
+    единица работы (см. application.unit_of_work.UnitOfWork), поэтому
+    вызовы нескольких DAO складываются в одну транзакцию запроса.
+    Методы find_* выполняются на реплике, если она настроена
+    (см. application.database.RoutingSession).
+    """
+
     model: T = None
 
     @classmethod
@@ -29,13 +124,12 @@ class BaseDAO(Generic[T]):
         Возвращает:
             Экземпляр модели или None, если ничего не найдено.
         """
-        logger.info("Создание запроса для поиска по ID")
-        query = select(cls.model).filter_by(id=data_id)
-        if options:
-            query = query.options(*options)  # Применяем опции к запросу
-        async with session:
-            result = await session.execute(query)
-        logger.info("Запрос выполнен")
+        logger.debug("Создание запроса для поиска по ID")
+        query = _select(cls.model, (("id", EQUALS),), options=options)
+        result = await session.execute(
+            query, {"id": data_id}, bind_arguments=REPLICA_READ
+        )
+        logger.debug("Запрос выполнен")
         return result.scalar_one_or_none()
 
     @classmethod
@@ -51,13 +145,12 @@ class BaseDAO(Generic[T]):
         Возвращает:
             Экземпляр модели или None, если ничего не найдено.
         """
-        logger.info("Создание запроса для поиска по критериям")
-        query = select(cls.model).filter_by(**filter_by)
-        if options:
-            query = query.options(*options)  # Применяем опции к запросу
-        async with session:
-            result: Result[tuple[Any]] = await session.execute(query)
-        logger.info("Запрос выполнен")
+        logger.debug("Создание запроса для поиска по критериям")
+        query = _select(cls.model, _filter_shape(filter_by), options=options)
+        result: Result[tuple[Any]] = await session.execute(
+            query, _filter_params(filter_by), bind_arguments=REPLICA_READ
+        )
+        logger.debug("Запрос выполнен")
         return result.scalar_one_or_none()
 
     @classmethod
@@ -82,33 +175,76 @@ class BaseDAO(Generic[T]):
         Возвращает:
             Список экземпляров модели.
         """
-        logger.info("Создание запроса для поиска всех экземпляров")
-        query = select(cls.model)
+        logger.debug("Создание запроса для поиска всех экземпляров")
+        filters = filters or {}
+        # Фильтры и сортировка входят в запрос, построенный один раз для их формы
+        query = _select(
+            cls.model, _filter_shape(filters), tuple(order_by or ()), options=options
+        )
 
         # Применяем соединения
         if joins:
             for join in joins:
                 query = query.outerjoin(join)  # Используем outerjoin для соединения
+        result = await session.execute(
+            query, _filter_params(filters), bind_arguments=REPLICA_READ
+        )
+        logger.debug("Запрос выполнен")
+        return result.scalars().all()
+
+    @classmethod
+    async def find_keyset_page(
+        cls,
+        session: AsyncSession,
+        keyset: tuple[str, ...],
+        limit: int,
+        after: tuple | None = None,
+        options=None,
+        filters: dict = None,
+    ):
+        """
+        Асинхронно возвращает одну страницу экземпляров модели, используя keyset-пагинацию.
+
+        Записи сортируются по убыванию полей keyset, а условие `(поля) < after`
+        позволяет базе данных продолжить чтение с нужного места по составному индексу,
+        не пересчитывая предыдущие страницы, как это происходит при OFFSET.
+
+        Аргументы:
+            session (AsyncSession): Асинхронная сессия SQLAlchemy.
+            keyset (tuple[str, ...]): Имена полей, однозначно задающих порядок записей.
+            limit (int): Максимальное количество записей на странице.
+            after (tuple, optional): Значения полей keyset последней записи предыдущей страницы.
+            options (list, optional): Дополнительные параметры для настройки запроса.
+            filters (dict, optional): Словарь фильтров для запроса.
+
+        Возвращает:
+            Список экземпляров модели.
+        """
+        logger.debug("Создание запроса для получения страницы по keyset")
+        columns = [getattr(cls.model, field) for field in keyset]
+        query = select(cls.model)
 
         if options:
             query = query.options(*options)  # Применяем опции к запросу
         if filters:
-            # Применяем фильтры к запросу
             for key, value in filters.items():
                 column = getattr(cls.model, key)
                 if isinstance(value, list):
-                    query = query.filter(
-                        column.in_(value)
-                    )  # Для списков используем in_
+                    query = query.filter(column.in_(value))
                 else:
-                    query = query.filter(column == value)  # Для одиночных значений
-        if order_by:
-            # Применяем сортировку к запросу
-            for field in order_by:
-                query = query.order_by(getattr(cls.model, field))
-        async with session:
-            result = await session.execute(query)
-        logger.info("Запрос выполнен")
+                    query = query.filter(column == value)
+        if after is not None:
+            # Сравнение строк (timestamp, id) < (:timestamp, :id) использует составной индекс
+            query = query.filter(
+                tuple_(*columns)
+                < tuple_(
+                    *[literal(value, column.type) for value, column in zip(after, columns)]
+                )
+            )
+        query = query.order_by(*[column.desc() for column in columns]).limit(limit)
+
+        result = await session.execute(query, bind_arguments=REPLICA_READ)
+        logger.debug("Запрос выполнен")
         return result.scalars().all()
 
     @classmethod
@@ -126,46 +262,19 @@ class BaseDAO(Generic[T]):
         Исключения:
             SQLAlchemyError: Если произошла ошибка при добавлении в базу данных.
         """
-        logger.info("Создание нового экземпляра модели")
+        logger.debug("Создание нового экземпляра модели")
 
         new_instance = cls.model(**values)
 
         try:
-            async with session.begin():
-                session.add(new_instance)
-                await session.commit()
-                logger.info("Новый экземпляр успешно создан")
-                return new_instance
+            session.add(new_instance)
+            await session.flush()
+            logger.debug("Новый экземпляр успешно создан")
+            return new_instance
         except SQLAlchemyError as e:
-            await session.rollback()
-            logger.error(f"Ошибка при создании нового экземпляра: {e}")
+            logger.error("Ошибка при создании нового экземпляра: %s", e)
             raise e
 
-    @classmethod
-    async def add_followers(
-        cls, session: AsyncSession, account_id: int, follower_id: int
-    ):
-        """
-        Асинхронно добавляет новую запись о подписке между пользователями.
-
-        :param session:
-        :param account_id: Идентификатор пользователя, автора.
-        :param follower_id: Идентификатор пользователя - подписчика.
-        """
-
-        # Проверяем существование записи
-        existing_follow = await cls.find_one_or_none(
-            account_id=account_id, follower_id=follower_id, session=session
-        )
-
-        if existing_follow:
-            raise Exception("Подписка уже существует")
-
-        async with session:
-            new_follow = cls.model(account_id=account_id, follower_id=follower_id)
-            session.add(new_follow)
-            await session.commit()
-
     @classmethod
     async def update(cls, session: AsyncSession, instance: T, **values):
         """
@@ -182,7 +291,7 @@ class BaseDAO(Generic[T]):
         Исключения:
             SQLAlchemyError: Если произошла ошибка при обновлении в базе данных.
         """
-        logger.info("Обновление экземпляра модели")
+        logger.debug("Обновление экземпляра модели")
 
         stmt = (
             update(cls.model)
@@ -191,14 +300,11 @@ class BaseDAO(Generic[T]):
         )
 
         try:
-            async with session:
-                await session.execute(stmt)  # Выполняем запрос на обновление
-                await session.commit()  # Сохраняем изменения в базе данных
-                logger.info("Экземпляр успешно обновлен")
-                return instance  # Возвращаем обновленный экземпляр
+            await session.execute(stmt)  # Выполняем запрос на обновление
+            logger.debug("Экземпляр успешно обновлен")
+            return instance  # Возвращаем обновленный экземпляр
         except SQLAlchemyError as e:
-            await session.rollback()  # Откатываем изменения в случае ошибки
-            logger.error(f"Ошибка при обновлении экземпляра: {e}")
+            logger.error("Ошибка при обновлении экземпляра: %s", e)
             raise e
 
     @classmethod
@@ -216,40 +322,14 @@ class BaseDAO(Generic[T]):
         Исключения:
             SQLAlchemyError: Если произошла ошибка при удалении из базы данных.
         """
-        logger.info("Удаление экземпляра модели")
+        logger.debug("Удаление экземпляра модели")
 
         query_smt = delete(cls.model).where(cls.model.id == instance.id)
 
         try:
-            async with session:
-                await session.execute(query_smt)  # Выполняем запрос на удаление
-                await session.commit()  # Сохраняем изменения в базе данных
-                logger.info("Экземпляр успешно удален")
-                return True  # Возвращаем True при успешном удалении
+            await session.execute(query_smt)  # Выполняем запрос на удаление
+            logger.debug("Экземпляр успешно удален")
+            return True  # Возвращаем True при успешном удалении
         except SQLAlchemyError as e:
-            await session.rollback()  # Откатываем изменения в случае ошибки
-            logger.error(f"Ошибка при удалении экземпляра: {e}")
+            logger.error("Ошибка при удалении экземпляра: %s", e)
             raise e
-
-    @classmethod
-    async def delete_followers(
-        cls, session: AsyncSession, account_id: int, follower_id: int
-    ):
-        """
-        Асинхронно удаляет запись о подписке между пользователями.
-
-        :param session:
-        :param follower_id: Идентификатор пользователя, который отписывается.
-        :param account_id: Идентификатор пользователя, от которого отписываются.
-        """
-        async with session:
-            async with session:
-                await session.execute(
-                    delete(cls.model).where(
-                        and_(
-                            cls.model.account_id == account_id,
-                            cls.model.follower_id == follower_id,
-                        )
-                    )
-                )
-                await session.commit()
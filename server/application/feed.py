@@ -0,0 +1,111 @@
+import logging
+from dataclasses import dataclass
+from typing import List
+
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
+
+from application.api.dependencies import LikeDAO
+from application.config import settings
+from application.models import Tweets
+from application.pagination import encode_cursor
+from application.serializers import feed_envelope, feed_page_to_bytes
+from application.timeline import TimelineDAO
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class RenderedFeedPage:
+    """
+    Сериализованная страница ленты.
+
+    Атрибуты:
+        body (bytes): Готовое тело ответа `{"result": true, "tweets": [...], "next_cursor": ...}`.
+        tweet_ids (List[int]): Идентификаторы твитов страницы (для инвалидации кэша).
+    """
+
+    body: bytes
+    tweet_ids: List[int]
+
+
+async def render_feed_page_orm(
+    session: AsyncSession, user_id: int, limit: int, after: tuple | None
+) -> RenderedFeedPage:
+    """
+    Собирает страницу ленты через ORM: запрос страницы, selectinload автора и вложений,
+    выборка лайков и сериализация объектов ORM сразу в байты (feed_page_to_bytes).
+    """
+    # Запрашиваем на один твит больше, чтобы понять, есть ли следующая страница
+    page = await TimelineDAO.find_feed_page(
+        session=session,
+        user_id=user_id,
+        limit=limit + 1,
+        after=after,
+        options=[
+            selectinload(Tweets.author),  # Подгружаем автора твита
+            selectinload(Tweets.attachments),  # Подгружаем медиафайлы твита
+        ],
+    )
+
+    next_cursor = None
+    if len(page) > limit:
+        page = page[:limit]
+        next_cursor = encode_cursor(page[-1].timestamp, page[-1].id)
+
+    # Вместо всех лайков подгружаем только последние, счетчик хранится в like_count
+    likers = await LikeDAO.find_likers_sample(
+        session=session,
+        tweet_ids=[tweet.id for tweet in page],
+        viewer_id=user_id,
+        sample_size=settings.FEED_LIKES_SAMPLE_SIZE,
+    )
+
+    return RenderedFeedPage(
+        body=feed_page_to_bytes(page, likers, next_cursor),
+        tweet_ids=[tweet.id for tweet in page],
+    )
+
+
+async def render_feed_page_sql(
+    session: AsyncSession, user_id: int, limit: int, after: tuple | None
+) -> RenderedFeedPage:
+    """
+    Собирает страницу ленты одним SQL-запросом: Postgres возвращает готовый
+    JSON-массив твитов, который передается клиенту без разбора.
+    """
+    page = await TimelineDAO.find_feed_page_json(
+        session=session,
+        user_id=user_id,
+        limit=limit,
+        after=after,
+        likes_sample_size=settings.FEED_LIKES_SAMPLE_SIZE,
+    )
+    next_cursor = encode_cursor(*page.next_after) if page.next_after else None
+    return RenderedFeedPage(
+        body=feed_envelope(page.tweets_json.encode(), next_cursor),
+        tweet_ids=page.tweet_ids,
+    )
+
+
+FEED_ENGINES = {
+    "orm": render_feed_page_orm,
+    "sql": render_feed_page_sql,
+}
+
+
+async def render_feed_page(
+    session: AsyncSession, user_id: int, limit: int, after: tuple | None
+) -> RenderedFeedPage:
+    """
+    Собирает страницу ленты движком, выбранным в настройке FEED_ENGINE ("orm" или "sql").
+
+    :param session: Асинхронная сессия SQLAlchemy.
+    :param user_id: Идентификатор владельца ленты.
+    :param limit: Количество твитов на странице.
+    :param after: Пара (timestamp, tweet_id) последнего твита предыдущей страницы.
+    :return: RenderedFeedPage с готовым телом ответа.
+    """
+    engine = FEED_ENGINES[settings.FEED_ENGINE]
+    logger.debug("Сборка страницы ленты движком %s", settings.FEED_ENGINE)
+    return await engine(session, user_id, limit, after)
@@ -0,0 +1,120 @@
+"""
+Настройка журнала приложения.
+
+Модули только получают свои логгеры (logging.getLogger(__name__)) и пишут
+в них с отложенным форматированием (logger.debug("... %s", value)), а обработчики
+настраиваются здесь один раз при запуске приложения или скрипта.
+
+Логгеры передают записи в QueueHandler, который только кладет их в очередь,
+а форматирует и выводит записи QueueListener в отдельном потоке, поэтому
+вывод журнала не блокирует цикл событий. Записи уровня INFO и ниже
+прореживаются (settings.LOG_SAMPLE_RATE), предупреждения и ошибки
+записываются всегда.
+"""
+
+import atexit
+import logging
+import queue
+import random
+import sys
+from logging.handlers import QueueHandler, QueueListener
+from typing import IO, Optional
+
+import orjson
+
+from application.config import settings
+
+TEXT_FORMAT = "%(asctime)s %(levelname)s %(name)s: %(message)s"
+
+_listener: Optional[QueueListener] = None
+
+
+class JsonFormatter(logging.Formatter):
+    """Форматирует запись журнала в одну строку JSON."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        return orjson.dumps(entry).decode()
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Пропускает долю rate записей уровня INFO и ниже; предупреждения и ошибки пропускает всегда.
+
+    Аргументы:
+        rate (float): Доля пропускаемых записей, от 0 до 1.
+    """
+
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        return (
+            record.levelno >= logging.WARNING
+            or self.rate >= 1
+            or random.random() < self.rate
+        )
+
+
+def configure_logging(
+    level: Optional[str] = None,
+    fmt: Optional[str] = None,
+    sample_rate: Optional[float] = None,
+    stream: Optional[IO] = None,
+) -> QueueListener:
+    """
+    Настраивает корневой логгер: очередь, фоновый вывод, уровень, формат и прореживание.
+
+    Повторный вызов ничего не меняет, пока журнал не остановлен через stop_logging.
+    Параметры по умолчанию берутся из настроек LOG_*.
+
+    Аргументы:
+        level (str, optional): Уровень журнала.
+        fmt (str, optional): Формат записей: "text" или "json".
+        sample_rate (float, optional): Доля записей уровня INFO и ниже, попадающих в журнал.
+        stream (IO, optional): Поток вывода (по умолчанию stderr).
+
+    Возвращает:
+        QueueListener, выводящий записи журнала.
+    """
+    global _listener
+    if _listener is not None:
+        return _listener
+
+    fmt = fmt or settings.LOG_FORMAT
+    output = logging.StreamHandler(stream or sys.stderr)
+    output.setFormatter(JsonFormatter() if fmt == "json" else logging.Formatter(TEXT_FORMAT))
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = QueueHandler(log_queue)
+    rate = settings.LOG_SAMPLE_RATE if sample_rate is None else sample_rate
+    queue_handler.addFilter(SamplingFilter(rate))
+
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(level or settings.LOG_LEVEL)
+
+    _listener = QueueListener(log_queue, output)
+    _listener.start()
+    atexit.register(stop_logging)
+    return _listener
+
+
+def stop_logging():
+    """Выводит оставшиеся в очереди записи и останавливает поток журнала."""
+    global _listener
+    if _listener is None:
+        return
+    _listener.stop()
+    _listener = None
+    atexit.unregister(stop_logging)
@@ -1,37 +1,58 @@
+import asyncio
 import logging
-from contextlib import asynccontextmanager
+from contextlib import asynccontextmanager, suppress
 
 from fastapi import FastAPI, HTTPException, Request
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, PlainTextResponse
 from sqlalchemy.orm import selectinload
 
+from application import media_gc
+from application.config import settings
 from application.database import AsyncSessionApp, proj_engine
+from application.logging_config import configure_logging, stop_logging
+from application.metrics import MetricsMiddleware, metrics_allowed, render_metrics
 from application.models import BaseProj, Users
 from application.api.tweets_routes import tweets_router
 from application.api.medias_routes import medias_router
 from application.api.users_routes import users_router
+from application.uploads import UploadSizeLimitMiddleware
 from application.utils import add_test_information
+from application.variants import variant_pipeline
 
-logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-
+    configure_logging()
     logger.info("Соединение с базой данных lifespan")
     async with proj_engine.begin() as conn:
         await conn.run_sync(BaseProj.metadata.create_all)
         logger.info("Создание таблиц, если необходимо, lifespan")
     async with AsyncSessionApp() as session:
         await add_test_information(session)
+
+    media_gc_task = None
+    if settings.MEDIA_GC_INTERVAL > 0:
+        # Брошенные загрузки удаляются в фоне, см. application.media_gc
+        media_gc_task = asyncio.create_task(media_gc.run_periodically(settings.MEDIA_GC_INTERVAL))
     yield
 
+    if media_gc_task is not None:
+        media_gc_task.cancel()
+        with suppress(asyncio.CancelledError):
+            await media_gc_task
     logger.info("Закрытие всех соединений и освобождение ресурсов б/д lifespan")
     await proj_engine.dispose()
+    await asyncio.to_thread(variant_pipeline.shutdown)
+    stop_logging()
 
 
 app_proj = FastAPI(lifespan=lifespan)
+# Слишком большие загрузки отклоняются по Content-Length до разбора тела запроса
+app_proj.add_middleware(UploadSizeLimitMiddleware, paths=["/api/medias"])
+# Добавлен последним, поэтому внешний: учитывает и отклоненные загрузки
+app_proj.add_middleware(MetricsMiddleware)
 
 app_proj.include_router(users_router)
 app_proj.include_router(tweets_router)
@@ -68,6 +89,22 @@ async def general_exception_handler(request: Request, exc: Exception):
     )
 
 
+@app_proj.get("/metrics", include_in_schema=False)
+async def metrics(request: Request):
+    """
+    Метрики приложения в текстовом формате Prometheus (см. application.metrics).
+
+    Доступны только с адресов из METRICS_ALLOWED_NETWORKS, остальным отвечает 404.
+
+    curl -i GET "http://localhost:5000/metrics"
+    """
+    if not metrics_allowed(request.client.host if request.client else None):
+        raise HTTPException(status_code=404, detail="Not Found")
+    return PlainTextResponse(
+        render_metrics(), media_type="text/plain; version=0.0.4; charset=utf-8"
+    )
+
+
 @app_proj.get("/welcome")
 async def hello():
     """
@@ -0,0 +1,155 @@
+"""
+Сборщик мусора медиафайлов: удаляет загрузки, так и не прикрепленные к твиту.
+
+add_media создает запись media без твита; если твит с этим медиафайлом не был
+опубликован за MEDIA_GC_MAX_AGE секунд, запись удаляется вместе с вариантами,
+а блобы, на которые не осталось ссылок, — из хранилища. Заодно удаляются
+временные файлы прерванных загрузок.
+
+Сборщик запускается в фоне приложения каждые MEDIA_GC_INTERVAL секунд
+(см. lifespan в application.main) и вручную (из каталога server):
+    python -m application.media_gc --database-url postgresql+asyncpg://... --max-age 86400
+"""
+
+import argparse
+import asyncio
+import logging
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from application.api.dependencies import MediaBlobDAO, MediaDAO
+from application.config import settings
+from application.database import AsyncSessionApp, create_app_engine
+from application.logging_config import configure_logging
+from application.storage import MediaStorage, create_media_storage, media_storage
+from application.unit_of_work import UnitOfWork
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class MediaGCReport:
+    """
+    Результат сборки мусора.
+
+    Атрибуты:
+        media_deleted (int): Удалено неприкрепленных медиафайлов.
+        media_bytes (int): Их суммарный размер в байтах.
+        blobs_released (int): Удалено блобов, на которые не осталось ссылок.
+        staged_removed (int): Удалено временных файлов прерванных загрузок.
+        staged_bytes (int): Их суммарный размер в байтах.
+    """
+
+    media_deleted: int = 0
+    media_bytes: int = 0
+    blobs_released: int = 0
+    staged_removed: int = 0
+    staged_bytes: int = 0
+
+
+async def collect_orphan_media(
+    session: AsyncSession,
+    storage: MediaStorage,
+    max_age: float,
+    batch_size: int,
+) -> MediaGCReport:
+    """
+    Удаляет неприкрепленные медиафайлы старше max_age секунд и освобождает их блобы.
+
+    Каждая пачка из batch_size медиафайлов удаляется в своей единице работы,
+    поэтому сборщик не держит долгих блокировок.
+
+    Аргументы:
+        session (AsyncSession): Асинхронная сессия SQLAlchemy.
+        storage (MediaStorage): Хранилище медиафайлов.
+        max_age (float): Возраст загрузки в секундах, после которого она считается брошенной.
+        batch_size (int): Количество медиафайлов в пачке.
+    """
+    report = MediaGCReport()
+    uploaded_before = datetime.now(timezone.utc) - timedelta(seconds=max_age)
+    while True:
+        async with UnitOfWork(session):
+            deleted = await MediaDAO.delete_orphans(session, uploaded_before, batch_size)
+        report.media_deleted += len(deleted)
+        report.media_bytes += sum(size or 0 for _, size in deleted)
+        if len(deleted) < batch_size:
+            break
+
+    report.blobs_released = await MediaBlobDAO.release_unreferenced(
+        session, storage, batch_size
+    )
+    report.staged_removed, report.staged_bytes = await storage.remove_stale_staged(max_age)
+    logger.info("Сборка мусора медиафайлов завершена: %s", report)
+    return report
+
+
+async def release_unreferenced_blobs(
+    session_factory: async_sessionmaker, storage: MediaStorage = media_storage
+) -> int:
+    """
+    Освобождает блобы без ссылок в собственной сессии (фоновая задача маршрутов).
+
+    Аргументы:
+        session_factory (async_sessionmaker): Фабрика сессий (см. get_session_factory).
+        storage (MediaStorage): Хранилище медиафайлов.
+
+    Возвращает:
+        Количество удаленных блобов.
+    """
+    async with session_factory() as session:
+        return await MediaBlobDAO.release_unreferenced(session, storage)
+
+
+async def run_periodically(interval: float):
+    """
+    Запускает сборку мусора каждые interval секунд (фоновая задача приложения).
+
+    Ошибка одного запуска записывается в журнал и не останавливает следующие.
+    """
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            async with AsyncSessionApp() as session:
+                await collect_orphan_media(
+                    session,
+                    media_storage,
+                    max_age=settings.MEDIA_GC_MAX_AGE,
+                    batch_size=settings.MEDIA_GC_BATCH_SIZE,
+                )
+        except Exception as e:
+            logger.error("Ошибка сборки мусора медиафайлов: %s", e)
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument(
+        "--database-url",
+        default=settings.DATABASE_URL,
+    )
+    parser.add_argument(
+        "--max-age",
+        type=float,
+        default=settings.MEDIA_GC_MAX_AGE,
+        help="возраст неприкрепленной загрузки в секундах",
+    )
+    parser.add_argument("--batch-size", type=int, default=settings.MEDIA_GC_BATCH_SIZE)
+    args = parser.parse_args()
+    configure_logging()
+
+    engine = create_app_engine(args.database_url)
+    async with async_sessionmaker(engine, expire_on_commit=False)() as session:
+        report = await collect_orphan_media(
+            session, create_media_storage(), args.max_age, args.batch_size
+        )
+    await engine.dispose()
+    print(
+        f"Удалено медиафайлов: {report.media_deleted} ({report.media_bytes} байт), "
+        f"освобождено блобов: {report.blobs_released}, "
+        f"временных файлов: {report.staged_removed} ({report.staged_bytes} байт)"
+    )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,260 @@
+"""
+Перенос содержимого медиафайлов из столбца media.file_body в хранилище блобов.
+
+Порядок обновления:
+    1. alembic upgrade e7b2c9d4a618 — добавляет столбец media.blob_key,
+       приложение продолжает работать со старыми записями;
+    2. python -m application.media_migration — переносит file_body в хранилище
+       пачками, каждая пачка в своей транзакции, без остановки приложения;
+    3. alembic upgrade head — удаляет media.file_body; ревизия f3a91c5e7d24
+       останавливается, если перенесено не все (тогда повторите шаг 2).
+
+При откате ниже f3a91c5e7d24 столбец media.file_body возвращается пустым,
+а содержимое в него записывает запуск с параметром --restore.
+
+После alembic upgrade a6c3e8f1b925 тот же запуск заполняет метаданные
+изображений (mime_type, width, height, size) у записей, созданных до их
+появления (см. fill_media_metadata).
+
+Запуск (из каталога server):
+    python -m application.media_migration --database-url postgresql+asyncpg://... --batch-size 200
+    python -m application.media_migration --restore
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+from typing import Callable, Optional
+
+import sqlalchemy as sa
+from sqlalchemy.engine import Connection
+
+from application.config import settings
+from application.database import create_app_engine
+from application.logging_config import configure_logging
+from application.storage import FileSystemMediaStorage
+from application.uploads import read_image_metadata
+
+logger = logging.getLogger(__name__)
+
+# Таблица описана отдельно от модели Media: в модели столбца file_body уже нет
+media_table = sa.table(
+    "media",
+    sa.column("id", sa.Integer),
+    sa.column("file_body", sa.LargeBinary),
+    sa.column("blob_key", sa.String),
+    sa.column("mime_type", sa.String),
+    sa.column("width", sa.Integer),
+    sa.column("height", sa.Integer),
+    sa.column("size", sa.Integer),
+)
+
+
+def move_file_bodies(
+    connection: Connection,
+    storage: FileSystemMediaStorage,
+    batch_size: int = 100,
+    on_batch: Optional[Callable[[Connection], None]] = None,
+) -> int:
+    """
+    Переносит содержимое media.file_body в хранилище и записывает ключи в media.blob_key.
+
+    Блоб записывается до обновления строки, поэтому прерванный перенос можно
+    запустить повторно: уже перенесенные строки (blob_key заполнен) пропускаются,
+    а повторная запись того же содержимого не создает копию.
+
+    Аргументы:
+        connection (Connection): Синхронное соединение с базой данных.
+        storage (FileSystemMediaStorage): Хранилище блобов.
+        batch_size (int): Количество строк в пачке.
+        on_batch (Callable, optional): Вызывается после каждой пачки (например, для фиксации транзакции).
+
+    Возвращает:
+        Количество перенесенных строк.
+    """
+    moved = 0
+    while True:
+        rows = connection.execute(
+            sa.select(media_table.c.id, media_table.c.file_body)
+            .where(media_table.c.blob_key.is_(None))
+            .order_by(media_table.c.id)
+            .limit(batch_size)
+        ).all()
+        if not rows:
+            return moved
+
+        keys = [
+            {"media_id": media_id, "key": storage.write_blob(file_body or b"")}
+            for media_id, file_body in rows
+        ]
+        connection.execute(
+            sa.update(media_table)
+            .where(media_table.c.id == sa.bindparam("media_id"))
+            .values(blob_key=sa.bindparam("key"), file_body=None),
+            keys,
+        )
+        moved += len(rows)
+        logger.info("Перенесено медиафайлов: %s", moved)
+        if on_batch is not None:
+            on_batch(connection)
+
+
+def restore_file_bodies(
+    connection: Connection, storage: FileSystemMediaStorage, batch_size: int = 100
+) -> int:
+    """
+    Возвращает содержимое блобов в media.file_body (для отката миграции).
+
+    Возвращает:
+        Количество восстановленных строк.
+    """
+    restored = 0
+    last_id = 0
+    while True:
+        rows = connection.execute(
+            sa.select(media_table.c.id, media_table.c.blob_key)
+            .where(media_table.c.id > last_id, media_table.c.file_body.is_(None))
+            .order_by(media_table.c.id)
+            .limit(batch_size)
+        ).all()
+        if not rows:
+            return restored
+
+        connection.execute(
+            sa.update(media_table)
+            .where(media_table.c.id == sa.bindparam("media_id"))
+            .values(file_body=sa.bindparam("body")),
+            [
+                {"media_id": media_id, "body": storage.read_blob(key)}
+                for media_id, key in rows
+            ],
+        )
+        restored += len(rows)
+        last_id = rows[-1].id
+
+
+def fill_media_metadata(
+    connection: Connection,
+    storage: FileSystemMediaStorage,
+    batch_size: int = 100,
+    on_batch: Optional[Callable[[Connection], None]] = None,
+) -> int:
+    """
+    Заполняет метаданные изображений у записей media, где они не заполнены.
+
+    Записи, блоб которых отсутствует или не является изображением, пропускаются
+    и остаются без метаданных (маршрут получения медиа определяет их тип по началу файла).
+
+    Аргументы:
+        connection (Connection): Синхронное соединение с базой данных.
+        storage (FileSystemMediaStorage): Хранилище блобов.
+        batch_size (int): Количество строк в пачке.
+        on_batch (Callable, optional): Вызывается после каждой пачки.
+
+    Возвращает:
+        Количество записей, у которых заполнены метаданные.
+    """
+    filled = 0
+    last_id = 0
+    while True:
+        rows = connection.execute(
+            sa.select(media_table.c.id, media_table.c.blob_key)
+            .where(media_table.c.id > last_id, media_table.c.mime_type.is_(None))
+            .order_by(media_table.c.id)
+            .limit(batch_size)
+        ).all()
+        if not rows:
+            return filled
+        last_id = rows[-1].id
+
+        values = []
+        for media_id, blob_key in rows:
+            path = storage.path(blob_key)
+            try:
+                metadata = read_image_metadata(path)
+                size = os.path.getsize(path)
+            except (ValueError, OSError) as e:
+                logger.warning("Метаданные медиафайла %s не определены: %s", media_id, e)
+                continue
+            values.append(
+                {
+                    "media_id": media_id,
+                    "mime_type": metadata.mime_type,
+                    "width": metadata.width,
+                    "height": metadata.height,
+                    "blob_size": size,
+                }
+            )
+        if values:
+            connection.execute(
+                sa.update(media_table)
+                .where(media_table.c.id == sa.bindparam("media_id"))
+                .values(
+                    mime_type=sa.bindparam("mime_type"),
+                    width=sa.bindparam("width"),
+                    height=sa.bindparam("height"),
+                    size=sa.bindparam("blob_size"),
+                ),
+                values,
+            )
+        filled += len(values)
+        logger.info("Заполнены метаданные медиафайлов: %s", filled)
+        if on_batch is not None:
+            on_batch(connection)
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument(
+        "--database-url",
+        default=settings.DATABASE_URL,
+    )
+    parser.add_argument("--media-root", default=settings.MEDIA_ROOT)
+    parser.add_argument("--batch-size", type=int, default=100)
+    parser.add_argument(
+        "--restore",
+        action="store_true",
+        help="вернуть содержимое блобов в media.file_body (после отката миграции)",
+    )
+    args = parser.parse_args()
+    configure_logging()
+
+    engine = create_app_engine(args.database_url)
+    storage = FileSystemMediaStorage(root=args.media_root)
+
+    def commit(sync_connection: Connection):
+        sync_connection.commit()
+
+    def media_columns(sync_connection: Connection) -> set:
+        return {column["name"] for column in sa.inspect(sync_connection).get_columns("media")}
+
+    if args.restore:
+        async with engine.begin() as connection:
+            restored = await connection.run_sync(
+                restore_file_bodies, storage, args.batch_size
+            )
+        await engine.dispose()
+        logger.info("Восстановлено содержимое медиафайлов: %s", restored)
+        return
+
+    async with engine.connect() as connection:
+        # Набор шагов зависит от ревизии схемы, на которой запущен перенос
+        columns = await connection.run_sync(media_columns)
+        moved = filled = 0
+        if "file_body" in columns:
+            moved = await connection.run_sync(
+                move_file_bodies, storage, args.batch_size, commit
+            )
+        if "mime_type" in columns:
+            filled = await connection.run_sync(
+                fill_media_metadata, storage, args.batch_size, commit
+            )
+    await engine.dispose()
+    logger.info(
+        "Перенос завершен, перенесено: %s, заполнены метаданные: %s", moved, filled
+    )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
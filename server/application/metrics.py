@@ -0,0 +1,303 @@
+"""
+Метрики приложения в текстовом формате Prometheus (маршрут /metrics).
+
+MetricsMiddleware считает запросы, их длительность и коды ответа по шаблонам
+маршрутов ("/api/tweets/{tweet_id}", а не конкретным путям), а обработчики
+событий Engine — запросы к базе данных и время их выполнения, в том числе
+в пересчете на маршрут. Счетчики хранятся в памяти процесса, как кэши,
+и обновляются без блокировок: приложение работает в одном потоке цикла событий.
+"""
+
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from functools import lru_cache
+from ipaddress import ip_address, ip_network
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from application.cache import api_key_cache, feed_cache
+from application.config import settings
+from application.database import pool_stats
+from application.variants import variant_pipeline
+
+# Границы корзин гистограммы длительности запросов, в секундах
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Метка маршрута для запросов, не попавших ни в один маршрут API
+UNMATCHED_ROUTE = "unmatched"
+
+RouteKey = Tuple[str, str]
+
+
+class Histogram:
+    """Гистограмма с фиксированными корзинами: число наблюдений в каждой, сумма и количество."""
+
+    def __init__(self, buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # Последняя корзина — +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class RequestDbUsage:
+    """Запросы к базе данных, выполненные при обработке одного HTTP-запроса."""
+
+    __slots__ = ("queries", "seconds")
+
+    def __init__(self):
+        self.queries = 0
+        self.seconds = 0.0
+
+
+# Учет запросов к базе данных текущего HTTP-запроса (см. MetricsMiddleware)
+_request_db_usage: ContextVar[Optional[RequestDbUsage]] = ContextVar(
+    "request_db_usage", default=None
+)
+
+
+class AppMetrics:
+    """
+    Счетчики HTTP-запросов и запросов к базе данных.
+
+    Атрибуты:
+        in_flight (int): Сколько HTTP-запросов обрабатывается сейчас.
+        db_queries (int): Сколько запросов выполнено в базе данных (включая фоновые задачи).
+        db_seconds (float): Суммарное время их выполнения, в секундах.
+    """
+
+    def __init__(self):
+        self.in_flight = 0
+        self.requests: Dict[Tuple[str, str, int], int] = {}
+        self.latency: Dict[RouteKey, Histogram] = {}
+        self.route_db_queries: Dict[RouteKey, int] = {}
+        self.route_db_seconds: Dict[RouteKey, float] = {}
+        self.db_queries = 0
+        self.db_seconds = 0.0
+
+    def observe_request(
+        self, method: str, route: str, status: int, seconds: float, db: RequestDbUsage
+    ):
+        """Учитывает обработанный HTTP-запрос."""
+        key = (method, route)
+        status_key = (method, route, status)
+        self.requests[status_key] = self.requests.get(status_key, 0) + 1
+        histogram = self.latency.get(key)
+        if histogram is None:
+            histogram = self.latency[key] = Histogram()
+        histogram.observe(seconds)
+        self.route_db_queries[key] = self.route_db_queries.get(key, 0) + db.queries
+        self.route_db_seconds[key] = self.route_db_seconds.get(key, 0.0) + db.seconds
+
+    def observe_query(self, seconds: float):
+        """Учитывает выполненный запрос к базе данных."""
+        self.db_queries += 1
+        self.db_seconds += seconds
+        usage = _request_db_usage.get()
+        if usage is not None:
+            usage.queries += 1
+            usage.seconds += seconds
+
+
+app_metrics = AppMetrics()
+
+
+# Обработчики подключены ко всем движкам (основной сервер, реплика, скрипты);
+# запрос, завершившийся ошибкой, не учитывается
+@event.listens_for(Engine, "before_cursor_execute")
+def _start_query_timer(conn, cursor, statement, parameters, context, executemany):
+    context.metrics_started = time.perf_counter()
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _stop_query_timer(conn, cursor, statement, parameters, context, executemany):
+    app_metrics.observe_query(time.perf_counter() - context.metrics_started)
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware, учитывающий HTTP-запросы в app_metrics.
+
+    Запрос относится к шаблону пути маршрута, который FastAPI записывает
+    в scope["route"]; запросы без маршрута (404, служебные страницы)
+    учитываются под меткой UNMATCHED_ROUTE, чтобы число рядов не росло
+    с числом различных путей. Если приложение выбросило исключение
+    до начала ответа, запрос учитывается с кодом 500.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        usage = RequestDbUsage()
+        token = _request_db_usage.set(usage)
+        app_metrics.in_flight += 1
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - started
+            app_metrics.in_flight -= 1
+            _request_db_usage.reset(token)
+            route = scope.get("route")
+            app_metrics.observe_request(
+                scope["method"],
+                getattr(route, "path", UNMATCHED_ROUTE),
+                status,
+                elapsed,
+                usage,
+            )
+
+
+@lru_cache(maxsize=8)
+def _allowed_networks(networks: Tuple[str, ...]) -> tuple:
+    return tuple(ip_network(network, strict=False) for network in networks)
+
+
+def metrics_allowed(host: Optional[str]) -> bool:
+    """
+    Проверяет, что адрес клиента входит в сети METRICS_ALLOWED_NETWORKS.
+
+    Метрики раскрывают маршруты, нагрузку и состояние пула соединений, поэтому
+    отдаются только сборщику метрик, а не любому клиенту публичного порта.
+
+    Аргументы:
+        host (str, optional): Адрес клиента (request.client.host).
+    """
+    if not host:
+        return False
+    try:
+        address = ip_address(host)
+    except ValueError:
+        return False
+    return any(
+        address in network
+        for network in _allowed_networks(settings.METRICS_ALLOWED_NETWORKS)
+    )
+
+
+def _label_value(value) -> str:
+    """Экранирует значение метки по текстовому формату Prometheus: \\, \" и перевод строки."""
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(**labels) -> str:
+    return (
+        "{"
+        + ",".join(f'{name}="{_label_value(value)}"' for name, value in labels.items())
+        + "}"
+    )
+
+
+def _metric(lines: List[str], name: str, kind: str, help_text: str):
+    lines.append(f"# HELP {name} {help_text}")
+    lines.append(f"# TYPE {name} {kind}")
+
+
+def _stats_lines(
+    lines: List[str], prefix: str, stats: Dict[str, float], counters: Iterable[str]
+):
+    """
+    Добавляет значения stats() компонента с префиксом prefix.
+
+    Ключи из counters выводятся как counter с суффиксом _total, остальные — как gauge.
+    """
+    counters = set(counters)
+    for key, value in stats.items():
+        if key in counters:
+            name = f"{prefix}_{key}_total"
+            _metric(lines, name, "counter", f"{prefix} {key}")
+        else:
+            name = f"{prefix}_{key}"
+            _metric(lines, name, "gauge", f"{prefix} {key}")
+        lines.append(f"{name} {value}")
+
+
+def render_metrics(metrics: AppMetrics = app_metrics) -> str:
+    """Возвращает все метрики в текстовом формате Prometheus (version 0.0.4)."""
+    lines: List[str] = []
+
+    _metric(lines, "http_requests_total", "counter", "HTTP-запросы по маршруту и коду ответа")
+    for (method, route, status), count in metrics.requests.items():
+        lines.append(
+            f"http_requests_total{_labels(method=method, route=route, status=status)} {count}"
+        )
+
+    _metric(lines, "http_requests_in_flight", "gauge", "HTTP-запросы в обработке")
+    lines.append(f"http_requests_in_flight {metrics.in_flight}")
+
+    _metric(
+        lines, "http_request_duration_seconds", "histogram", "Длительность HTTP-запросов"
+    )
+    for (method, route), histogram in metrics.latency.items():
+        cumulative = 0
+        for bound, count in zip(histogram.buckets + ("+Inf",), histogram.counts):
+            cumulative += count
+            labels = _labels(method=method, route=route, le=bound)
+            lines.append(f"http_request_duration_seconds_bucket{labels} {cumulative}")
+        labels = _labels(method=method, route=route)
+        lines.append(f"http_request_duration_seconds_sum{labels} {histogram.sum}")
+        lines.append(f"http_request_duration_seconds_count{labels} {histogram.count}")
+
+    _metric(
+        lines,
+        "http_request_db_queries_total",
+        "counter",
+        "Запросы к базе данных при обработке HTTP-запросов",
+    )
+    for (method, route), count in metrics.route_db_queries.items():
+        lines.append(
+            f"http_request_db_queries_total{_labels(method=method, route=route)} {count}"
+        )
+    _metric(
+        lines,
+        "http_request_db_seconds_total",
+        "counter",
+        "Время запросов к базе данных при обработке HTTP-запросов",
+    )
+    for (method, route), seconds in metrics.route_db_seconds.items():
+        lines.append(
+            f"http_request_db_seconds_total{_labels(method=method, route=route)} {seconds}"
+        )
+
+    _metric(lines, "db_queries_total", "counter", "Запросы к базе данных")
+    lines.append(f"db_queries_total {metrics.db_queries}")
+    _metric(lines, "db_query_seconds_total", "counter", "Время запросов к базе данных")
+    lines.append(f"db_query_seconds_total {metrics.db_seconds}")
+
+    _stats_lines(
+        lines,
+        "db_pool",
+        pool_stats(),
+        ("checkouts", "checkout_seconds", "overflow_created", "timeouts"),
+    )
+    _stats_lines(
+        lines,
+        "feed_cache",
+        feed_cache.stats(),
+        ("hits", "misses", "evictions", "invalidations"),
+    )
+    _stats_lines(lines, "api_key_cache", api_key_cache.stats(), ("hits", "misses"))
+    _stats_lines(
+        lines, "media_variants", variant_pipeline.stats(), ("rendered", "rejected")
+    )
+    return "\n".join(lines) + "\n"
@@ -1,10 +1,41 @@
 from datetime import datetime
-from typing import List, Dict, Any
-
-from sqlalchemy import Integer, ForeignKey, String, DateTime, func, LargeBinary
+from typing import List, Dict, Any, Optional
+
+from sqlalchemy import (
+    Integer,
+    ForeignKey,
+    String,
+    DateTime,
+    func,
+    Index,
+    Boolean,
+    UniqueConstraint,
+    DDL,
+    event,
+    text as sql_text,
+)
 from sqlalchemy.ext.asyncio import AsyncAttrs
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, relationship
 
+from application.config import settings
+
+
+def attachment_url_suffix() -> str:
+    """
+    Возвращает окончание ссылки на вложение твита.
+
+    Если задана настройка MEDIA_ATTACHMENT_WIDTH, вложения ссылаются на вариант
+    изображения этой ширины (`?w=480`), иначе — на оригинал.
+    """
+    if settings.MEDIA_ATTACHMENT_WIDTH > 0:
+        return f"?w={settings.MEDIA_ATTACHMENT_WIDTH}"
+    return ""
+
+
+def attachment_url(media_id: int) -> str:
+    """Возвращает ссылку на вложение твита, см. attachment_url_suffix."""
+    return f"/api/media/{media_id}{attachment_url_suffix()}"
+
 
 class BaseProj(AsyncAttrs, DeclarativeBase):
     pass
@@ -18,6 +49,10 @@ class Followers(BaseProj):
     """
 
     __tablename__ = "followers"
+    __table_args__ = (
+        # Поиск подписок пользователя (лента, профиль) идет по follower_id
+        Index("ix_followers_follower_id", "follower_id"),
+    )
 
     account_id: Mapped[int] = mapped_column(
         Integer, ForeignKey("users.id"), primary_key=True
@@ -92,6 +127,10 @@ class Tweets(BaseProj):
     text: текст твита.
     timestamp: время создания твита (по умолчанию текущее время).
     author_id: идентификатор автора твита (внешний ключ).
+    like_count: количество лайков, поддерживается при добавлении и удалении лайка.
+    fanned_out: был ли твит разослан в ленты подписчиков при публикации.
+        Твиты авторов с большим числом подписчиков не рассылаются,
+        а подмешиваются в ленту при чтении.
     Связи:
     author: связь с моделью пользователей.
     likes: связь с моделью лайков.
@@ -100,6 +139,18 @@ class Tweets(BaseProj):
     """
 
     __tablename__ = "tweets"
+    __table_args__ = (
+        # Составной индекс для keyset-пагинации ленты: ORDER BY timestamp DESC, id DESC
+        Index("ix_tweets_timestamp_id", "timestamp", "id"),
+        # Частичный индекс для подмешивания в ленту нерасосланных твитов популярных авторов
+        Index(
+            "ix_tweets_author_pull",
+            "author_id",
+            "timestamp",
+            "id",
+            postgresql_where=sql_text("NOT fanned_out"),
+        ),
+    )
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True, index=True)
     text: Mapped[str] = mapped_column(String)
@@ -109,6 +160,12 @@ class Tweets(BaseProj):
     author_id: Mapped[int] = mapped_column(
         Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False
     )
+    like_count: Mapped[int] = mapped_column(
+        Integer, nullable=False, default=0, server_default=sql_text("0")
+    )
+    fanned_out: Mapped[bool] = mapped_column(
+        Boolean, nullable=False, default=True, server_default=sql_text("true")
+    )
 
     author: Mapped["Users"] = relationship("Users", back_populates="tweets")
     likes: Mapped[List["Like"]] = relationship(
@@ -125,7 +182,13 @@ class Tweets(BaseProj):
     def __repr__(self):
         return f"Твит: {self.text}, создан: {self.timestamp.strftime('%Y-%m-%d %H:%M:%S')}, Пользователем: {self.author.name}"
 
-    def to_json(self) -> Dict[str, Any]:
+    def to_json(self, likes: Optional[List[Dict[str, Any]]] = None) -> Dict[str, Any]:
+        """
+        Возвращает твит в формате ответа API.
+
+        Лайки не загружаются целиком: в ответ попадает счетчик like_count
+        и переданная выборка лайкнувших пользователей (см. LikeDAO.find_likers_sample).
+        """
         return {
             "id": self.id,
             "content": self.text,
@@ -135,24 +198,20 @@ class Tweets(BaseProj):
                 "name": self.author.name,
             },
             "attachments": (
-                [f"/api/media/{i_attachment.id}" for i_attachment in self.attachments]
+                [attachment_url(i_attachment.id) for i_attachment in self.attachments]
                 if self.attachments
                 else []
             ),
-            "likes": (
-                [
-                    {"user_id": like.user_id, "name": like.user.name}
-                    for like in self.likes
-                ]
-                if self.likes
-                else []
-            ),
+            "like_count": self.like_count,
+            "likes": likes or [],
         }
 
 
 class Like(BaseProj):
     """
     Модель Like связывает пользователей с твитами, которые они лайкают.
+    Индекс (tweet_id, id) позволяет выбирать последние лайки твита без чтения всех строк,
+    уникальность (tweet_id, user_id) не дает поставить лайк дважды.
     Поля:
     id: уникальный идентификатор лайка.
     tweet_id: идентификатор твита (внешний ключ).
@@ -160,6 +219,10 @@ class Like(BaseProj):
     """
 
     __tablename__ = "likes"
+    __table_args__ = (
+        Index("ix_likes_tweet_id_id", "tweet_id", "id"),
+        UniqueConstraint("tweet_id", "user_id", name="uq_likes_tweet_id_user_id"),
+    )
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True, index=True)
     tweet_id: Mapped[int] = mapped_column(
@@ -177,19 +240,40 @@ class Media(BaseProj):
 
     Эта модель используется для хранения информации о медиафайлах,
     которые могут быть прикреплены к твитам. Каждый медиа-объект
-    имеет уникальный идентификатор и может содержать бинарные данные
-    файла, его имя и ссылку на соответствующий твит.
+    имеет уникальный идентификатор, ключ содержимого файла в хранилище
+    медиафайлов, его имя и ссылку на соответствующий твит.
 
     Атрибуты:
         id (int): Уникальный идентификатор медиа-объекта.
                   Является первичным ключом таблицы.
 
-        file_body (bytes): Бинарные данные файла. Используется для
-                           хранения содержимого медиафайла (например, изображений, видео).
+        blob_key (str): Ключ содержимого файла в хранилище медиафайлов
+                        (SHA-256 содержимого, см. application.storage).
+                        Само содержимое в базе данных не хранится; ссылка
+                        учитывается в счетчике блоба (см. MediaBlob).
 
         file_name (str): Имя файла, которое будет использоваться для
                          идентификации медиа-объекта.
 
+        mime_type (str): MIME-тип изображения, определенный при загрузке.
+
+        width (int): Ширина изображения в пикселях.
+
+        height (int): Высота изображения в пикселях.
+
+        size (int): Размер содержимого в байтах.
+
+        uploader_id (int): Идентификатор пользователя, загрузившего файл. Прикрепить
+                           медиафайл к твиту может только он (у записей, созданных
+                           до появления поля, значение пустое).
+
+        created_at (datetime): Время загрузки. По нему сборщик мусора
+                               (application.media_gc) находит давно загруженные
+                               и так и не прикрепленные к твиту медиафайлы.
+
+        Метаданные заполняются при загрузке; у записей, созданных до их
+        появления, они могут быть пустыми.
+
         tweet_id (int): Идентификатор твита, к которому прикреплен
                          данный медиа-объект. Является внешним ключом на таблицу "tweets".
 
@@ -198,14 +282,188 @@ class Media(BaseProj):
     """
 
     __tablename__ = "media"  # Убедитесь, что имя таблицы соответствует вашему проекту
+    __table_args__ = (
+        # Вложения твита выбираются по tweet_id в порядке id
+        Index("ix_media_tweet_id_id", "tweet_id", "id"),
+        # Неприкрепленные медиафайлы выбираются сборщиком мусора по времени загрузки
+        Index(
+            "ix_media_orphans_created_at",
+            "created_at",
+            postgresql_where=sql_text("tweet_id IS NULL"),
+        ),
+    )
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True, index=True)
-    file_body: Mapped[bytes] = mapped_column(
-        LargeBinary
-    )  # Хранит бинарные данные файла
+    blob_key: Mapped[str] = mapped_column(
+        String(64), ForeignKey("media_blobs.blob_key"), nullable=False
+    )  # Ключ содержимого файла в хранилище медиафайлов
     file_name: Mapped[str] = mapped_column(String)  # Имя файла
+    mime_type: Mapped[Optional[str]] = mapped_column(
+        String(32), nullable=True
+    )  # MIME-тип изображения
+    width: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)  # Ширина
+    height: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)  # Высота
+    size: Mapped[Optional[int]] = mapped_column(
+        Integer, nullable=True
+    )  # Размер содержимого в байтах
+    uploader_id: Mapped[Optional[int]] = mapped_column(
+        Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=True
+    )  # Пользователь, загрузивший файл
+    created_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), server_default=func.now(), nullable=False
+    )  # Время загрузки
     tweet_id: Mapped[int] = mapped_column(
         Integer, ForeignKey("tweets.id", ondelete="CASCADE"), nullable=True
     )  # Внешний ключ на твиты
 
     tweet: Mapped["Tweets"] = relationship("Tweets", back_populates="attachments")
+
+
+class MediaVariant(BaseProj):
+    """
+    Модель уменьшенного варианта изображения (см. application.variants).
+
+    Вариант создается из оригинала медиафайла для каждой ширины из настройки
+    MEDIA_VARIANT_WIDTHS, которая меньше ширины оригинала. Содержимое, как и у
+    оригинала, хранится в хранилище медиафайлов по ключу блоба.
+
+    Поля:
+    media_id: идентификатор оригинала (внешний ключ, удаляется вместе с ним).
+    width: ширина варианта в пикселях, одна из MEDIA_VARIANT_WIDTHS.
+    height: высота варианта, пропорциональная оригиналу.
+    blob_key: ключ содержимого варианта в хранилище медиафайлов.
+    mime_type: MIME-тип варианта (формат из MEDIA_VARIANT_FORMAT).
+    size: размер содержимого в байтах.
+    """
+
+    __tablename__ = "media_variants"
+    __table_args__ = (
+        UniqueConstraint("media_id", "width", name="uq_media_variants_media_id_width"),
+    )
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    media_id: Mapped[int] = mapped_column(
+        Integer, ForeignKey("media.id", ondelete="CASCADE"), nullable=False
+    )
+    width: Mapped[int] = mapped_column(Integer, nullable=False)
+    height: Mapped[int] = mapped_column(Integer, nullable=False)
+    blob_key: Mapped[str] = mapped_column(
+        String(64), ForeignKey("media_blobs.blob_key"), nullable=False
+    )
+    mime_type: Mapped[str] = mapped_column(String(32), nullable=False)
+    size: Mapped[int] = mapped_column(Integer, nullable=False)
+
+
+class MediaBlob(BaseProj):
+    """
+    Модель блоба в хранилище медиафайлов со счетчиком ссылок.
+
+    Одинаковое содержимое хранится один раз (ключ — SHA-256 содержимого), а на
+    один блоб могут ссылаться несколько записей media и media_variants.
+    Счетчик ref_count ведут триггеры базы данных (см. MEDIA_BLOB_REF_FUNCTION),
+    поэтому он учитывает и каскадное удаление медиа вместе с твитом. Блобы
+    со счетчиком 0 удаляются вместе с файлами (см. MediaBlobDAO.release_unreferenced).
+
+    Поля:
+    blob_key: ключ блоба в хранилище медиафайлов.
+    ref_count: число записей media и media_variants, ссылающихся на блоб.
+    """
+
+    __tablename__ = "media_blobs"
+    __table_args__ = (
+        # Блобы без ссылок выбираются при освобождении по частичному индексу
+        Index(
+            "ix_media_blobs_unreferenced",
+            "blob_key",
+            postgresql_where=sql_text("ref_count = 0"),
+        ),
+    )
+
+    blob_key: Mapped[str] = mapped_column(String(64), primary_key=True)
+    ref_count: Mapped[int] = mapped_column(
+        Integer, nullable=False, server_default=sql_text("0")
+    )
+
+
+# Триггерная функция счетчика ссылок на блобы. Ссылка учитывается до вставки строки
+# (BEFORE), чтобы строка media_blobs существовала к проверке внешнего ключа; вставка
+# блокирует строку блоба до конца транзакции, поэтому блоб не может быть освобожден,
+# пока транзакция, ссылающаяся на него, не завершилась. Триггер BEFORE INSERT срабатывает
+# и для строки, пропущенной ON CONFLICT DO NOTHING, поэтому вставки в media и media_variants
+# не используют ON CONFLICT, а повторы обрабатываются откатом к точке сохранения.
+MEDIA_BLOB_REF_FUNCTION = """
+CREATE OR REPLACE FUNCTION media_blob_ref() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        INSERT INTO media_blobs (blob_key, ref_count) VALUES (NEW.blob_key, 1)
+        ON CONFLICT (blob_key) DO UPDATE SET ref_count = media_blobs.ref_count + 1;
+    END IF;
+    IF TG_OP IN ('DELETE', 'UPDATE') THEN
+        UPDATE media_blobs SET ref_count = ref_count - 1 WHERE blob_key = OLD.blob_key;
+    END IF;
+    IF TG_OP = 'DELETE' THEN
+        RETURN OLD;
+    END IF;
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql
+"""
+
+MEDIA_BLOB_REF_TRIGGERS = (
+    """
+    CREATE TRIGGER {table}_blob_ref_insert
+        BEFORE INSERT ON {table}
+        FOR EACH ROW EXECUTE FUNCTION media_blob_ref()
+    """,
+    """
+    CREATE TRIGGER {table}_blob_ref_update
+        BEFORE UPDATE OF blob_key ON {table}
+        FOR EACH ROW WHEN (OLD.blob_key IS DISTINCT FROM NEW.blob_key)
+        EXECUTE FUNCTION media_blob_ref()
+    """,
+    """
+    CREATE TRIGGER {table}_blob_ref_delete
+        AFTER DELETE ON {table}
+        FOR EACH ROW EXECUTE FUNCTION media_blob_ref()
+    """,
+)
+
+for _table in (Media.__table__, MediaVariant.__table__):
+    for _statement in (MEDIA_BLOB_REF_FUNCTION, *MEDIA_BLOB_REF_TRIGGERS):
+        event.listen(
+            _table,
+            "after_create",
+            DDL(_statement.format(table=_table.name)).execute_if(dialect="postgresql"),
+        )
+
+
+class Timeline(BaseProj):
+    """
+    Модель Timeline хранит материализованную домашнюю ленту каждого пользователя.
+
+    При публикации твита в таблицу добавляется по одной строке для автора и каждого
+    его подписчика (fan-out on write), поэтому чтение ленты сводится к одному
+    диапазонному сканированию индекса (user_id, timestamp, tweet_id).
+
+    Поля:
+    user_id: идентификатор владельца ленты (внешний ключ).
+    tweet_id: идентификатор твита в ленте (внешний ключ, удаляется вместе с твитом).
+    author_id: идентификатор автора твита, нужен для очистки ленты при отписке.
+    timestamp: время создания твита, копия tweets.timestamp для сортировки без join.
+    """
+
+    __tablename__ = "timelines"
+    __table_args__ = (
+        Index("ix_timelines_user_timestamp_tweet", "user_id", "timestamp", "tweet_id"),
+    )
+
+    user_id: Mapped[int] = mapped_column(
+        Integer, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True
+    )
+    tweet_id: Mapped[int] = mapped_column(
+        Integer, ForeignKey("tweets.id", ondelete="CASCADE"), primary_key=True
+    )
+    author_id: Mapped[int] = mapped_column(
+        Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False
+    )
+    timestamp: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False)
@@ -0,0 +1,64 @@
+import base64
+import binascii
+from datetime import datetime
+from typing import Tuple
+
+
+def encode_cursor(timestamp: datetime, item_id: int) -> str:
+    """
+    Кодирует позицию в ленте (время создания и идентификатор записи) в непрозрачный курсор.
+
+    Аргументы:
+        timestamp (datetime): Время создания последней записи на странице.
+        item_id (int): Идентификатор последней записи на странице.
+
+    Возвращает:
+        Строка, безопасная для передачи в URL.
+    """
+    raw = f"{timestamp.isoformat()}|{item_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    """
+    Декодирует курсор, полученный от клиента, обратно в пару (время создания, идентификатор).
+
+    Аргументы:
+        cursor (str): Курсор, ранее выданный функцией encode_cursor.
+
+    Возвращает:
+        Кортеж (timestamp, id).
+
+    Исключения:
+        ValueError: Если курсор поврежден или имеет неверный формат.
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        raw = base64.urlsafe_b64decode(padded.encode()).decode()
+        timestamp, item_id = raw.rsplit("|", 1)
+        return datetime.fromisoformat(timestamp), int(item_id)
+    except (binascii.Error, UnicodeDecodeError, ValueError) as e:
+        raise ValueError("Некорректный курсор") from e
+
+
+def encode_id_cursor(item_id: int) -> str:
+    """
+    Кодирует идентификатор последней записи на странице в непрозрачный курсор.
+
+    Используется для списков, упорядоченных только по идентификатору (например, лайков твита).
+    """
+    return base64.urlsafe_b64encode(str(item_id).encode()).decode().rstrip("=")
+
+
+def decode_id_cursor(cursor: str) -> int:
+    """
+    Декодирует курсор, выданный функцией encode_id_cursor.
+
+    Исключения:
+        ValueError: Если курсор поврежден или имеет неверный формат.
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        return int(base64.urlsafe_b64decode(padded.encode()).decode())
+    except (binascii.Error, UnicodeDecodeError, ValueError) as e:
+        raise ValueError("Некорректный курсор") from e
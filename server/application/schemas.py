@@ -55,6 +55,20 @@ class TweetOut(BaseModel):
     author: Dict[str, Union[int, str]] = Field(..., description="Информация об авторе твита (идентификатор и имя)")
     content: str = Field(..., description="Содержимое твита")
     attachments: List[str] = Field(default_factory=list, description="Список вложений к твиту")
-    likes: List[Like] = Field(default_factory=list, description="Список лайков к твиту")
+    like_count: int = Field(0, description="Количество лайков твита")
+    likes: List[Like] = Field(default_factory=list, description="Последние лайки к твиту (ограниченная выборка)")
 
     model_config = ConfigDict(arbitrary_types_allowed=True)
+
+
+class TweetsFeedOut(BaseModel):
+    result: bool = Field(..., description="Результат выполнения запроса")
+    tweets: List[TweetOut] = Field(default_factory=list, description="Страница ленты твитов, от новых к старым")
+    next_cursor: Optional[str] = Field(None, description="Курсор следующей страницы или null, если страниц больше нет")
+
+
+class TweetLikesOut(BaseModel):
+    result: bool = Field(..., description="Результат выполнения запроса")
+    like_count: int = Field(..., description="Общее количество лайков твита")
+    likes: List[Like] = Field(default_factory=list, description="Страница лайков, от новых к старым")
+    next_cursor: Optional[str] = Field(None, description="Курсор следующей страницы или null, если страниц больше нет")
@@ -0,0 +1,112 @@
+import logging
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import orjson
+from starlette.responses import Response
+
+from application.models import Tweets, attachment_url
+
+logger = logging.getLogger(__name__)
+
+
+class RawJSONResponse(Response):
+    """
+    Ответ с уже сериализованным JSON.
+
+    Маршрут, вернувший экземпляр Response, не проходит повторную валидацию
+    по response_model, поэтому модель ответа остается только в схеме OpenAPI,
+    а тело отправляется как есть.
+    """
+
+    media_type = "application/json"
+
+
+def feed_envelope(tweets_json: bytes, next_cursor: Optional[str]) -> bytes:
+    """
+    Собирает тело ответа ленты из готового JSON-массива твитов.
+
+    Аргументы:
+        tweets_json (bytes): JSON-массив твитов.
+        next_cursor (str, optional): Курсор следующей страницы.
+
+    Возвращает:
+        Тело ответа `{"result": true, "tweets": [...], "next_cursor": ...}`.
+    """
+    return b"".join(
+        (
+            b'{"result":true,"tweets":',
+            tweets_json,
+            b',"next_cursor":',
+            orjson.dumps(next_cursor),
+            b"}",
+        )
+    )
+
+
+def feed_page_to_bytes(
+    tweets: Sequence[Tweets],
+    likers: Dict[int, List[Dict[str, Any]]],
+    next_cursor: Optional[str],
+) -> bytes:
+    """
+    Сериализует страницу ленты из объектов ORM сразу в байты.
+
+    Формат совпадает с Tweets.to_json, но словари строятся без промежуточного
+    преобразования datetime в строку и без валидации через Pydantic.
+
+    Аргументы:
+        tweets (Sequence[Tweets]): Твиты страницы с загруженными author и attachments.
+        likers (Dict[int, List[Dict]]): Выборка лайкнувших пользователей по id твита.
+        next_cursor (str, optional): Курсор следующей страницы.
+    """
+    return orjson.dumps(
+        {
+            "result": True,
+            "tweets": [
+                {
+                    "id": tweet.id,
+                    "content": tweet.text,
+                    "timestamp": tweet.timestamp,
+                    "author": {"id": tweet.author.id, "name": tweet.author.name},
+                    "attachments": [
+                        attachment_url(attachment.id) for attachment in tweet.attachments
+                    ],
+                    "like_count": tweet.like_count,
+                    "likes": likers.get(tweet.id) or [],
+                }
+                for tweet in tweets
+            ],
+            "next_cursor": next_cursor,
+        }
+    )
+
+
+def user_profile_rows_to_bytes(
+    rows: Iterable[Tuple[str, int, str]],
+) -> Optional[bytes]:
+    """
+    Сериализует профиль пользователя из строк Core-запроса (см. UserDAO.find_profile_rows).
+
+    Аргументы:
+        rows (Iterable[Tuple[str, int, str]]): Строки (kind, id, name), где kind —
+            "user", "follower" или "following".
+
+    Возвращает:
+        Тело ответа `{"result": true, "user": {...}}` или None, если строки "user" нет.
+    """
+    user: Optional[Dict[str, Any]] = None
+    followers: List[Dict[str, Any]] = []
+    following: List[Dict[str, Any]] = []
+    for kind, user_id, name in rows:
+        if kind == "user":
+            user = {"id": user_id, "name": name}
+        elif kind == "follower":
+            followers.append({"id": user_id, "name": name})
+        else:
+            following.append({"id": user_id, "name": name})
+
+    if user is None:
+        return None
+    user["followers"] = followers
+    user["following"] = following
+    return orjson.dumps({"result": True, "user": user})
@@ -0,0 +1,350 @@
+import asyncio
+import hashlib
+import logging
+import os
+import re
+import tempfile
+import time
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from typing import AsyncIterable, Optional, Tuple
+
+from application.config import settings
+
+logger = logging.getLogger(__name__)
+
+BLOB_KEY_PATTERN = re.compile(r"^[0-9a-f]{64}$")
+
+# mkstemp создает файлы с правами 0600; блобы должен читать и nginx (X-Accel-Redirect)
+BLOB_FILE_MODE = 0o644
+
+
+class BlobTooLargeError(ValueError):
+    """Содержимое превышает допустимый размер блоба."""
+
+    def __init__(self, max_size: int):
+        super().__init__(f"Размер файла превышает {max_size} байт")
+        self.max_size = max_size
+
+
+@dataclass(frozen=True)
+class StagedBlob:
+    """
+    Содержимое, записанное в хранилище, но еще не доступное по ключу.
+
+    Атрибуты:
+        key (str): Ключ блоба (SHA-256 содержимого).
+        size (int): Размер содержимого в байтах.
+        path (str, optional): Путь к временному файлу, если хранилище локальное.
+    """
+
+    key: str
+    size: int
+    path: Optional[str] = None
+
+
+class MediaStorage(ABC):
+    """
+    Хранилище содержимого медиафайлов.
+
+    В базе данных (таблица media) хранятся только метаданные и ключ блоба,
+    само содержимое читается и записывается через хранилище.
+    Ключ определяется содержимым, поэтому одинаковые файлы хранятся один раз.
+    """
+
+    @staticmethod
+    def blob_key(data: bytes) -> str:
+        """Возвращает ключ блоба: SHA-256 содержимого в шестнадцатеричном виде."""
+        return hashlib.sha256(data).hexdigest()
+
+    @abstractmethod
+    async def stage(self, data: bytes) -> StagedBlob:
+        """
+        Записывает содержимое во временное место хранилища.
+
+        Блоб становится доступен по ключу только после commit_staged; так
+        запись блоба можно выполнить внутри транзакции, учитывающей ссылку на него.
+        """
+
+    @abstractmethod
+    async def stage_stream(
+        self, chunks: AsyncIterable[bytes], max_size: int
+    ) -> StagedBlob:
+        """
+        Записывает во временное место содержимое, поступающее частями, не собирая его целиком в памяти.
+
+        Аргументы:
+            chunks (AsyncIterable[bytes]): Части содержимого.
+            max_size (int): Максимальный размер содержимого в байтах.
+
+        Исключения:
+            BlobTooLargeError: Если размер превысил max_size; уже записанные части удаляются.
+        """
+
+    @abstractmethod
+    async def commit_staged(self, staged: StagedBlob):
+        """
+        Делает записанное содержимое доступным по ключу.
+
+        Если блоб с таким ключом уже есть, временная копия удаляется.
+        """
+
+    @abstractmethod
+    async def discard_staged(self, staged: StagedBlob):
+        """Удаляет записанное содержимое, не сохраняя его."""
+
+    async def save(self, data: bytes) -> str:
+        """
+        Сохраняет содержимое и возвращает его ключ.
+
+        Повторное сохранение того же содержимого не создает копию.
+        """
+        staged = await self.stage(data)
+        await self.commit_staged(staged)
+        return staged.key
+
+    @abstractmethod
+    async def read(self, key: str) -> bytes:
+        """
+        Возвращает содержимое блоба.
+
+        Исключения:
+            FileNotFoundError: Если блоба с таким ключом нет.
+        """
+
+    async def read_head(self, key: str, size: int) -> bytes:
+        """Возвращает первые size байт блоба."""
+        return (await self.read(key))[:size]
+
+    def local_path(self, key: str) -> Optional[str]:
+        """
+        Возвращает путь к файлу блоба в локальной файловой системе, если хранилище его предоставляет.
+
+        По пути блоб отдается через FileResponse (с поддержкой Range и HEAD)
+        без чтения в память; хранилища без локальных файлов возвращают None.
+        """
+        return None
+
+    def relative_path(self, key: str) -> Optional[str]:
+        """
+        Возвращает путь к файлу блоба относительно корня хранилища или None.
+
+        По этому пути блоб отдает nginx (X-Accel-Redirect), если корень
+        хранилища доступен ему как внутренний location.
+        """
+        return None
+
+    async def remove_stale_staged(self, max_age: float) -> Tuple[int, int]:
+        """
+        Удаляет записанное во временное место содержимое, брошенное прерванными загрузками.
+
+        Аргументы:
+            max_age (float): Удаляется содержимое старше max_age секунд.
+
+        Возвращает:
+            Пару (количество удаленных файлов, их суммарный размер в байтах).
+        """
+        return 0, 0
+
+    @abstractmethod
+    async def exists(self, key: str) -> bool:
+        """Проверяет, есть ли блоб с таким ключом."""
+
+    @abstractmethod
+    async def delete(self, key: str):
+        """Удаляет блоб, если он есть."""
+
+
+class FileSystemMediaStorage(MediaStorage):
+    """
+    Хранилище блобов в локальной файловой системе.
+
+    Блоб с ключом `abcdef...` лежит в файле `<root>/ab/cd/abcdef...`, чтобы
+    в одном каталоге не накапливались сотни тысяч файлов. Файл сначала
+    записывается во временный файл в том же каталоге и затем атомарно
+    переименовывается, поэтому читатели никогда не видят недописанный блоб.
+
+    Синхронные методы write_blob/read_blob используются инструментами
+    и миграциями; асинхронные выполняют их в пуле потоков, не блокируя цикл событий.
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+
+    def path(self, key: str) -> str:
+        """
+        Возвращает путь к файлу блоба.
+
+        Исключения:
+            ValueError: Если ключ не является SHA-256 в шестнадцатеричном виде.
+        """
+        return os.path.join(self.root, self.relative_path(key))
+
+    def relative_path(self, key: str) -> str:
+        """
+        Возвращает путь к файлу блоба относительно корня хранилища (`ab/cd/abcdef...`).
+
+        Исключения:
+            ValueError: Если ключ не является SHA-256 в шестнадцатеричном виде.
+        """
+        if not BLOB_KEY_PATTERN.match(key):
+            raise ValueError(f"Некорректный ключ блоба: {key!r}")
+        return f"{key[:2]}/{key[2:4]}/{key}"
+
+    def write_blob(self, data: bytes) -> str:
+        key = self.blob_key(data)
+        path = self.path(key)
+        if os.path.exists(path):
+            return key
+
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as tmp_file:
+                tmp_file.write(data)
+                tmp_file.flush()
+                os.fsync(tmp_file.fileno())
+            os.chmod(tmp_path, BLOB_FILE_MODE)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+        logger.debug("Блоб %s сохранен (%s байт)", key, len(data))
+        return key
+
+    def read_blob(self, key: str, size: int = -1) -> bytes:
+        with open(self.path(key), "rb") as blob_file:
+            return blob_file.read(size)
+
+    def delete_blob(self, key: str):
+        try:
+            os.unlink(self.path(key))
+        except FileNotFoundError:
+            pass
+
+    def _create_temp(self):
+        os.makedirs(self.root, exist_ok=True)
+        return tempfile.mkstemp(dir=self.root, prefix=".upload-")
+
+    def _write_temp(self, data: bytes) -> StagedBlob:
+        fd, tmp_path = self._create_temp()
+        try:
+            with os.fdopen(fd, "wb") as tmp_file:
+                tmp_file.write(data)
+                tmp_file.flush()
+                os.fsync(tmp_file.fileno())
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+        return StagedBlob(key=self.blob_key(data), size=len(data), path=tmp_path)
+
+    async def stage(self, data: bytes) -> StagedBlob:
+        return await asyncio.to_thread(self._write_temp, data)
+
+    async def stage_stream(
+        self, chunks: AsyncIterable[bytes], max_size: int
+    ) -> StagedBlob:
+        # Ключ известен только после чтения всего содержимого, поэтому части пишутся
+        # во временный файл в корне хранилища и затем переносятся на место блоба
+        fd, tmp_path = await asyncio.to_thread(self._create_temp)
+        tmp_file = os.fdopen(fd, "wb")
+        digest = hashlib.sha256()
+        size = 0
+        try:
+            async for chunk in chunks:
+                size += len(chunk)
+                if size > max_size:
+                    raise BlobTooLargeError(max_size)
+                digest.update(chunk)
+                await asyncio.to_thread(tmp_file.write, chunk)
+            await asyncio.to_thread(self._sync_and_close, tmp_file)
+        except BaseException:
+            tmp_file.close()
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+        logger.debug("Блоб %s записан потоково (%s байт)", digest.hexdigest(), size)
+        return StagedBlob(key=digest.hexdigest(), size=size, path=tmp_path)
+
+    @staticmethod
+    def _sync_and_close(tmp_file):
+        tmp_file.flush()
+        os.fsync(tmp_file.fileno())
+        tmp_file.close()
+
+    def _place(self, staged: StagedBlob):
+        path = self.path(staged.key)
+        if os.path.exists(path):
+            # Такое содержимое уже есть в хранилище
+            os.unlink(staged.path)
+            return
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.chmod(staged.path, BLOB_FILE_MODE)
+        os.replace(staged.path, path)
+
+    async def commit_staged(self, staged: StagedBlob):
+        await asyncio.to_thread(self._place, staged)
+
+    async def discard_staged(self, staged: StagedBlob):
+        try:
+            await asyncio.to_thread(os.unlink, staged.path)
+        except FileNotFoundError:
+            pass
+
+    def _remove_stale_uploads(self, max_age: float) -> Tuple[int, int]:
+        removed = reclaimed = 0
+        cutoff = time.time() - max_age
+        try:
+            entries = list(os.scandir(self.root))
+        except FileNotFoundError:
+            return removed, reclaimed
+        for entry in entries:
+            if not (entry.name.startswith(".upload-") and entry.is_file()):
+                continue
+            try:
+                stat_result = entry.stat()
+                if stat_result.st_mtime < cutoff:
+                    os.unlink(entry.path)
+                    removed += 1
+                    reclaimed += stat_result.st_size
+            except FileNotFoundError:
+                # Загрузка завершилась или файл уже удален
+                continue
+        return removed, reclaimed
+
+    async def remove_stale_staged(self, max_age: float) -> Tuple[int, int]:
+        return await asyncio.to_thread(self._remove_stale_uploads, max_age)
+
+    async def read(self, key: str) -> bytes:
+        return await asyncio.to_thread(self.read_blob, key)
+
+    async def read_head(self, key: str, size: int) -> bytes:
+        return await asyncio.to_thread(self.read_blob, key, size)
+
+    def local_path(self, key: str) -> Optional[str]:
+        return self.path(key)
+
+    async def exists(self, key: str) -> bool:
+        return await asyncio.to_thread(os.path.exists, self.path(key))
+
+    async def delete(self, key: str):
+        await asyncio.to_thread(self.delete_blob, key)
+
+
+def create_media_storage() -> MediaStorage:
+    """
+    Создает хранилище медиафайлов по настройке MEDIA_STORAGE_BACKEND.
+
+    Исключения:
+        ValueError: Если указан неизвестный тип хранилища.
+    """
+    if settings.MEDIA_STORAGE_BACKEND == "filesystem":
+        return FileSystemMediaStorage(root=settings.MEDIA_ROOT)
+    raise ValueError(
+        f"Неизвестное хранилище медиафайлов: {settings.MEDIA_STORAGE_BACKEND!r}"
+    )
+
+
+media_storage = create_media_storage()
@@ -0,0 +1,380 @@
+import logging
+from dataclasses import dataclass
+from datetime import datetime
+from typing import List, Optional, Tuple
+
+from sqlalchemy import (
+    select,
+    update,
+    delete,
+    func,
+    literal,
+    literal_column,
+    tuple_,
+    union,
+    union_all,
+    cast,
+    Text,
+    ColumnElement,
+)
+from sqlalchemy.dialects.postgresql import insert, aggregate_order_by
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import aliased
+
+from application.config import settings
+from application.crud import BaseDAO
+from application.database import REPLICA_READ
+from application.models import (
+    Timeline,
+    Tweets,
+    Followers,
+    Users,
+    Like,
+    Media,
+    attachment_url_suffix,
+)
+
+logger = logging.getLogger(__name__)
+
+
+TIMELINE_COLUMNS = ["user_id", "tweet_id", "author_id", "timestamp"]
+EMPTY_JSON_ARRAY = literal_column("'[]'::json")
+
+
+@dataclass
+class FeedPageJson:
+    """
+    Страница ленты, собранная в Postgres.
+
+    Атрибуты:
+        tweets_json (str): JSON-массив твитов страницы.
+        tweet_ids (List[int]): Идентификаторы твитов страницы по порядку.
+        next_after (tuple, optional): (timestamp, tweet_id) последнего твита,
+            если за страницей есть еще твиты.
+    """
+
+    tweets_json: str
+    tweet_ids: List[int]
+    next_after: Optional[Tuple[datetime, int]]
+
+
+def _before(columns, after: tuple):
+    """Условие keyset-пагинации `(timestamp, id) < (:timestamp, :id)` для указанных колонок."""
+    return tuple_(*columns) < tuple_(
+        *[literal(value, column.type) for value, column in zip(after, columns)]
+    )
+
+
+class TimelineDAO(BaseDAO):
+    """
+    DAO гибридных лент пользователей.
+
+    Твиты обычных авторов рассылаются в ленты подписчиков при публикации
+    (fan-out on write, таблица timelines). Твиты авторов, у которых подписчиков
+    больше settings.FANOUT_FOLLOWER_THRESHOLD, попадают только в ленту самого автора
+    и подмешиваются в ленты подписчиков при чтении (fan-out on read).
+    """
+
+    model = Timeline
+
+    @classmethod
+    async def fan_out(cls, session: AsyncSession, tweet_id: int, author_id: int):
+        """
+        Асинхронно добавляет опубликованный твит в ленты.
+
+        Твит всегда попадает в ленту автора. В ленты подписчиков он рассылается
+        одним запросом INSERT ... SELECT, только если подписчиков не больше порога
+        settings.FANOUT_FOLLOWER_THRESHOLD; иначе твит помечается как нерасосланный
+        (fanned_out = false) и подмешивается в ленты при чтении.
+
+        :param session: Асинхронная сессия SQLAlchemy.
+        :param tweet_id: Идентификатор опубликованного твита.
+        :param author_id: Идентификатор автора твита.
+        """
+        followers_count_query = select(func.count()).where(
+            Followers.account_id == author_id
+        )
+        to_author = select(
+            Tweets.author_id, Tweets.id, Tweets.author_id, Tweets.timestamp
+        ).where(Tweets.id == tweet_id)
+
+        try:
+            followers_count = await session.scalar(followers_count_query)
+
+            if followers_count > settings.FANOUT_FOLLOWER_THRESHOLD:
+                logger.info(
+                    "Автор %s имеет %s подписчиков, твит %s подмешивается при чтении",
+                    author_id,
+                    followers_count,
+                    tweet_id,
+                )
+                source = to_author
+                await session.execute(
+                    update(Tweets)
+                    .where(Tweets.id == tweet_id)
+                    .values(fanned_out=False)
+                )
+            else:
+                logger.info("Рассылка твита %s в ленты подписчиков", tweet_id)
+                to_followers = (
+                    select(
+                        Followers.follower_id,
+                        Tweets.id,
+                        Tweets.author_id,
+                        Tweets.timestamp,
+                    )
+                    .join(Tweets, Tweets.author_id == Followers.account_id)
+                    .where(Tweets.id == tweet_id)
+                )
+                source = union_all(to_followers, to_author)
+
+            await session.execute(
+                insert(Timeline)
+                .from_select(TIMELINE_COLUMNS, source)
+                .on_conflict_do_nothing()
+            )
+        except SQLAlchemyError as e:
+            logger.error("Ошибка при рассылке твита: %s", e)
+            raise e
+
+    @classmethod
+    def backfill_stmt(cls, user_id: int, author_id: int, limit: int, *conditions):
+        """
+        Возвращает запрос, добавляющий в ленту пользователя последние твиты автора
+        (при подписке).
+
+        Нерасосланные твиты популярных авторов не копируются: они подмешиваются при чтении.
+        Дополнительные условия conditions добавляются к выборке твитов автора;
+        так запрос встраивается в CTE вместе с подпиской (см. FollowersDAO.follow).
+        """
+        # user_id и author_id могут быть связанными параметрами (см. FollowersDAO.follow)
+        owner = user_id if isinstance(user_id, ColumnElement) else literal(user_id)
+        recent_tweets = (
+            select(owner, Tweets.id, Tweets.author_id, Tweets.timestamp)
+            .where(
+                Tweets.author_id == author_id, Tweets.fanned_out.is_(True), *conditions
+            )
+            .order_by(Tweets.timestamp.desc(), Tweets.id.desc())
+            .limit(limit)
+        )
+        return (
+            insert(Timeline)
+            .from_select(TIMELINE_COLUMNS, recent_tweets)
+            .on_conflict_do_nothing()
+        )
+
+    @classmethod
+    def prune_stmt(cls, user_id: int, author_id: int, *conditions):
+        """
+        Возвращает запрос, удаляющий из ленты пользователя все твиты автора (при отписке).
+
+        Дополнительные условия conditions добавляются к условию удаления;
+        так запрос встраивается в CTE вместе с отпиской (см. FollowersDAO.unfollow).
+        """
+        return delete(Timeline).where(
+            Timeline.user_id == user_id, Timeline.author_id == author_id, *conditions
+        )
+
+    @classmethod
+    async def find_feed_page(
+        cls,
+        session: AsyncSession,
+        user_id: int,
+        limit: int,
+        after: tuple | None = None,
+        options=None,
+    ) -> List[Tweets]:
+        """
+        Асинхронно возвращает страницу домашней ленты пользователя, от новых твитов к старым.
+
+        Страница собирается из двух источников, каждый из которых читается
+        по своему индексу не более чем на limit записей:
+        материализованной ленты (timelines) и нерасосланных твитов авторов,
+        на которых подписан пользователь. Затем источники сливаются по (timestamp, id).
+
+        :param session: Асинхронная сессия SQLAlchemy.
+        :param user_id: Идентификатор владельца ленты.
+        :param limit: Максимальное количество твитов на странице.
+        :param after: Пара (timestamp, tweet_id) последнего твита предыдущей страницы.
+        :param options: Дополнительные параметры загрузки связанных данных.
+        :return: Список твитов.
+        """
+        logger.debug("Создание запроса страницы ленты пользователя %s", user_id)
+        page_ids = cls.page_ids_query(user_id, limit, after).subquery()
+
+        query = (
+            select(Tweets)
+            .join(page_ids, page_ids.c.tweet_id == Tweets.id)
+            .order_by(page_ids.c.timestamp.desc(), page_ids.c.tweet_id.desc())
+            .limit(limit)
+        )
+        if options:
+            query = query.options(*options)
+
+        result = await session.execute(query, bind_arguments=REPLICA_READ)
+        logger.debug("Запрос выполнен")
+        return result.scalars().all()
+
+    @classmethod
+    async def find_feed_page_json(
+        cls,
+        session: AsyncSession,
+        user_id: int,
+        limit: int,
+        after: tuple | None = None,
+        likes_sample_size: int = 3,
+    ) -> FeedPageJson:
+        """
+        Асинхронно собирает страницу ленты одним SQL-запросом в готовый JSON.
+
+        Автор, вложения и выборка лайков каждого твита собираются в Postgres через
+        json_build_object/json_agg и коррелированные подзапросы, поэтому вместо
+        запроса страницы и отдельных selectinload выполняется один запрос,
+        а приложение получает JSON-массив твитов строкой и не строит словари в Python.
+
+        :param session: Асинхронная сессия SQLAlchemy.
+        :param user_id: Идентификатор владельца ленты.
+        :param limit: Максимальное количество твитов на странице.
+        :param after: Пара (timestamp, tweet_id) последнего твита предыдущей страницы.
+        :param likes_sample_size: Сколько последних лайков вернуть для каждого твита.
+        :return: FeedPageJson с JSON-массивом твитов и данными для курсора.
+        """
+        logger.debug("Создание JSON-запроса страницы ленты пользователя %s", user_id)
+        candidates = cls.page_ids_query(user_id, limit + 1, after).subquery("candidates")
+        ranked = select(
+            candidates.c.tweet_id,
+            candidates.c.timestamp,
+            func.row_number()
+            .over(order_by=(candidates.c.timestamp.desc(), candidates.c.tweet_id.desc()))
+            .label("rn"),
+        ).subquery("ranked")
+
+        attachments = (
+            select(
+                func.coalesce(
+                    func.json_agg(
+                        aggregate_order_by(
+                            func.concat("/api/media/", Media.id, attachment_url_suffix()),
+                            Media.id,
+                        )
+                    ),
+                    EMPTY_JSON_ARRAY,
+                )
+            )
+            .where(Media.tweet_id == Tweets.id)
+            .scalar_subquery()
+        )
+        recent_likers = (
+            select(Like.id.label("like_id"), Like.user_id, Users.name)
+            .join(Users, Users.id == Like.user_id)
+            .where(Like.tweet_id == Tweets.id)
+            .order_by(Like.id.desc())
+            .limit(likes_sample_size)
+            .correlate(Tweets)
+        )
+        viewer_liker = (
+            select(Like.id.label("like_id"), Like.user_id, Users.name)
+            .join(Users, Users.id == Like.user_id)
+            .where(Like.tweet_id == Tweets.id, Like.user_id == user_id)
+            .correlate(Tweets)
+        )
+        # Лайк читателя может попасть и в последние лайки: UNION убирает повтор
+        likers = union(recent_likers, viewer_liker).subquery("likers")
+        likes = select(
+            func.coalesce(
+                func.json_agg(
+                    aggregate_order_by(
+                        func.json_build_object(
+                            "user_id", likers.c.user_id, "name", likers.c.name
+                        ),
+                        likers.c.like_id.desc(),
+                    )
+                ),
+                EMPTY_JSON_ARRAY,
+            )
+        ).scalar_subquery()
+
+        author = aliased(Users, name="author")
+        tweet_json = func.json_build_object(
+            "id", Tweets.id,
+            "content", Tweets.text,
+            "timestamp", Tweets.timestamp,
+            "author", func.json_build_object("id", author.id, "name", author.name),
+            "attachments", attachments,
+            "like_count", Tweets.like_count,
+            "likes", likes,
+        )  # fmt: skip
+        rows = (
+            select(
+                tweet_json.label("tweet"),
+                ranked.c.rn,
+                ranked.c.timestamp,
+                ranked.c.tweet_id,
+            )
+            .select_from(ranked)
+            .join(Tweets, Tweets.id == ranked.c.tweet_id)
+            .join(author, author.id == Tweets.author_id)
+            .where(ranked.c.rn <= limit + 1)
+        ).subquery("rows")
+
+        on_page = rows.c.rn <= limit
+        last_on_page = rows.c.rn == limit
+        query = select(
+            cast(
+                func.coalesce(
+                    func.json_agg(aggregate_order_by(rows.c.tweet, rows.c.rn)).filter(
+                        on_page
+                    ),
+                    EMPTY_JSON_ARRAY,
+                ),
+                Text,
+            ),
+            func.array_agg(aggregate_order_by(rows.c.tweet_id, rows.c.rn)).filter(
+                on_page
+            ),
+            func.count() > limit,
+            func.max(rows.c.timestamp).filter(last_on_page),
+            func.max(rows.c.tweet_id).filter(last_on_page),
+        )
+
+        result = await session.execute(query, bind_arguments=REPLICA_READ)
+        tweets_json, tweet_ids, has_more, last_timestamp, last_tweet_id = result.one()
+        logger.debug("Запрос выполнен")
+        return FeedPageJson(
+            tweets_json=tweets_json,
+            tweet_ids=tweet_ids or [],
+            next_after=(last_timestamp, last_tweet_id) if has_more else None,
+        )
+
+    @classmethod
+    def page_ids_query(cls, user_id: int, limit: int, after: tuple | None = None):
+        """
+        Строит запрос (tweet_id, timestamp) кандидатов на страницу ленты пользователя.
+
+        :param user_id: Идентификатор владельца ленты.
+        :param limit: Максимальное количество твитов на странице.
+        :param after: Пара (timestamp, tweet_id) последнего твита предыдущей страницы.
+        :return: UNION ALL материализованной ленты и нерасосланных твитов.
+        """
+        pushed = select(
+            Timeline.tweet_id.label("tweet_id"), Timeline.timestamp.label("timestamp")
+        ).where(Timeline.user_id == user_id)
+        pulled = (
+            select(Tweets.id.label("tweet_id"), Tweets.timestamp.label("timestamp"))
+            .join(Followers, Followers.account_id == Tweets.author_id)
+            .where(
+                Followers.follower_id == user_id,
+                Tweets.author_id != user_id,
+                Tweets.fanned_out.is_(False),
+            )
+        )
+        if after is not None:
+            pushed = pushed.where(_before((Timeline.timestamp, Timeline.tweet_id), after))
+            pulled = pulled.where(_before((Tweets.timestamp, Tweets.id), after))
+
+        pushed = pushed.order_by(
+            Timeline.timestamp.desc(), Timeline.tweet_id.desc()
+        ).limit(limit)
+        pulled = pulled.order_by(Tweets.timestamp.desc(), Tweets.id.desc()).limit(limit)
+        return union_all(pushed, pulled)
@@ -0,0 +1,84 @@
+import inspect
+import logging
+from functools import partial
+from typing import Any, Callable, List
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+logger = logging.getLogger(__name__)
+
+
+class UnitOfWork:
+    """
+    Единица работы: одна транзакция на запрос (или на пачку фоновой задачи).
+
+    Методы DAO выполняют запросы в переданной сессии, не открывая и не закрывая ее
+    и не фиксируя транзакцию, поэтому несколько вызовов DAO складываются
+    в одну транзакцию на одном соединении. Если DAO нужен идентификатор
+    новой записи, он вызывает flush. Транзакция фиксируется один раз при выходе
+    из единицы работы и откатывается, если внутри возникло исключение.
+
+    Действия, которые можно выполнять только после фиксации (сброс кэшей),
+    регистрируются через after_commit и выполняются сразу после commit,
+    до закрытия сессии; при откате они отбрасываются.
+
+    Пример:
+        async with UnitOfWork(session) as uow:
+            tweet = await TweetDAO.add_with_media(session=uow.session, ...)
+            uow.after_commit(feed_cache.invalidate_users, [tweet.author_id])
+    """
+
+    def __init__(self, session: AsyncSession):
+        self.session = session
+        self._after_commit: List[Callable[[], Any]] = []
+
+    async def __aenter__(self) -> "UnitOfWork":
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        try:
+            if exc_type is None:
+                await self.commit()
+            else:
+                await self.rollback()
+        finally:
+            # Закрытие сессии очищает карту идентичности и возвращает соединение в пул
+            await self.session.close()
+
+    async def flush(self):
+        """Отправляет накопленные в сессии изменения в базу данных, не фиксируя транзакцию."""
+        await self.session.flush()
+
+    def after_commit(self, callback: Callable[..., Any], *args, **kwargs):
+        """
+        Регистрирует действие, выполняемое после фиксации транзакции.
+
+        Аргументы:
+            callback (Callable): Функция или корутинная функция (например, сброс кэша).
+                Корутинная функция может выполнять запросы в сессии единицы работы:
+                они идут в новой транзакции, которая откатывается при закрытии сессии.
+            *args, **kwargs: Ее аргументы.
+        """
+        self._after_commit.append(partial(callback, *args, **kwargs))
+
+    async def commit(self):
+        """
+        Фиксирует транзакцию и выполняет действия, зарегистрированные через after_commit.
+
+        Ошибка одного действия записывается в журнал и не мешает остальным:
+        транзакция к этому моменту уже зафиксирована.
+        """
+        await self.session.commit()
+        callbacks, self._after_commit = self._after_commit, []
+        for callback in callbacks:
+            try:
+                result = callback()
+                if inspect.isawaitable(result):
+                    await result
+            except Exception as e:
+                logger.error("Ошибка действия после фиксации транзакции: %s", e)
+
+    async def rollback(self):
+        """Откатывает транзакцию и отбрасывает действия after_commit."""
+        self._after_commit.clear()
+        await self.session.rollback()
@@ -0,0 +1,169 @@
+import asyncio
+import logging
+from dataclasses import dataclass
+from typing import AsyncIterator, BinaryIO, Iterable, Optional, Union
+
+import orjson
+from fastapi import UploadFile
+from PIL import Image, UnidentifiedImageError
+
+from application.config import settings
+from application.storage import StagedBlob
+
+logger = logging.getLogger(__name__)
+
+# Сигнатуры поддерживаемых форматов изображений: (смещение, байты, MIME-тип)
+IMAGE_SIGNATURES = (
+    (0, b"\xff\xd8\xff", "image/jpeg"),
+    (0, b"\x89PNG\r\n\x1a\n", "image/png"),
+    (0, b"GIF87a", "image/gif"),
+    (0, b"GIF89a", "image/gif"),
+    (8, b"WEBP", "image/webp"),
+)
+
+# MIME-типы, которые принимаются при загрузке
+SUPPORTED_IMAGE_TYPES = frozenset(
+    content_type for _, _, content_type in IMAGE_SIGNATURES
+)
+
+# Сколько первых байт файла нужно sniff_image_type
+IMAGE_HEAD_SIZE = 16
+
+# Запас на заголовки multipart/form-data сверх размера самого файла
+MULTIPART_OVERHEAD_BYTES = 16 * 1024
+
+
+def sniff_image_type(head: bytes) -> Optional[str]:
+    """
+    Определяет тип изображения по первым байтам файла.
+
+    Аргументы:
+        head (bytes): Начало файла (достаточно IMAGE_HEAD_SIZE байт).
+
+    Возвращает:
+        MIME-тип изображения или None, если формат не поддерживается.
+    """
+    for offset, signature, content_type in IMAGE_SIGNATURES:
+        if head[offset : offset + len(signature)] == signature:
+            if content_type == "image/webp" and not head.startswith(b"RIFF"):
+                continue
+            return content_type
+    return None
+
+
+@dataclass(frozen=True)
+class ImageMetadata:
+    """Метаданные изображения, сохраняемые в записи Media при загрузке."""
+
+    mime_type: str
+    width: int
+    height: int
+
+
+def read_image_metadata(source: Union[str, BinaryIO]) -> ImageMetadata:
+    """
+    Читает тип и размеры изображения.
+
+    Pillow разбирает только заголовок файла, пиксели не декодируются.
+    Функция синхронная и выполняется в пуле потоков (см. probe_image).
+
+    Аргументы:
+        source (str | BinaryIO): Путь к файлу или файловый объект.
+
+    Исключения:
+        ValueError: Если содержимое не является изображением поддерживаемого формата.
+    """
+    try:
+        with Image.open(source) as image:
+            mime_type = Image.MIME.get(image.format)
+            width, height = image.size
+    except (UnidentifiedImageError, OSError) as e:
+        raise ValueError(f"Не удалось прочитать изображение: {e}") from e
+    if mime_type not in SUPPORTED_IMAGE_TYPES:
+        raise ValueError(f"Неподдерживаемый формат изображения: {mime_type}")
+    return ImageMetadata(mime_type=mime_type, width=width, height=height)
+
+
+async def probe_image(staged: StagedBlob) -> ImageMetadata:
+    """
+    Читает метаданные загруженного изображения, не блокируя цикл событий.
+
+    Аргументы:
+        staged (StagedBlob): Записанное во временный файл содержимое.
+
+    Исключения:
+        ValueError: Если содержимое не является изображением поддерживаемого формата.
+    """
+    return await asyncio.to_thread(read_image_metadata, staged.path)
+
+
+async def iter_upload_chunks(
+    file: UploadFile, first_chunk: bytes, chunk_size: int
+) -> AsyncIterator[bytes]:
+    """
+    Отдает содержимое загруженного файла частями, начиная с уже прочитанной первой части.
+
+    Starlette хранит загрузку во временном файле (в памяти только первые 1 МБ),
+    поэтому чтение частями держит в памяти не больше одной части.
+    """
+    if first_chunk:
+        yield first_chunk
+    while chunk := await file.read(chunk_size):
+        yield chunk
+
+
+class UploadSizeLimitMiddleware:
+    """
+    ASGI middleware, отклоняющий слишком большие загрузки до чтения тела запроса.
+
+    Тело multipart-запроса разбирается до вызова маршрута, поэтому проверка
+    по заголовку Content-Length выполняется здесь. Запросы без Content-Length
+    (chunked) пропускаются: их размер ограничивает маршрут при переносе в хранилище.
+    """
+
+    def __init__(self, app, paths: Iterable[str]):
+        self.app = app
+        self.paths = set(paths)
+
+    async def __call__(self, scope, receive, send):
+        if (
+            scope["type"] == "http"
+            and scope["method"] == "POST"
+            and scope["path"] in self.paths
+        ):
+            max_size = settings.MEDIA_MAX_UPLOAD_SIZE + MULTIPART_OVERHEAD_BYTES
+            content_length = dict(scope["headers"]).get(b"content-length")
+            if content_length is not None and content_length.isdigit():
+                if int(content_length) > max_size:
+                    logger.warning(
+                        "Загрузка отклонена: Content-Length %s больше %s",
+                        int(content_length),
+                        max_size,
+                    )
+                    await self._reject(send)
+                    return
+        await self.app(scope, receive, send)
+
+    @staticmethod
+    async def _reject(send):
+        body = orjson.dumps(
+            {
+                "result": False,
+                "error_type": "HTTP 413",
+                "error_message": (
+                    f"Размер файла превышает {settings.MEDIA_MAX_UPLOAD_SIZE} байт"
+                ),
+            }
+        )
+        await send(
+            {
+                "type": "http.response.start",
+                "status": 413,
+                "headers": [
+                    (b"content-type", b"application/json"),
+                    (b"content-length", str(len(body)).encode()),
+                    (b"connection", b"close"),
+                ],
+            }
+        )
+        await send({"type": "http.response.body", "body": body})
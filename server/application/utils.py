@@ -4,33 +4,39 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import selectinload
 
 from application.api.dependencies import UserDAO, TweetDAO
+from application.database import use_primary
 from application.models import Users
+from application.timeline import TimelineDAO
+from application.unit_of_work import UnitOfWork
 
 
-logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
 
 
 async def add_test_information(session: AsyncSession):
     logger.info("Создание новой сессии для добавления тестового пользователя %s", session)
+    # Проверка и добавление тестовых данных не должны расходиться из-за отставания реплики
+    use_primary(session)
     try:
-        test_user = await  UserDAO.find_one_or_none(
-            session=session,
-            options=[selectinload(Users.followers)],
-            api_key="test"
-        )
-
-        if test_user is None:
-            first_user = await UserDAO.add(session=session, name="Dan", api_key="test")
-            second_user = await UserDAO.add(session=session, name="Mike", api_key="good")
-            logger.info("Тестовые пользователи успешно добавлены: %s, %s", first_user, second_user)
-            test_tweet = await TweetDAO.add(session=session, text="Hello!", author_id=second_user.id)
-            logger.info(
-                "Тестовый твит добавлен: %s, id пользователя: %s", test_tweet.text, test_tweet.author_id
+        async with UnitOfWork(session):
+            test_user = await  UserDAO.find_one_or_none(
+                session=session,
+                options=[selectinload(Users.followers)],
+                api_key="test"
             )
+
+            if test_user is None:
+                first_user = await UserDAO.add(session=session, name="Dan", api_key="test")
+                second_user = await UserDAO.add(session=session, name="Mike", api_key="good")
+                logger.info("Тестовые пользователи успешно добавлены: %s, %s", first_user, second_user)
+                test_tweet = await TweetDAO.add(session=session, text="Hello!", author_id=second_user.id)
+                await TimelineDAO.fan_out(
+                    session=session, tweet_id=test_tweet.id, author_id=second_user.id
+                )
+                logger.info(
+                    "Тестовый твит добавлен: %s, id пользователя: %s", test_tweet.text, test_tweet.author_id
+                )
     except Exception as e:
         logger.error("Ошибка при добавлении тестового пользователя: %s", e)
     finally:
-        logger.info("Закрытие сессии %s", session)
-        await session.close()
-        logger.info("Сессия закрыта")
+        logger.info("Сессия %s закрыта", session)
@@ -0,0 +1,332 @@
+import asyncio
+import io
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from typing import Dict, Optional, Union
+
+from PIL import Image
+from sqlalchemy import select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from application.config import settings
+from application.crud import BaseDAO
+from application.models import MediaVariant
+from application.storage import MediaStorage, StagedBlob, media_storage
+from application.unit_of_work import UnitOfWork
+
+logger = logging.getLogger(__name__)
+
+# SQLSTATE нарушения ограничения уникальности в PostgreSQL
+UNIQUE_VIOLATION = "23505"
+
+# Формат варианта: (формат Pillow, MIME-тип)
+VARIANT_FORMATS = {
+    "webp": ("WEBP", "image/webp"),
+    "jpeg": ("JPEG", "image/jpeg"),
+}
+
+
+class VariantQueueFullError(RuntimeError):
+    """Пул создания вариантов занят: одновременно создается MEDIA_VARIANT_MAX_PENDING вариантов."""
+
+
+@dataclass(frozen=True)
+class RenderedVariant:
+    """Результат создания варианта в процессе пула."""
+
+    data: bytes
+    width: int
+    height: int
+
+
+def render_variant(
+    source: Union[str, bytes], width: int, image_format: str, quality: int
+) -> RenderedVariant:
+    """
+    Уменьшает изображение до указанной ширины с сохранением пропорций и сжимает его.
+
+    Функция выполняется в процессе пула (см. VariantPipeline), поэтому принимает
+    путь к файлу или содержимое, а не открытый файл.
+
+    Аргументы:
+        source (str | bytes): Путь к файлу оригинала или его содержимое.
+        width (int): Ширина варианта в пикселях.
+        image_format (str): Формат Pillow ("WEBP" или "JPEG").
+        quality (int): Качество сжатия.
+    """
+    if isinstance(source, bytes):
+        source = io.BytesIO(source)
+    with Image.open(source) as image:
+        height = max(1, round(image.height * width / image.width))
+        # Для JPEG декодер сразу уменьшает изображение в 2-8 раз, что намного быстрее
+        image.draft("RGB", (width, height))
+        mode = "RGBA" if image_format == "WEBP" and image.has_transparency_data else "RGB"
+        resized = image.convert(mode).resize((width, height), Image.Resampling.LANCZOS)
+
+    output = io.BytesIO()
+    resized.save(output, format=image_format, quality=quality)
+    return RenderedVariant(data=output.getvalue(), width=width, height=height)
+
+
+def choose_variant_width(
+    requested: int, original_width: Optional[int], mime_type: Optional[str]
+) -> Optional[int]:
+    """
+    Выбирает ширину варианта для запрошенной ширины.
+
+    Возвращает наименьшую ширину из MEDIA_VARIANT_WIDTHS, не меньшую запрошенной,
+    или None, если нужно отдать оригинал: оригинал не шире варианта, запрошена
+    ширина больше всех вариантов, размеры оригинала неизвестны или это GIF
+    (варианты не сохраняют анимацию).
+
+    Аргументы:
+        requested (int): Запрошенная ширина.
+        original_width (int, optional): Ширина оригинала (Media.width).
+        mime_type (str, optional): MIME-тип оригинала (Media.mime_type).
+    """
+    if original_width is None or mime_type == "image/gif":
+        return None
+    for width in settings.MEDIA_VARIANT_WIDTHS:
+        if width >= requested:
+            return width if width < original_width else None
+    return None
+
+
+class VariantPipeline:
+    """
+    Пул процессов, создающий варианты изображений.
+
+    Уменьшение и сжатие изображения занимают процессор на десятки миллисекунд,
+    поэтому выполняются в отдельных процессах и не блокируют цикл событий
+    и GIL. Число одновременно создаваемых вариантов ограничено: при заполнении
+    пула render сразу выбрасывает VariantQueueFullError, а не ставит задачу
+    в очередь, и вызывающий код отдает оригинал.
+
+    Пул процессов создается при первом использовании.
+    """
+
+    def __init__(self, workers: int, max_pending: int):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.pending = 0
+        self.rendered = 0
+        self.rejected = 0
+        self._executor: Optional[ProcessPoolExecutor] = None
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            # spawn: дочерние процессы не наследуют соединения с базой данных и потоки
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers, mp_context=multiprocessing.get_context("spawn")
+            )
+        return self._executor
+
+    async def render(self, source: Union[str, bytes], width: int) -> RenderedVariant:
+        """
+        Создает вариант изображения в пуле процессов.
+
+        Исключения:
+            VariantQueueFullError: Если одновременно создается max_pending вариантов.
+        """
+        if self.pending >= self.max_pending:
+            self.rejected += 1
+            raise VariantQueueFullError(
+                f"Одновременно создается {self.pending} вариантов изображений"
+            )
+        image_format, _ = VARIANT_FORMATS[settings.MEDIA_VARIANT_FORMAT]
+        self.pending += 1
+        try:
+            loop = asyncio.get_running_loop()
+            rendered = await loop.run_in_executor(
+                self._get_executor(),
+                render_variant,
+                source,
+                width,
+                image_format,
+                settings.MEDIA_VARIANT_QUALITY,
+            )
+        finally:
+            self.pending -= 1
+        self.rendered += 1
+        return rendered
+
+    def stats(self) -> Dict[str, int]:
+        """Возвращает счетчики пула: создается сейчас, создано, отклонено."""
+        return {
+            "pending": self.pending,
+            "rendered": self.rendered,
+            "rejected": self.rejected,
+        }
+
+    def shutdown(self):
+        """Останавливает процессы пула (при завершении приложения)."""
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+
+
+variant_pipeline = VariantPipeline(
+    workers=settings.MEDIA_VARIANT_WORKERS,
+    max_pending=settings.MEDIA_VARIANT_MAX_PENDING,
+)
+
+
+class MediaVariantDAO(BaseDAO):
+    model = MediaVariant
+
+    @classmethod
+    async def find_variant(
+        cls, session: AsyncSession, media_id: int, width: int
+    ) -> Optional[MediaVariant]:
+        """
+        Асинхронно находит вариант медиафайла указанной ширины.
+
+        :param session: Асинхронная сессия SQLAlchemy.
+        :param media_id: Идентификатор оригинала.
+        :param width: Ширина варианта.
+        :return: Вариант или None, если он еще не создан.
+        """
+        # Запрос идет на основной сервер, а не на реплику (REPLICA_READ): add_variant
+        # читает вариант, только что вставленный в своей транзакции, а отставание
+        # реплики в ensure_variant привело бы к повторному созданию варианта в пуле
+        result = await session.execute(
+            select(MediaVariant).where(
+                MediaVariant.media_id == media_id, MediaVariant.width == width
+            )
+        )
+        return result.scalar_one_or_none()
+
+    @classmethod
+    async def add_variant(
+        cls, session: AsyncSession, staged: StagedBlob, storage: MediaStorage, **values
+    ) -> MediaVariant:
+        """
+        Асинхронно сохраняет вариант медиафайла и его блоб в транзакции единицы работы
+        (см. MediaDAO.add_with_blob).
+
+        Если тот же вариант одновременно создал другой запрос, новая строка
+        не добавляется, записанное содержимое удаляется и возвращается уже
+        сохраненный вариант. Вставка выполняется в точке сохранения, а не
+        через ON CONFLICT DO NOTHING: триггер BEFORE INSERT увеличивает счетчик
+        ссылок на блоб и для пропущенной строки, а откат к точке сохранения
+        отменяет и его.
+
+        :param session: Асинхронная сессия SQLAlchemy.
+        :param staged: Записанное во временное место содержимое варианта.
+        :param storage: Хранилище медиафайлов.
+        :param values: Остальные значения полей MediaVariant.
+        :return: Сохраненный вариант.
+        """
+        try:
+            try:
+                async with session.begin_nested():
+                    await session.execute(
+                        insert(MediaVariant).values(blob_key=staged.key, **values)
+                    )
+            except IntegrityError as e:
+                if getattr(e.orig, "sqlstate", None) != UNIQUE_VIOLATION:
+                    raise e
+                await storage.discard_staged(staged)
+            else:
+                await storage.commit_staged(staged)
+        except BaseException as e:
+            await storage.discard_staged(staged)
+            logger.error("Ошибка при сохранении варианта медиафайла: %s", e)
+            raise e
+        return await cls.find_variant(session, values["media_id"], values["width"])
+
+
+async def ensure_variant(
+    session_factory: async_sessionmaker,
+    media_id: int,
+    blob_key: str,
+    width: int,
+    storage: MediaStorage = media_storage,
+) -> MediaVariant:
+    """
+    Возвращает вариант медиафайла указанной ширины, при необходимости создавая его.
+
+    Вариант ищется и сохраняется в отдельных коротких сессиях, а создается
+    между ними, поэтому соединение с базой данных и транзакция не удерживаются,
+    пока изображение обрабатывается в пуле процессов.
+
+    Аргументы:
+        session_factory (async_sessionmaker): Фабрика сессий (см. get_session_factory).
+        media_id (int): Идентификатор оригинала.
+        blob_key (str): Ключ блоба оригинала.
+        width (int): Ширина варианта (см. choose_variant_width).
+        storage (MediaStorage): Хранилище медиафайлов.
+
+    Исключения:
+        VariantQueueFullError: Если варианта нет, а пул создания вариантов занят.
+        FileNotFoundError: Если блоба оригинала нет в хранилище.
+    """
+    async with session_factory() as session:
+        variant = await MediaVariantDAO.find_variant(session, media_id, width)
+    if variant is not None:
+        return variant
+
+    # Процессу пула передается путь к файлу, а не содержимое, если хранилище это позволяет
+    source = storage.local_path(blob_key) or await storage.read(blob_key)
+    rendered = await variant_pipeline.render(source, width)
+    staged = await storage.stage(rendered.data)
+    _, mime_type = VARIANT_FORMATS[settings.MEDIA_VARIANT_FORMAT]
+    logger.info(
+        "Создан вариант %sx%s медиафайла %s (%s байт)",
+        rendered.width,
+        rendered.height,
+        media_id,
+        len(rendered.data),
+    )
+    async with session_factory() as session:
+        async with UnitOfWork(session):
+            return await MediaVariantDAO.add_variant(
+                session,
+                staged,
+                storage,
+                media_id=media_id,
+                width=rendered.width,
+                height=rendered.height,
+                mime_type=mime_type,
+                size=len(rendered.data),
+            )
+
+
+async def create_variants(
+    session_factory: async_sessionmaker,
+    media_id: int,
+    blob_key: str,
+    original_width: Optional[int],
+    mime_type: Optional[str],
+):
+    """
+    Создает все варианты нового медиафайла (фоновая задача после загрузки).
+
+    Задача выполняется после закрытия сессии запроса, поэтому получает
+    идентификатор и параметры оригинала, а не объект ORM, и открывает свои
+    сессии (см. ensure_variant). Если пул занят,
+    оставшиеся варианты не создаются: они будут созданы при первом запросе
+    с параметром w.
+
+    Аргументы:
+        session_factory (async_sessionmaker): Фабрика сессий (см. get_session_factory).
+        media_id (int): Идентификатор оригинала.
+        blob_key (str): Ключ блоба оригинала.
+        original_width (int, optional): Ширина оригинала.
+        mime_type (str, optional): MIME-тип оригинала.
+    """
+    for width in settings.MEDIA_VARIANT_WIDTHS:
+        if choose_variant_width(width, original_width, mime_type) is None:
+            continue
+        try:
+            await ensure_variant(session_factory, media_id, blob_key, width)
+        except VariantQueueFullError:
+            logger.info("Варианты медиафайла %s будут созданы по запросу", media_id)
+            return
+        except Exception as e:
+            logger.error("Ошибка при создании варианта медиафайла %s: %s", media_id, e)
+            return
@@ -0,0 +1,104 @@
+"""
+Микробенчмарк затрат журнала на один запрос к ленте.
+
+Сравнивает прежнюю настройку (logging.basicConfig(level=DEBUG) в модулях,
+вывод в поток прямо в цикле событий, сообщения на каждый вызов DAO уровня INFO,
+часть из них — f-строки) с текущей (application.logging_config: очередь
+и вывод в отдельном потоке, сообщения о запросах уровня DEBUG с отложенным
+форматированием при уровне журнала INFO). Журнал пишется во временный файл.
+
+Очередь сама по себе не удешевляет запись: QueueHandler форматирует сообщение
+в вызывающем потоке, а поток вывода конкурирует за GIL. Она убирает из цикла
+событий ожидание вывода (заполненный pipe stderr, медленный диск), а затраты
+на запрос снижают уровень DEBUG для сообщений о запросах и прореживание.
+
+Запуск (из каталога server):
+    python -m benchmarks.logging_overhead --requests 20000
+"""
+
+import argparse
+import logging
+import statistics
+import tempfile
+import time
+from typing import Callable, List
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from application.logging_config import configure_logging, stop_logging
+
+logger = logging.getLogger("application.benchmark")
+
+session = AsyncSession()
+
+
+def request_before():
+    """Сообщения запроса ленты до изменений: get_current_session, маршрут, DAO."""
+    logger.info("Создание новой сессии Dependencies")
+    logger.info(f"Передача сессии session: {session}")
+    logger.info("Запрос страницы ленты: limit=%s, cursor=%s", 20, None)
+    logger.info("Создание запроса страницы ленты пользователя %s", 1)
+    logger.info("Запрос выполнен")
+    logger.info("Создание запроса для получения страницы по keyset")
+    logger.info("Запрос выполнен")
+    logger.info(f"Закрывается сессия session: {session}")
+    logger.info("Закрытие сессии Dependencies")
+
+
+def request_after():
+    """Те же сообщения после изменений."""
+    logger.debug("Создание новой сессии Dependencies")
+    logger.debug("Передача сессии session: %s", session)
+    logger.debug("Запрос страницы ленты: limit=%s, cursor=%s", 20, None)
+    logger.debug("Создание запроса страницы ленты пользователя %s", 1)
+    logger.debug("Запрос выполнен")
+    logger.debug("Создание запроса для получения страницы по keyset")
+    logger.debug("Запрос выполнен")
+    logger.debug("Закрывается сессия session: %s", session)
+    logger.debug("Закрытие сессии Dependencies")
+
+
+def measure(request: Callable, count: int) -> List[float]:
+    """Возвращает длительности (мкс) журналирования одного запроса в вызывающем потоке."""
+    timings = []
+    for _ in range(count):
+        started = time.perf_counter()
+        request()
+        timings.append((time.perf_counter() - started) * 1_000_000)
+    return timings
+
+
+def report(name: str, timings: List[float]):
+    timings = sorted(timings)
+    p99 = timings[int(len(timings) * 0.99) - 1]
+    print(
+        f"{name:>24}: mean={statistics.mean(timings):.1f}us "
+        f"p50={statistics.median(timings):.1f}us p99={p99:.1f}us"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--requests", type=int, default=20000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryFile("w") as log_file:
+        logging.basicConfig(level=logging.DEBUG, stream=log_file, force=True)
+        report("before", measure(request_before, args.requests))
+
+        # Те же записи INFO, но вывод в потоке QueueListener
+        configure_logging(level="DEBUG", fmt="text", sample_rate=1, stream=log_file)
+        report("queue, INFO records", measure(request_before, args.requests))
+        stop_logging()
+
+        configure_logging(level="DEBUG", fmt="text", sample_rate=0.1, stream=log_file)
+        report("queue, INFO sampled 10%", measure(request_before, args.requests))
+        stop_logging()
+
+        configure_logging(level="INFO", fmt="json", sample_rate=1, stream=log_file)
+        report("after", measure(request_after, args.requests))
+        stop_logging()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+"""
+Микробенчмарк сериализации ответов /api/tweets и /api/users/{id}.
+
+Сравнивает прежний путь (словари из to_json, валидация по response_model
+через FastAPI и JSONResponse) с текущим (сериализация объектов ORM и строк
+Core-запроса сразу в байты через orjson). База данных не нужна: объекты
+создаются в памяти.
+
+Запуск (из каталога server):
+    python -m benchmarks.serialization --tweets 20 --follows 200
+"""
+
+import argparse
+import asyncio
+import logging
+import statistics
+import time
+from datetime import datetime, timezone
+from typing import Dict, List, Union
+
+from fastapi.routing import serialize_response
+from fastapi.utils import create_model_field
+from starlette.responses import JSONResponse
+
+from application.models import Media, Tweets, Users
+from application.schemas import TweetOut, UserOut
+from application.serializers import feed_page_to_bytes, user_profile_rows_to_bytes
+
+# Модели ответа маршрутов до перехода на готовые байты
+FEED_FIELD = create_model_field(
+    name="Response_get_users_tweets",
+    type_=Dict[str, Union[bool, List[TweetOut]]],
+    mode="serialization",
+)
+USER_FIELD = create_model_field(
+    name="Response_get_user_info_by_id",
+    type_=Dict[str, Union[bool, UserOut]],
+    mode="serialization",
+)
+
+
+def make_tweets(count: int, likes: int) -> List[Tweets]:
+    author = Users(id=1, name="Автор бенчмарка")
+    tweets = []
+    for i in range(count):
+        tweet = Tweets(
+            id=i + 1,
+            text=f"Твит номер {i} " * 5,
+            timestamp=datetime.now(timezone.utc),
+            like_count=likes,
+        )
+        tweet.author = author
+        tweet.attachments = [Media(id=i * 2 + 1), Media(id=i * 2 + 2)]
+        tweets.append(tweet)
+    return tweets
+
+
+def make_likers(tweets: List[Tweets], likes: int) -> Dict[int, List[Dict]]:
+    return {
+        tweet.id: [{"user_id": i, "name": f"Пользователь {i}"} for i in range(likes)]
+        for tweet in tweets
+    }
+
+
+def make_profile_rows(follows: int) -> List[tuple]:
+    rows = [("user", 1, "Пользователь")]
+    rows += [("follower", i, f"Подписчик {i}") for i in range(follows)]
+    rows += [("following", i, f"Автор {i}") for i in range(follows)]
+    return rows
+
+
+def make_user(rows: List[tuple]) -> Users:
+    user = Users(id=rows[0][1], name=rows[0][2])
+    user.followers = [Users(id=i, name=n) for kind, i, n in rows if kind == "follower"]
+    user.authors = [Users(id=i, name=n) for kind, i, n in rows if kind == "following"]
+    return user
+
+
+async def measure(func, rounds: int) -> List[float]:
+    timings = []
+    for _ in range(rounds):
+        started = time.perf_counter()
+        await func()
+        timings.append((time.perf_counter() - started) * 1_000_000)
+    return timings
+
+
+def report(name: str, timings: List[float]):
+    timings = sorted(timings)
+    p95 = timings[int(len(timings) * 0.95) - 1]
+    print(
+        f"{name:>14}: mean={statistics.mean(timings):.1f}us "
+        f"p50={statistics.median(timings):.1f}us p95={p95:.1f}us"
+    )
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--tweets", type=int, default=20, help="твитов на странице")
+    parser.add_argument("--likes", type=int, default=3, help="лайков в выборке твита")
+    parser.add_argument("--follows", type=int, default=200, help="подписчиков и подписок")
+    parser.add_argument("--rounds", type=int, default=2000)
+    args = parser.parse_args()
+    logging.disable(logging.INFO)
+
+    tweets = make_tweets(args.tweets, args.likes)
+    likers = make_likers(tweets, args.likes)
+    rows = make_profile_rows(args.follows)
+    user = make_user(rows)
+
+    async def feed_before():
+        content = {
+            "result": True,
+            "tweets": [tweet.to_json(likes=likers.get(tweet.id)) for tweet in tweets],
+        }
+        value = await serialize_response(field=FEED_FIELD, response_content=content)
+        return JSONResponse(content=value).body
+
+    async def feed_after():
+        return feed_page_to_bytes(tweets, likers, None)
+
+    async def user_before():
+        content = {"result": True, "user": user.to_json()}
+        value = await serialize_response(field=USER_FIELD, response_content=content)
+        return JSONResponse(content=value).body
+
+    async def user_after():
+        return user_profile_rows_to_bytes(rows)
+
+    for name, func in (
+        ("tweets before", feed_before),
+        ("tweets after", feed_after),
+        ("user before", user_before),
+        ("user after", user_after),
+    ):
+        await measure(func, args.rounds // 10)  # Прогрев
+        report(name, await measure(func, args.rounds))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
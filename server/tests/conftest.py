@@ -1,16 +1,24 @@
 import logging
+import os
 import random
+import tempfile
 from collections.abc import AsyncGenerator
 
 import pytest
 import pytest_asyncio
 from fastapi import FastAPI
 from httpx import AsyncClient, ASGITransport
+from sqlalchemy import select, update, func
 from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
 
-from application.models import BaseProj, Users
-from application.api.dependencies import get_current_session
+# Блобы медиафайлов тестов пишутся во временный каталог
+os.environ.setdefault("MEDIA_ROOT", tempfile.mkdtemp(prefix="twitter-media-"))
+
+from application.models import BaseProj, Users, Tweets, Like
+from application.api.dependencies import get_current_session, get_session_factory
+from application.cache import api_key_cache, feed_cache
 from application.main import app_proj
+from application.timeline import TimelineDAO
 from tests.factories import (
     UserFactory,
     TweetFactory,
@@ -19,7 +27,6 @@ from tests.factories import (
     FollowerFactory,
 )
 
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
@@ -38,19 +45,21 @@ async def test_db_session() -> AsyncGenerator[AsyncSession, None]:
         await conn.run_sync(BaseProj.metadata.create_all)
         logger.info("Drop old and create new tables")
     async with test_async_session() as session:
-        logger.info(f"Create test session: {session}")
+        logger.info("Create test session: %s", session)
         users = []
         UserFactory._meta.sqlalchemy_session = session
         for i in range(3):
             if i == 0:
                 user = UserFactory(api_key="test")
+            elif i == 1:
+                user = UserFactory(api_key="followed")  # автор, на которого подписан 'test'
             else:
                 user = UserFactory()
             users.append(user)
-        logger.info(f"Create test users {users}")
+        logger.info("Create test users %s", users)
         session.add_all(users)
         await session.commit()
-        logger.info(f"Test users added {users}")
+        logger.info("Test users added %s", users)
 
         tweets = []
         likes = []
@@ -70,14 +79,14 @@ async def test_db_session() -> AsyncGenerator[AsyncSession, None]:
             follower = random.choice(
                 [user for user in users if user != author and user.api_key != "test"]
             )
-            logger.info(f"author id: {author.name, author.id}")
-            logger.info(f"follower id: {follower.name, follower.id}")
+            logger.info("author id: %s", (author.name, author.id))
+            logger.info("follower id: %s", (follower.name, follower.id))
             follower_record = FollowerFactory(
                 account_id=author.id, follower_id=follower.id
             )
             followers.append(follower_record)
         session.add_all(followers)
-        logger.info(f"Followers created {followers}")
+        logger.info("Followers created %s", followers)
 
         # Создание твитов
         TweetFactory._meta.sqlalchemy_session = session
@@ -86,14 +95,21 @@ async def test_db_session() -> AsyncGenerator[AsyncSession, None]:
                 tweet = TweetFactory(author_id=user.id)
                 tweets.append(tweet)
         logger.info(
-            f"Tweets created: {[(tweet.text, tweet.author_id) for tweet in tweets]}"
+            "Tweets created: %s", [(tweet.text, tweet.author_id) for tweet in tweets]
         )
         session.add_all(tweets)
         await session.commit()
         logger.info(
-            f"Followers added {[(i.account_id, i.follower_id) for i in followers]}"
+            "Followers added %s", [(i.account_id, i.follower_id) for i in followers]
         )
-        logger.info(f"Tweets added: {[tweet.id for tweet in tweets]}")
+        logger.info("Tweets added: %s", [tweet.id for tweet in tweets])
+
+        # Заполнение лент подписчиков
+        for tweet in tweets:
+            await TimelineDAO.fan_out(
+                session=session, tweet_id=tweet.id, author_id=tweet.author_id
+            )
+        logger.info("Timelines filled")
 
         # Создание лайков
         LikeFactory._meta.sqlalchemy_session = session
@@ -110,7 +126,7 @@ async def test_db_session() -> AsyncGenerator[AsyncSession, None]:
                     ).id,
                 )
                 likes.append(like)
-        logger.info(f"Likes created: {likes}")
+        logger.info("Likes created: %s", likes)
         session.add_all(likes)
 
         # Создание медиа
@@ -124,17 +140,27 @@ async def test_db_session() -> AsyncGenerator[AsyncSession, None]:
                 media_item = MediaFactory(tweet_id=tweet.id)
                 media.append(media_item)
         logger.info(
-            f"Media created: {[(med.file_name, med.tweet_id) for med in media]}"
+            "Media created: %s", [(med.file_name, med.tweet_id) for med in media]
         )
         session.add_all(media)
 
         await session.commit()
-        logger.info(f"Likes added: {[like.id for like in likes]}")
-        logger.info(f"Media added: {[med.id for med in media]}")
+        logger.info("Likes added: %s", [like.id for like in likes])
+
+        # Пересчет счетчиков лайков, так как фабрики добавляют лайки напрямую
+        await session.execute(
+            update(Tweets).values(
+                like_count=select(func.count())
+                .where(Like.tweet_id == Tweets.id)
+                .scalar_subquery()
+            )
+        )
+        await session.commit()
+        logger.info("Media added: %s", [med.id for med in media])
         logger.info("Likes & media added")
 
         yield session
-        logger.info(f"Preparation for closing the session {session}")
+        logger.info("Preparation for closing the session %s", session)
         await session.close()
         logger.info("Session closed")
     async with test_engine_local.begin() as conn:
@@ -145,6 +171,12 @@ async def test_db_session() -> AsyncGenerator[AsyncSession, None]:
 @pytest.fixture()
 def test_app(test_db_session: AsyncSession) -> FastAPI:
     app_proj.dependency_overrides[get_current_session] = lambda: test_db_session
+    # Фоновые задачи открывают свои сессии к тестовой базе данных
+    app_proj.dependency_overrides[get_session_factory] = lambda: async_sessionmaker(
+        test_db_session.bind, expire_on_commit=False
+    )
+    feed_cache.clear()
+    api_key_cache.clear()
     logger.info("Override dependency")
     return app_proj
 
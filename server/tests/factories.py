@@ -2,6 +2,8 @@ import os
 import factory
 from faker import Faker
 from application.models import Users, Tweets, Like, Media, Followers
+from application.storage import media_storage
+from application.uploads import read_image_metadata
 
 
 fake = Faker("ru_RU")
@@ -56,8 +58,8 @@ class MediaFactory(factory.alchemy.SQLAlchemyModelFactory):
         sqlalchemy_session = None
 
     @factory.lazy_attribute
-    def file_body(self):
-        """Загрузка изображения из файла."""
+    def blob_key(self):
+        """Загрузка изображения из файла в хранилище медиафайлов."""
         image_directory = os.path.abspath(
             os.path.join(os.path.dirname(__file__), "./images")
         )
@@ -69,9 +71,9 @@ class MediaFactory(factory.alchemy.SQLAlchemyModelFactory):
         # Полный путь к изображению
         image_path = os.path.join(image_directory, selected_image)
 
-        # Чтение изображения в бинарном формате
+        # Чтение изображения в бинарном формате и сохранение в хранилище
         with open(image_path, "rb") as f:
-            return f.read()  # Возвращаем бинарные данные изображения
+            return media_storage.write_blob(f.read())  # Возвращаем ключ блоба
 
     @factory.lazy_attribute
     def file_name(self):
@@ -82,6 +84,20 @@ class MediaFactory(factory.alchemy.SQLAlchemyModelFactory):
         selected_image = fake.random_element(os.listdir(image_directory))
         return selected_image  # Возвращаем имя файла
 
+    # Метаданные изображения, как при загрузке через /api/medias
+    mime_type = factory.LazyAttribute(
+        lambda media: read_image_metadata(media_storage.path(media.blob_key)).mime_type
+    )
+    width = factory.LazyAttribute(
+        lambda media: read_image_metadata(media_storage.path(media.blob_key)).width
+    )
+    height = factory.LazyAttribute(
+        lambda media: read_image_metadata(media_storage.path(media.blob_key)).height
+    )
+    size = factory.LazyAttribute(
+        lambda media: os.path.getsize(media_storage.path(media.blob_key))
+    )
+
     tweet_id = factory.SubFactory(TweetFactory)  # Привязываем медиа к твиту
 
 
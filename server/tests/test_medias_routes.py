@@ -1,11 +1,24 @@
+import hashlib
+import io
 import logging
+import os
+import time
+from datetime import datetime, timedelta, timezone
 
 import pytest
 from httpx import AsyncClient, Response
 from fastapi import status
+from PIL import Image
+from sqlalchemy import select, update
+
+from application.config import settings
+from application.media_gc import collect_orphan_media
+from application.models import Media, MediaBlob, MediaVariant
+from application.storage import media_storage
+from application.unit_of_work import UnitOfWork
+from application.variants import MediaVariantDAO, variant_pipeline
 
 
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
@@ -17,6 +30,7 @@ class TestMediaAPI:
         cls.invalid_headers = {"Api-Key": "invalid_key"}
         cls.test_media_id = 1  # Замените на ID существующего медиа для тестирования
         cls.invalid_media_id = 999  # Предполагается, что такого медиа нет
+        cls.images_dir = os.path.join(os.path.dirname(__file__), "images")
 
     @pytest.mark.asyncio
     async def test_get_media(self, client: AsyncClient):
@@ -28,6 +42,85 @@ class TestMediaAPI:
         assert response.status_code == status.HTTP_200_OK
         assert "image/jpeg" in response.headers["content-type"]
 
+    @pytest.mark.asyncio
+    async def test_get_media_not_modified(self, client: AsyncClient):
+        """
+        Проверяет, что медиа отдается с ETag и Cache-Control: immutable,
+        а повторный запрос с If-None-Match получает 304 без тела.
+        """
+        response: Response = await client.get(f"/api/media/{self.test_media_id}")
+        etag = response.headers["etag"]
+        assert "immutable" in response.headers["cache-control"]
+
+        response = await client.get(
+            f"/api/media/{self.test_media_id}", headers={"If-None-Match": etag}
+        )
+
+        assert response.status_code == status.HTTP_304_NOT_MODIFIED
+        assert response.headers["etag"] == etag
+        assert response.content == b""
+
+    @pytest.mark.asyncio
+    async def test_get_media_range_and_head(self, client: AsyncClient):
+        """
+        Проверяет запрос части файла (Range) и HEAD.
+        """
+        full: Response = await client.get(f"/api/media/{self.test_media_id}")
+
+        response: Response = await client.get(
+            f"/api/media/{self.test_media_id}", headers={"Range": "bytes=0-99"}
+        )
+        assert response.status_code == status.HTTP_206_PARTIAL_CONTENT
+        assert response.content == full.content[:100]
+
+        response = await client.head(f"/api/media/{self.test_media_id}")
+        assert response.status_code == status.HTTP_200_OK
+        assert response.headers["etag"] == full.headers["etag"]
+        assert int(response.headers["content-length"]) == len(full.content)
+        assert response.content == b""
+
+    @pytest.mark.asyncio
+    async def test_get_media_through_nginx(
+        self, client: AsyncClient, test_db_session, monkeypatch
+    ):
+        """
+        Проверяет, что при MEDIA_ACCEL_REDIRECT="on" запрос получает X-Accel-Redirect
+        на файл блоба без тела, а при "off" — сам файл.
+        """
+        media = await test_db_session.get(Media, self.test_media_id)
+
+        monkeypatch.setattr(settings, "MEDIA_ACCEL_REDIRECT", "on")
+        response: Response = await client.get(f"/api/media/{self.test_media_id}")
+
+        assert response.status_code == status.HTTP_200_OK
+        assert response.headers["x-accel-redirect"] == (
+            f"{settings.MEDIA_ACCEL_PREFIX}{media.blob_key[:2]}/{media.blob_key[2:4]}/{media.blob_key}"
+        )
+        assert response.headers["content-type"] == "image/jpeg"
+        assert response.headers["etag"] == f'"{media.blob_key}"'
+        assert response.content == b""
+
+        monkeypatch.setattr(settings, "MEDIA_ACCEL_REDIRECT", "off")
+        response = await client.get(f"/api/media/{self.test_media_id}")
+
+        assert "x-accel-redirect" not in response.headers
+        assert len(response.content) == media.size
+
+    @pytest.mark.asyncio
+    async def test_accel_redirect_ignores_request_headers(
+        self, client: AsyncClient, monkeypatch
+    ):
+        """
+        Проверяет, что клиент не может включить X-Accel-Redirect заголовком запроса
+        при MEDIA_ACCEL_REDIRECT="off" и получает файл.
+        """
+        monkeypatch.setattr(settings, "MEDIA_ACCEL_REDIRECT", "off")
+        response: Response = await client.get(
+            f"/api/media/{self.test_media_id}", headers={"X-Accel-Media": "on"}
+        )
+        assert "x-accel-redirect" not in response.headers
+        assert response.content != b""
+
     @pytest.mark.asyncio
     async def test_get_invalid_media(self, client: AsyncClient):
         """
@@ -48,7 +141,8 @@ class TestMediaAPI:
         Проверяет успешное добавление нового медиа файла с корректными данными.
         Ожидается статус код 200 и наличие ключа "media_id" в ответе.
         """
-        media_file = {"file": ("test_image.png", b"fake_image_data", "image/png")}
+        with open(os.path.join(self.images_dir, "320x480.jpg"), "rb") as image:
+            media_file = {"file": ("test_image.jpg", image.read(), "image/jpeg")}
 
         response: Response = await client.post(
             "/api/medias", files=media_file, headers=self.headers
@@ -60,6 +154,335 @@ class TestMediaAPI:
         assert response.json().get("result") is True
         assert "media_id" in response.json()
 
+    @pytest.mark.asyncio
+    async def test_added_media_stored_as_blob(self, client: AsyncClient):
+        """
+        Проверяет, что загруженный файл сохраняется в хранилище под ключом SHA-256 содержимого
+        и отдается без изменений.
+        """
+        with open(os.path.join(self.images_dir, "320x480.jpg"), "rb") as image:
+            image_data = image.read()
+
+        response: Response = await client.post(
+            "/api/medias",
+            files={"file": ("320x480.jpg", image_data, "image/jpeg")},
+            headers=self.headers,
+        )
+        media_id = response.json()["media_id"]
+
+        blob_key = hashlib.sha256(image_data).hexdigest()
+        assert os.path.exists(media_storage.path(blob_key))
+
+        response = await client.get(f"/api/media/{media_id}")
+        assert response.status_code == status.HTTP_200_OK
+        assert response.content == image_data
+
+    @pytest.mark.asyncio
+    async def test_added_media_metadata(self, client: AsyncClient, test_db_session):
+        """
+        Проверяет, что при загрузке в записи Media сохраняются MIME-тип, размеры и размер файла,
+        а тип ответа берется из сохраненных метаданных.
+        """
+        with open(os.path.join(self.images_dir, "1024x768.jpg"), "rb") as image:
+            image_data = image.read()
+
+        response: Response = await client.post(
+            "/api/medias",
+            files={"file": ("1024x768.jpg", image_data, "image/jpeg")},
+            headers=self.headers,
+        )
+        media = await test_db_session.get(Media, response.json()["media_id"])
+
+        assert (media.mime_type, media.width, media.height) == ("image/jpeg", 1024, 768)
+        assert media.size == len(image_data)
+
+        response = await client.get(f"/api/media/{media.id}")
+        assert response.headers["content-type"] == "image/jpeg"
+
+    @pytest.mark.asyncio
+    async def test_get_media_without_metadata(self, client: AsyncClient, test_db_session):
+        """
+        Проверяет, что медиа, созданное до сохранения метаданных, отдается с типом по содержимому.
+        """
+        media = await test_db_session.get(Media, self.test_media_id)
+        media.mime_type = None
+        await test_db_session.commit()
+
+        response: Response = await client.get(f"/api/media/{self.test_media_id}")
+
+        assert response.status_code == status.HTTP_200_OK
+        assert response.headers["content-type"] == "image/jpeg"
+
+    @pytest.mark.asyncio
+    async def test_add_truncated_image_media(self, client: AsyncClient):
+        """
+        Проверяет, что файл с сигнатурой изображения, но без корректного заголовка, отклоняется со статусом 415.
+        """
+        media_file = {"file": ("broken.png", b"\x89PNG\r\n\x1a\n" + os.urandom(64), "image/png")}
+
+        response: Response = await client.post(
+            "/api/medias", files=media_file, headers=self.headers
+        )
+
+        assert response.status_code == status.HTTP_415_UNSUPPORTED_MEDIA_TYPE
+
+    async def _upload(self, client: AsyncClient, image_name: str) -> int:
+        with open(os.path.join(self.images_dir, image_name), "rb") as image:
+            media_file = {"file": (image_name, image.read(), "image/jpeg")}
+        response: Response = await client.post(
+            "/api/medias", files=media_file, headers=self.headers
+        )
+        return response.json()["media_id"]
+
+    @pytest.mark.asyncio
+    async def test_variants_created_after_upload(self, client: AsyncClient, test_db_session):
+        """
+        Проверяет, что после загрузки создаются варианты всех ширин, меньших ширины оригинала,
+        и запрос с параметром w отдает ближайший не меньший вариант.
+        """
+        media_id = await self._upload(client, "1024x768.jpg")
+
+        variants = (
+            await test_db_session.scalars(
+                select(MediaVariant).where(MediaVariant.media_id == media_id)
+            )
+        ).all()
+        assert sorted((v.width, v.height) for v in variants) == [(320, 240), (480, 360)]
+
+        original: Response = await client.get(f"/api/media/{media_id}")
+        response: Response = await client.get(f"/api/media/{media_id}", params={"w": 400})
+
+        assert response.status_code == status.HTTP_200_OK
+        assert response.headers["content-type"] == "image/webp"
+        assert "immutable" in response.headers["cache-control"]
+        assert response.headers["etag"] != original.headers["etag"]
+        assert Image.open(io.BytesIO(response.content)).size == (480, 360)
+
+    @pytest.mark.asyncio
+    async def test_variant_not_wider_than_original(self, client: AsyncClient):
+        """
+        Проверяет, что для ширины не меньше ширины оригинала отдается оригинал.
+        """
+        media_id = await self._upload(client, "igrunka_obeziana_dikaia_priroda_1348755_300x255.jpg")
+
+        original: Response = await client.get(f"/api/media/{media_id}")
+        response: Response = await client.get(f"/api/media/{media_id}", params={"w": 320})
+
+        assert response.status_code == status.HTTP_200_OK
+        assert response.content == original.content
+
+    @pytest.mark.asyncio
+    async def test_variant_when_pipeline_busy(self, client: AsyncClient, monkeypatch):
+        """
+        Проверяет, что при занятом пуле создания вариантов отдается оригинал с коротким кэшированием,
+        а вариант создается, когда пул освобождается.
+        """
+        monkeypatch.setattr(variant_pipeline, "max_pending", 0)
+        media_id = await self._upload(client, "1024x768.jpg")
+
+        response: Response = await client.get(f"/api/media/{media_id}", params={"w": 320})
+
+        assert response.status_code == status.HTTP_200_OK
+        assert response.headers["content-type"] == "image/jpeg"
+        assert "immutable" not in response.headers["cache-control"]
+
+        monkeypatch.setattr(variant_pipeline, "max_pending", 1)
+        response = await client.get(f"/api/media/{media_id}", params={"w": 320})
+
+        assert response.headers["content-type"] == "image/webp"
+        assert Image.open(io.BytesIO(response.content)).size == (320, 240)
+
+    @pytest.mark.asyncio
+    async def test_duplicate_variant_counts_blob_once(self, test_db_session):
+        """
+        Проверяет, что повторное сохранение того же варианта не добавляет строку
+        и не увеличивает счетчик ссылок на его блоб.
+        """
+        data = self._unique_png()
+        blob_key = hashlib.sha256(data).hexdigest()
+        values = {
+            "media_id": self.test_media_id,
+            "width": 8,
+            "height": 8,
+            "mime_type": "image/png",
+            "size": len(data),
+        }
+        for _ in range(2):
+            staged = await media_storage.stage(data)
+            async with UnitOfWork(test_db_session):
+                variant = await MediaVariantDAO.add_variant(
+                    test_db_session, staged, media_storage, **values
+                )
+            assert variant.blob_key == blob_key
+            assert not os.path.exists(staged.path)
+
+        variants = (
+            await test_db_session.scalars(
+                select(MediaVariant).where(
+                    MediaVariant.media_id == self.test_media_id, MediaVariant.width == 8
+                )
+            )
+        ).all()
+        blob = await test_db_session.get(MediaBlob, blob_key, populate_existing=True)
+        assert len(variants) == 1
+        assert blob.ref_count == 1
+        assert os.path.exists(media_storage.path(blob_key))
+
+    @staticmethod
+    def _unique_png() -> bytes:
+        output = io.BytesIO()
+        Image.frombytes("RGB", (8, 8), os.urandom(8 * 8 * 3)).save(output, format="PNG")
+        return output.getvalue()
+
+    async def _upload_bytes(self, client: AsyncClient, data: bytes) -> int:
+        response: Response = await client.post(
+            "/api/medias",
+            files={"file": ("image.png", data, "image/png")},
+            headers=self.headers,
+        )
+        return response.json()["media_id"]
+
+    @pytest.mark.asyncio
+    async def test_duplicate_uploads_share_blob(self, client: AsyncClient, test_db_session):
+        """
+        Проверяет, что повторная загрузка того же содержимого создает новую запись,
+        но не новый блоб: обе записи ссылаются на один блоб со счетчиком ссылок 2.
+        """
+        data = self._unique_png()
+        first_id = await self._upload_bytes(client, data)
+        second_id = await self._upload_bytes(client, data)
+
+        first = await test_db_session.get(Media, first_id)
+        second = await test_db_session.get(Media, second_id)
+        blob = await test_db_session.get(MediaBlob, first.blob_key)
+
+        assert first_id != second_id
+        assert first.blob_key == second.blob_key == hashlib.sha256(data).hexdigest()
+        assert blob.ref_count == 2
+        assert not [name for name in os.listdir(settings.MEDIA_ROOT) if name.startswith(".upload-")]
+
+    @pytest.mark.asyncio
+    async def test_blob_freed_with_last_reference(self, client: AsyncClient, test_db_session):
+        """
+        Проверяет, что при удалении твита блоб его вложения удаляется,
+        только когда на него не осталось других ссылок.
+        """
+        data = self._unique_png()
+        blob_key = hashlib.sha256(data).hexdigest()
+        tweet_ids = []
+        for _ in range(2):
+            media_id = await self._upload_bytes(client, data)
+            response: Response = await client.post(
+                "/api/tweets",
+                json={"tweet_data": "Твит с картинкой", "tweet_media_ids": [media_id]},
+                headers=self.headers,
+            )
+            tweet_ids.append(response.json()["tweet_id"])
+
+        await client.delete(f"/api/tweets/{tweet_ids[0]}", headers=self.headers)
+
+        blob = await test_db_session.get(MediaBlob, blob_key, populate_existing=True)
+        assert blob.ref_count == 1
+        assert os.path.exists(media_storage.path(blob_key))
+
+        await client.delete(f"/api/tweets/{tweet_ids[1]}", headers=self.headers)
+
+        test_db_session.expunge_all()
+        assert await test_db_session.get(MediaBlob, blob_key) is None
+        assert not os.path.exists(media_storage.path(blob_key))
+
+    @pytest.mark.asyncio
+    async def test_orphan_media_collected(self, client: AsyncClient, test_db_session):
+        """
+        Проверяет, что сборщик мусора удаляет только давно загруженные неприкрепленные медиафайлы,
+        освобождает их блобы и удаляет брошенные временные файлы загрузок.
+        """
+        data = self._unique_png()
+        orphan_id = await self._upload_bytes(client, data)
+        fresh_id = await self._upload_bytes(client, self._unique_png())
+        await test_db_session.execute(
+            update(Media)
+            .where(Media.id == orphan_id)
+            .values(created_at=datetime.now(timezone.utc) - timedelta(days=2))
+        )
+        await test_db_session.commit()
+
+        stale_upload = os.path.join(settings.MEDIA_ROOT, ".upload-stale")
+        with open(stale_upload, "wb") as upload:
+            upload.write(b"x" * 10)
+        two_days_ago = time.time() - 2 * 24 * 3600
+        os.utime(stale_upload, (two_days_ago, two_days_ago))
+
+        report = await collect_orphan_media(
+            test_db_session, media_storage, max_age=24 * 3600, batch_size=1
+        )
+
+        assert report.media_deleted == 1
+        assert report.media_bytes == len(data)
+        assert report.blobs_released == 1
+        assert (report.staged_removed, report.staged_bytes) == (1, 10)
+        test_db_session.expunge_all()
+        assert await test_db_session.get(Media, orphan_id) is None
+        assert await test_db_session.get(Media, fresh_id) is not None
+        assert await test_db_session.get(Media, self.test_media_id) is not None
+        assert not os.path.exists(media_storage.path(hashlib.sha256(data).hexdigest()))
+        assert not os.path.exists(stale_upload)
+
+    @pytest.mark.asyncio
+    async def test_add_non_image_media(self, client: AsyncClient):
+        """
+        Проверяет, что файл, не являющийся изображением, отклоняется по первым байтам со статусом 415.
+        """
+        media_file = {"file": ("test_image.png", b"fake_image_data", "image/png")}
+
+        response: Response = await client.post(
+            "/api/medias", files=media_file, headers=self.headers
+        )
+
+        logger.info(response.json())
+        assert response.status_code == status.HTTP_415_UNSUPPORTED_MEDIA_TYPE
+        assert response.json().get("result") is False
+
+    @pytest.mark.asyncio
+    async def test_add_too_large_media(self, client: AsyncClient, monkeypatch):
+        """
+        Проверяет, что файл больше MEDIA_MAX_UPLOAD_SIZE отклоняется со статусом 413
+        и не остается в хранилище.
+        """
+        with open(os.path.join(self.images_dir, "1024x768.jpg"), "rb") as image:
+            image_data = image.read() + os.urandom(16)  # Содержимое, которого нет в хранилище
+        # Content-Length проходит проверку middleware, размер ограничивается при переносе в хранилище
+        monkeypatch.setattr(settings, "MEDIA_MAX_UPLOAD_SIZE", len(image_data) - 1)
+
+        response: Response = await client.post(
+            "/api/medias",
+            files={"file": ("1024x768.jpg", image_data, "image/jpeg")},
+            headers=self.headers,
+        )
+
+        logger.info(response.json())
+        assert response.status_code == status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+        blob_key = hashlib.sha256(image_data).hexdigest()
+        assert not os.path.exists(media_storage.path(blob_key))
+
+    @pytest.mark.asyncio
+    async def test_add_media_rejected_by_content_length(
+        self, client: AsyncClient, monkeypatch
+    ):
+        """
+        Проверяет, что загрузка с Content-Length намного больше лимита отклоняется до разбора тела запроса.
+        """
+        monkeypatch.setattr(settings, "MEDIA_MAX_UPLOAD_SIZE", 1024)
+        media_file = {"file": ("big.jpg", b"\xff\xd8\xff" + b"0" * 64 * 1024, "image/jpeg")}
+
+        response: Response = await client.post(
+            "/api/medias", files=media_file, headers=self.headers
+        )
+
+        logger.info(response.json())
+        assert response.status_code == status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+        assert response.json().get("error_type") == "HTTP 413"
+
     @pytest.mark.asyncio
     async def test_add_media_with_invalid_api_key(self, client: AsyncClient):
         """
@@ -1,11 +1,16 @@
 import logging
+import os
+from datetime import datetime
 
 import pytest
 from httpx import AsyncClient, Response
 from fastapi import status
 
+from application.cache import feed_cache
+from application.config import settings
+from application.metrics import _labels
+
 
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
@@ -15,22 +20,356 @@ class TestTweetAPI:
     def setup_class(cls):
         cls.headers = {"Api-Key": "test"}
         cls.invalid_headers = {"Api-Key": "invalid_key"}
+        cls.followed_user_headers = {"Api-Key": "followed"}
         cls.test_tweet_id = 1
         cls.delete_like_tweet_id = 3
         cls.invalid_tweet_id = 999
+        cls.current_user_id = 1  # Пользователь с api_key='test'
+        cls.followed_user_id = 2  # Автор, на которого подписан пользователь 'test'
+        cls.not_followed_user_id = 3  # Автор, на которого 'test' не подписан
+        cls.image_path = os.path.join(os.path.dirname(__file__), "images", "320x480.jpg")
 
     @pytest.mark.asyncio
     async def test_get_all_tweets(self, client: AsyncClient):
         """
-        Проверяет успешное получение всех твитов. Ожидается статус код 200 и наличие ключа "tweets" в ответе
+        Проверяет успешное получение ленты твитов. Ожидается статус код 200 и наличие ключа "tweets" в ответе
         """
-        response: Response = await client.get("/api/tweets")
+        response: Response = await client.get("/api/tweets", headers=self.headers)
 
         logger.info(response.json())
         assert response.status_code == status.HTTP_200_OK
         assert isinstance(response.json(), dict)
         assert "tweets" in response.json()
 
+    @pytest.mark.asyncio
+    async def test_get_tweets_next_page(self, client: AsyncClient):
+        """
+        Проверяет постраничное получение ленты по курсору. Страницы не пересекаются,
+        твиты упорядочены от новых к старым.
+        """
+        response: Response = await client.get(
+            "/api/tweets", params={"limit": 2}, headers=self.headers
+        )
+
+        logger.info(response.json())
+        assert response.status_code == status.HTTP_200_OK
+        first_page = response.json()
+        assert len(first_page["tweets"]) == 2
+        assert first_page["next_cursor"]
+
+        response = await client.get(
+            "/api/tweets",
+            params={"limit": 2, "cursor": first_page["next_cursor"]},
+            headers=self.headers,
+        )
+
+        logger.info(response.json())
+        assert response.status_code == status.HTTP_200_OK
+        second_page = response.json()
+        first_ids = [tweet["id"] for tweet in first_page["tweets"]]
+        second_ids = [tweet["id"] for tweet in second_page["tweets"]]
+        assert len(second_ids) == 2
+        assert not set(first_ids) & set(second_ids)
+        assert first_ids + second_ids == sorted(first_ids + second_ids, reverse=True)
+
+    @pytest.mark.asyncio
+    async def test_get_tweets_with_invalid_cursor(self, client: AsyncClient):
+        """
+        Проверяет запрос ленты с поврежденным курсором. Ожидается статус код 400.
+        """
+        response: Response = await client.get(
+            "/api/tweets", params={"cursor": "not-a-cursor"}, headers=self.headers
+        )
+
+        logger.info(response.json())
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+    @pytest.mark.asyncio
+    async def test_feed_contains_only_followed_authors(self, client: AsyncClient):
+        """
+        Проверяет, что лента содержит только твиты пользователя и авторов, на которых он подписан.
+        """
+        response: Response = await client.get("/api/tweets", headers=self.headers)
+
+        logger.info(response.json())
+        assert response.status_code == status.HTTP_200_OK
+        author_ids = {tweet["author"]["id"] for tweet in response.json()["tweets"]}
+        assert author_ids == {self.current_user_id, self.followed_user_id}
+
+    @pytest.mark.asyncio
+    async def test_new_tweet_appears_in_followers_feed(self, client: AsyncClient):
+        """
+        Проверяет, что новый твит автора сразу появляется в начале ленты его подписчика.
+        """
+        response: Response = await client.post(
+            "/api/tweets",
+            json={"tweet_data": "Fan-out tweet", "tweet_media_ids": []},
+            headers=self.followed_user_headers,
+        )
+        assert response.status_code == status.HTTP_201_CREATED
+        tweet_id = response.json()["tweet_id"]
+
+        response = await client.get("/api/tweets", headers=self.headers)
+
+        logger.info(response.json())
+        assert response.json()["tweets"][0]["id"] == tweet_id
+
+    @pytest.mark.asyncio
+    async def test_unfollow_removes_author_from_feed(self, client: AsyncClient):
+        """
+        Проверяет, что после отписки твиты автора пропадают из ленты.
+        """
+        response: Response = await client.delete(
+            f"/api/users/{self.followed_user_id}/follow", headers=self.headers
+        )
+        assert response.status_code == status.HTTP_200_OK
+
+        response = await client.get("/api/tweets", headers=self.headers)
+
+        logger.info(response.json())
+        author_ids = {tweet["author"]["id"] for tweet in response.json()["tweets"]}
+        assert author_ids == {self.current_user_id}
+
+    @pytest.mark.asyncio
+    async def test_follow_adds_author_tweets_to_feed(self, client: AsyncClient):
+        """
+        Проверяет, что после подписки в ленте появляются уже опубликованные твиты автора.
+        """
+        response: Response = await client.post(
+            f"/api/users/{self.not_followed_user_id}/follow", headers=self.headers
+        )
+        assert response.status_code == status.HTTP_200_OK
+
+        response = await client.get("/api/tweets", headers=self.headers)
+
+        logger.info(response.json())
+        author_ids = {tweet["author"]["id"] for tweet in response.json()["tweets"]}
+        assert self.not_followed_user_id in author_ids
+
+    @pytest.mark.asyncio
+    async def test_popular_author_tweets_merged_on_read(
+        self, client: AsyncClient, monkeypatch
+    ):
+        """
+        Проверяет гибридную ленту: твит автора с числом подписчиков выше порога не рассылается,
+        но подмешивается в ленту при чтении, а постраничное чтение проходит без пропусков и повторов.
+        """
+        monkeypatch.setattr(settings, "FANOUT_FOLLOWER_THRESHOLD", 0)
+
+        response: Response = await client.post(
+            "/api/tweets",
+            json={"tweet_data": "Pulled tweet", "tweet_media_ids": []},
+            headers=self.followed_user_headers,
+        )
+        assert response.status_code == status.HTTP_201_CREATED
+        tweet_id = response.json()["tweet_id"]
+
+        response = await client.get("/api/tweets", headers=self.headers)
+        logger.info(response.json())
+        full_feed = [tweet["id"] for tweet in response.json()["tweets"]]
+        assert full_feed[0] == tweet_id
+
+        paged_feed, cursor = [], None
+        while True:
+            params = {"limit": 1, "cursor": cursor} if cursor else {"limit": 1}
+            response = await client.get("/api/tweets", params=params, headers=self.headers)
+            paged_feed += [tweet["id"] for tweet in response.json()["tweets"]]
+            cursor = response.json()["next_cursor"]
+            if cursor is None:
+                break
+        assert paged_feed == full_feed
+
+    @pytest.mark.asyncio
+    async def test_sql_feed_engine_matches_orm(self, client: AsyncClient, monkeypatch):
+        """
+        Проверяет, что лента, собранная одним SQL-запросом, совпадает с лентой, собранной через ORM,
+        включая подмешанные при чтении твиты, выборку лайков и курсоры.
+        """
+        monkeypatch.setattr(settings, "FANOUT_FOLLOWER_THRESHOLD", 0)
+        await client.post(
+            "/api/tweets",
+            json={"tweet_data": "Pulled tweet", "tweet_media_ids": []},
+            headers=self.followed_user_headers,
+        )
+        await client.post(
+            f"/api/tweets/{self.test_tweet_id}/likes", headers=self.followed_user_headers
+        )
+
+        pages = {}
+        for engine in ("orm", "sql"):
+            monkeypatch.setattr(settings, "FEED_ENGINE", engine)
+            feed_cache.clear()
+            pages[engine], cursor = [], None
+            while True:
+                params = {"limit": 2, "cursor": cursor} if cursor else {"limit": 2}
+                response = await client.get("/api/tweets", params=params, headers=self.headers)
+                assert response.status_code == status.HTTP_200_OK
+                pages[engine].append(self._normalize_feed(response.json()))
+                cursor = response.json()["next_cursor"]
+                if cursor is None:
+                    break
+
+        logger.info(pages["sql"])
+        assert pages["sql"] == pages["orm"]
+
+    @pytest.mark.asyncio
+    async def test_attachments_point_to_variant(self, client: AsyncClient, monkeypatch):
+        """
+        Проверяет, что при заданной MEDIA_ATTACHMENT_WIDTH вложения ленты ссылаются на вариант изображения.
+        """
+        monkeypatch.setattr(settings, "MEDIA_ATTACHMENT_WIDTH", 480)
+        for engine in ("orm", "sql"):
+            monkeypatch.setattr(settings, "FEED_ENGINE", engine)
+            feed_cache.clear()
+            response: Response = await client.get("/api/tweets", headers=self.headers)
+
+            attachments = [
+                url for tweet in response.json()["tweets"] for url in tweet["attachments"]
+            ]
+            assert attachments
+            assert all(
+                url.startswith("/api/media/") and url.endswith("?w=480") for url in attachments
+            )
+
+    @staticmethod
+    def _normalize_feed(page: dict) -> dict:
+        # Postgres и Python по-разному форматируют дробную часть секунд
+        for tweet in page["tweets"]:
+            tweet["timestamp"] = datetime.fromisoformat(tweet["timestamp"])
+        return page
+
+    @pytest.mark.asyncio
+    async def test_feed_page_served_from_cache(self, client: AsyncClient):
+        """
+        Проверяет, что повторный запрос той же страницы ленты отдается из кэша без изменений.
+        """
+        first: Response = await client.get("/api/tweets", headers=self.headers)
+        second: Response = await client.get("/api/tweets", headers=self.headers)
+
+        assert first.headers["x-cache"] == "MISS"
+        assert second.headers["x-cache"] == "HIT"
+        assert second.json() == first.json()
+
+    @pytest.mark.asyncio
+    async def test_metrics_count_requests_by_route(self, client: AsyncClient):
+        """
+        Проверяет, что /metrics отдает счетчики запросов по шаблону маршрута,
+        запросы к базе данных в пересчете на маршрут и счетчики кэшей и пула.
+        """
+        route = 'method="GET",route="/api/tweets/{tweet_id}/likes"'
+        await client.get(f"/api/tweets/{self.test_tweet_id}/likes", headers=self.headers)
+        await client.get(f"/api/tweets/{self.invalid_tweet_id}/likes", headers=self.headers)
+
+        response: Response = await client.get("/metrics")
+
+        assert response.status_code == status.HTTP_200_OK
+        assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+        samples = dict(
+            line.rsplit(" ", 1)
+            for line in response.text.splitlines()
+            if not line.startswith("#")
+        )
+        assert float(samples[f"http_requests_total{{{route},status=\"200\"}}"]) >= 1
+        assert float(samples[f"http_requests_total{{{route},status=\"404\"}}"]) >= 1
+        assert float(samples[f"http_request_duration_seconds_count{{{route}}}"]) >= 2
+        assert float(samples[f"http_request_db_queries_total{{{route}}}"]) >= 2
+        for name in (
+            "feed_cache_hits_total",
+            "api_key_cache_hits_total",
+            "db_pool_checkouts_total",
+            "media_variants_pending",
+        ):
+            assert name in samples
+
+    @pytest.mark.asyncio
+    async def test_metrics_only_for_allowed_networks(
+        self, client: AsyncClient, monkeypatch
+    ):
+        """
+        Проверяет, что /metrics не отдается клиентам вне METRICS_ALLOWED_NETWORKS.
+        """
+        monkeypatch.setattr(settings, "METRICS_ALLOWED_NETWORKS", ("10.0.0.0/8",))
+        response: Response = await client.get("/metrics")
+        assert response.status_code == status.HTTP_404_NOT_FOUND
+
+        monkeypatch.setattr(settings, "METRICS_ALLOWED_NETWORKS", ())
+        response = await client.get("/metrics")
+        assert response.status_code == status.HTTP_404_NOT_FOUND
+
+    def test_metrics_label_values_escaped(self):
+        """
+        Проверяет экранирование \\, " и перевода строки в значениях меток.
+        """
+        assert _labels(route='a\\b"c\nd') == '{route="a\\\\b\\"c\\nd"}'
+
+    @pytest.mark.asyncio
+    async def test_like_invalidates_cached_feed(self, client: AsyncClient):
+        """
+        Проверяет, что лайк сбрасывает закэшированные страницы с этим твитом.
+
+        Лайк ставится на новый твит, поэтому он точно добавляется, а не повторяется.
+        """
+        response: Response = await client.post(
+            "/api/tweets",
+            json={"tweet_data": "Твит для лайка", "tweet_media_ids": []},
+            headers=self.headers,
+        )
+        tweet_id = response.json()["tweet_id"]
+        response = await client.get("/api/tweets", headers=self.headers)
+        assert response.json()["tweets"][0]["id"] == tweet_id
+
+        response = await client.post(
+            f"/api/tweets/{tweet_id}/likes", headers=self.followed_user_headers
+        )
+        assert response.status_code == status.HTTP_200_OK
+
+        response = await client.get("/api/tweets", headers=self.headers)
+
+        logger.info(response.json())
+        assert response.headers["x-cache"] == "MISS"
+        liked_tweet = response.json()["tweets"][0]
+        assert self.followed_user_id in [like["user_id"] for like in liked_tweet["likes"]]
+
+    @pytest.mark.asyncio
+    async def test_rejected_tweet_keeps_cached_feed(self, client: AsyncClient):
+        """
+        Проверяет, что отклоненный твит не попадает в ленту, а кэш ленты не сбрасывается:
+        транзакция откатывается, и действия после фиксации не выполняются.
+        """
+        await client.get("/api/tweets", headers=self.followed_user_headers)
+
+        response: Response = await client.post(
+            "/api/tweets",
+            json={"tweet_data": "Rejected tweet", "tweet_media_ids": [self.invalid_tweet_id]},
+            headers=self.followed_user_headers,
+        )
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+        response = await client.get("/api/tweets", headers=self.followed_user_headers)
+        assert response.headers["x-cache"] == "HIT"
+        feed_cache.clear()
+        response = await client.get("/api/tweets", headers=self.followed_user_headers)
+        assert "Rejected tweet" not in [tweet["content"] for tweet in response.json()["tweets"]]
+
+    @pytest.mark.asyncio
+    async def test_new_tweet_invalidates_cached_feed(self, client: AsyncClient):
+        """
+        Проверяет, что новый твит автора сбрасывает закэшированную первую страницу ленты подписчика.
+        """
+        await client.get("/api/tweets", headers=self.headers)
+
+        response: Response = await client.post(
+            "/api/tweets",
+            json={"tweet_data": "Fresh tweet", "tweet_media_ids": []},
+            headers=self.followed_user_headers,
+        )
+        tweet_id = response.json()["tweet_id"]
+
+        response = await client.get("/api/tweets", headers=self.headers)
+
+        assert response.headers["x-cache"] == "MISS"
+        assert response.json()["tweets"][0]["id"] == tweet_id
+
     @pytest.mark.asyncio
     async def test_add_tweet(self, client: AsyncClient):
         """
@@ -51,6 +390,69 @@ class TestTweetAPI:
         assert response.json().get("result") is True
         assert "tweet_id" in response.json()
 
+    async def _upload_media(self, client: AsyncClient, headers: dict) -> int:
+        with open(self.image_path, "rb") as image:
+            media_file = {"file": ("image.jpg", image.read(), "image/jpeg")}
+        response: Response = await client.post("/api/medias", files=media_file, headers=headers)
+        return response.json()["media_id"]
+
+    async def _own_tweets_count(self, client: AsyncClient) -> int:
+        response: Response = await client.get(
+            "/api/tweets", params={"limit": 100}, headers=self.headers
+        )
+        return sum(
+            tweet["author"]["id"] == self.current_user_id for tweet in response.json()["tweets"]
+        )
+
+    @pytest.mark.asyncio
+    async def test_add_tweet_with_media(self, client: AsyncClient):
+        """
+        Проверяет, что все свои загруженные медиафайлы прикрепляются к новому твиту.
+        """
+        media_ids = [await self._upload_media(client, self.headers) for _ in range(2)]
+
+        response: Response = await client.post(
+            "/api/tweets",
+            json={"tweet_data": "Твит с вложениями", "tweet_media_ids": media_ids},
+            headers=self.headers,
+        )
+        assert response.status_code == status.HTTP_201_CREATED
+        tweet_id = response.json()["tweet_id"]
+
+        response = await client.get("/api/tweets", headers=self.headers)
+        tweet = next(t for t in response.json()["tweets"] if t["id"] == tweet_id)
+        assert tweet["attachments"] == [f"/api/media/{media_id}" for media_id in media_ids]
+
+    @pytest.mark.asyncio
+    async def test_add_tweet_with_unavailable_media(self, client: AsyncClient):
+        """
+        Проверяет, что чужой или уже прикрепленный медиафайл не прикрепляется, а твит не создается
+        и свои медиафайлы из того же запроса остаются неприкрепленными.
+        """
+        own_media_id = await self._upload_media(client, self.headers)
+        foreign_media_id = await self._upload_media(client, self.followed_user_headers)
+        attached_media_id = 1  # Прикреплен к твиту 1 в conftest
+        tweets_before = await self._own_tweets_count(client)
+
+        for media_id in (foreign_media_id, attached_media_id, self.invalid_tweet_id):
+            response: Response = await client.post(
+                "/api/tweets",
+                json={"tweet_data": "Чужое вложение", "tweet_media_ids": [own_media_id, media_id]},
+                headers=self.headers,
+            )
+
+            assert response.status_code == status.HTTP_400_BAD_REQUEST
+            assert str(media_id) in response.json()["error_message"]
+
+        assert await self._own_tweets_count(client) == tweets_before
+
+        response = await client.post(
+            "/api/tweets",
+            json={"tweet_data": "Свое вложение", "tweet_media_ids": [own_media_id]},
+            headers=self.headers,
+        )
+        assert response.status_code == status.HTTP_201_CREATED
+
     @pytest.mark.asyncio
     async def test_add_tweet_with_invalid_api_key(self, client: AsyncClient):
         """
@@ -83,6 +485,94 @@ class TestTweetAPI:
         assert response.status_code == status.HTTP_200_OK
         assert response.json().get("result") is True
 
+    @pytest.mark.asyncio
+    async def test_like_count_in_feed(self, client: AsyncClient):
+        """
+        Проверяет, что лайк увеличивает счетчик like_count, а сам лайк попадает в выборку лайков твита.
+        """
+        response: Response = await client.get("/api/tweets", headers=self.headers)
+        tweet = response.json()["tweets"][0]
+
+        await client.post(f"/api/tweets/{tweet['id']}/likes", headers=self.headers)
+        response = await client.get("/api/tweets", headers=self.headers)
+
+        logger.info(response.json())
+        liked_tweet = response.json()["tweets"][0]
+        assert liked_tweet["like_count"] == tweet["like_count"] + 1
+        assert self.current_user_id in [like["user_id"] for like in liked_tweet["likes"]]
+
+    @pytest.mark.asyncio
+    async def test_get_tweet_likes_pages(self, client: AsyncClient):
+        """
+        Проверяет постраничное получение всех лайков твита.
+        """
+        for headers in (self.headers, self.followed_user_headers):
+            await client.post(f"/api/tweets/{self.test_tweet_id}/likes", headers=headers)
+
+        response: Response = await client.get(
+            f"/api/tweets/{self.test_tweet_id}/likes",
+            params={"limit": 1},
+            headers=self.headers,
+        )
+
+        logger.info(response.json())
+        assert response.status_code == status.HTTP_200_OK
+        first_page = response.json()
+        assert first_page["like_count"] >= 2
+        assert len(first_page["likes"]) == 1
+
+        response = await client.get(
+            f"/api/tweets/{self.test_tweet_id}/likes",
+            params={"limit": 100, "cursor": first_page["next_cursor"]},
+            headers=self.headers,
+        )
+        rest = response.json()["likes"]
+        assert len(first_page["likes"]) + len(rest) == first_page["like_count"]
+
+    @pytest.mark.asyncio
+    async def test_get_likes_of_invalid_tweet(self, client: AsyncClient):
+        """
+        Проверяет получение лайков несуществующего твита. Ожидается статус код 404.
+        """
+        response: Response = await client.get(
+            f"/api/tweets/{self.invalid_tweet_id}/likes", headers=self.headers
+        )
+
+        assert response.status_code == status.HTTP_404_NOT_FOUND
+
+    @pytest.mark.asyncio
+    async def test_repeated_like_and_unlike(self, client: AsyncClient):
+        """
+        Проверяет, что повторный лайк не увеличивает счетчик, а повторное удаление лайка возвращает 404.
+        """
+        response: Response = await client.post(
+            "/api/tweets",
+            json={"tweet_data": "Liked twice", "tweet_media_ids": []},
+            headers=self.headers,
+        )
+        tweet_id = response.json()["tweet_id"]
+        likes_url = f"/api/tweets/{tweet_id}/likes"
+
+        for _ in range(2):
+            response = await client.post(likes_url, headers=self.followed_user_headers)
+            assert response.status_code == status.HTTP_200_OK
+            assert response.json().get("result") is True
+
+        response = await client.get(likes_url, headers=self.headers)
+        assert response.json()["like_count"] == 1
+        assert [like["user_id"] for like in response.json()["likes"]] == [
+            self.followed_user_id
+        ]
+
+        response = await client.delete(likes_url, headers=self.followed_user_headers)
+        assert response.status_code == status.HTTP_200_OK
+        response = await client.delete(likes_url, headers=self.followed_user_headers)
+        assert response.status_code == status.HTTP_404_NOT_FOUND
+
+        response = await client.get(likes_url, headers=self.headers)
+        assert response.json()["like_count"] == 0
+        assert response.json()["likes"] == []
+
     @pytest.mark.asyncio
     async def test_add_like_to_invalid_tweet(self, client: AsyncClient):
         """